@@ -9,8 +9,30 @@ https://docs.djangoproject.com/en/4.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+from common_app.handlers import get_asgi_application
 
-os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'afex_app.settings')
+from .settings.base import DEBUG
 
-application = get_asgi_application()
+
+if DEBUG:
+    env_settings = "afex_app.settings.development"
+else:
+    env_settings = "afex_app.settings.production"
+
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', env_settings)
+
+# Initialize django before importing code that uses models.
+django_asgi_application = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+
+from registration.authentication import JWTAuthMiddleware  # noqa: E402
+from registration.heartbeat import HeartbeatMiddleware  # noqa: E402
+from chats.routing import websocket_urlpatterns  # noqa: E402
+
+
+application = ProtocolTypeRouter({
+    "http": HeartbeatMiddleware(django_asgi_application),
+    "websocket": JWTAuthMiddleware(URLRouter(websocket_urlpatterns)),
+})
@@ -0,0 +1,23 @@
+"""
+Celery app of afex_app project, start a worker with
+
+    celery -A afex_app worker
+"""
+
+import os
+
+from celery import Celery
+
+from .settings.base import DEBUG
+
+
+if DEBUG:
+    env_settings = "afex_app.settings.development"
+else:
+    env_settings = "afex_app.settings.production"
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", env_settings)
+
+app = Celery("afex_app")
+app.config_from_object("django.conf:settings", namespace="CELERY")
+app.autodiscover_tasks()
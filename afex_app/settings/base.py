@@ -32,6 +32,8 @@ DEBUG = True
 # Application definition
 
 INSTALLED_APPS = [
+    # daphne serves runserver over ASGI, keep it above staticfiles
+    "daphne",
     "django.contrib.admin",
     "django.contrib.auth",
     "django.contrib.contenttypes",
@@ -45,6 +47,7 @@ INSTALLED_APPS = [
     "drf_spectacular",
     "django_extensions",
     "storages",
+    "channels",
     # project apps
     "common_app",
     "exceptions_and_logging",
@@ -81,6 +84,7 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = "afex_app.wsgi.application"
+ASGI_APPLICATION = "afex_app.asgi.application"
 
 
 # Database
@@ -96,6 +100,27 @@ DATABASES = {
 # Redis
 REDIS_HOST = "localhost"
 REDIS_PORT = 6379
+REDIS_URL = config("REDIS_URL", default=f"redis://{REDIS_HOST}:{REDIS_PORT}/0")
+
+# Channels, websocket messages are fanned out across processes via Redis.
+CHANNEL_LAYERS = {
+    "default": {
+        "BACKEND": "channels_redis.pubsub.RedisPubSubChannelLayer",
+        "CONFIG": {
+            "hosts": [REDIS_URL],
+        },
+    },
+}
+
+# Celery, runs the tasks in each app's tasks.py, see afex_app/celery.py.
+CELERY_BROKER_URL = config("CELERY_BROKER_URL", default=REDIS_URL)
+CELERY_TASK_SERIALIZER = "json"
+CELERY_BEAT_SCHEDULE = {
+    "archive-chats": {
+        "task": "chats.tasks.task_archive_chats",
+        "schedule": timedelta(days=1),
+    },
+}
 
 # Password validation
 # https://docs.djangoproject.com/en/4.0/ref/settings/#auth-password-validators
@@ -165,6 +190,15 @@ REST_FRAMEWORK = {
     "PAGE_SIZE": 10,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "EXCEPTION_HANDLER": "exceptions_and_logging.exc_handler.app_exception_handler",
+    # per user (or IP) and per endpoint, see common_app.throttling.
+    "DEFAULT_THROTTLE_CLASSES": [
+        "common_app.throttling.AnonSlidingWindowThrottle",
+        "common_app.throttling.UserSlidingWindowThrottle",
+    ],
+    "DEFAULT_THROTTLE_RATES": {
+        "anon": "120/min",
+        "user": "600/min",
+    },
 }
 
 env = os.environ.get("DJANGO_SETTINGS_MODULE")
@@ -206,4 +240,37 @@ APPLICATION_SETTINGS = {
     # Default time to live before pins/keys are expired.
     "DEFAULT_PIN_TTL": timedelta(hours=1),
     "ONLINE_STATUS_POLICY": config("ONLINE_STATUS_POLICY", default="LoggedInIsOnline"),
+    # Authenticated requests mark users online at most this often, per process.
+    "PRESENCE_REFRESH_INTERVAL": timedelta(seconds=30),
+    # Chunked chat attachment uploads, 5MB is the smallest S3 multipart part.
+    "CHAT_UPLOAD_CHUNK_SIZE": 5 * 1024 * 1024,
+    "CHAT_UPLOAD_MAX_SIZE": 100 * 1024 * 1024,
+    # Direct to storage uploads, see chats.presigned.
+    "PRESIGNED_UPLOAD_BACKEND": "S3PresignedUpload" if USE_S3 else "LocalPresignedUpload",
+    "PRESIGNED_UPLOAD_TTL": timedelta(hours=1),
+    # Previews of image attachments, longest side in pixels by size name.
+    "CHAT_PREVIEW_SIZES": {"small": 128, "medium": 512},
+    "CHAT_PREVIEW_QUALITY": 80,
+    # Generate previews with a Celery worker, off uses a background thread
+    # of the web process instead.
+    "CHAT_PREVIEWS_ASYNC": config("CHAT_PREVIEWS_ASYNC", default=True, cast=bool),
+    # Chat syncs read this far behind their cursor again, for chats saved
+    # before others but committed after them. Longer than most transactions.
+    "CHAT_SYNC_OVERLAP": timedelta(seconds=10),
+    # Hops walked up and down a reply thread, see ChatViewset.thread.
+    "CHAT_THREAD_MAX_DEPTH": 20,
+    # Chats older than this are moved to archive files, see chats.archive.
+    "CHAT_ARCHIVE_AFTER": timedelta(days=365),
+    "CHAT_ARCHIVE_BATCH_SIZE": 500,
+    # Retries with the same Idempotency-Key replay the first response.
+    "IDEMPOTENCY_KEY_TTL": timedelta(hours=24),
+    # Rows read from the database and written to the response at a time.
+    "CHAT_EXPORT_CHUNK_SIZE": 2000,
+    # Recent chats kept per user in Redis, see chats.timelines.
+    "CHAT_TIMELINE_LENGTH": 500,
+    "CHAT_TIMELINE_TTL": timedelta(days=30),
+    # Friend IDs cached per user, see registration.friends.
+    "FRIENDS_CACHE_TTL": timedelta(days=1),
+    # Where rate limit windows are kept, see common_app.throttling.
+    "THROTTLE_BACKEND": config("THROTTLE_BACKEND", default="RedisSlidingWindow"),
 }
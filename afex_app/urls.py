@@ -27,7 +27,10 @@ from drf_spectacular.views import SpectacularSwaggerView, SpectacularAPIView
 
 from registration.views.user import UserViewsets
 from registration.views.registration import RegistrationViewsets
-from chats.views import ChatViewset
+from chats.views.chat import ChatViewset
+from chats.views.conversation import ConversationViewset
+from chats.views.upload import ChatUploadViewset
+from common_app.views import RedisMetricsView
 
 
 router = DefaultRouter()
@@ -35,11 +38,14 @@ router = DefaultRouter()
 router.register(r"registration", RegistrationViewsets, "registration")
 router.register(r"users", UserViewsets, "users")
 router.register(r'chats', ChatViewset, "chats")
+router.register(r'conversations', ConversationViewset, "conversations")
+router.register(r'chat_uploads', ChatUploadViewset, "chat_uploads")
 
 urlpatterns = [
     path("schema/", SpectacularAPIView.as_view(), name="schema_view"),
     path("swagger_ui/", SpectacularSwaggerView.as_view(url_name="schema_view"), name="swagger_view"),
     path('token/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
+    path("metrics/redis/", RedisMetricsView.as_view(), name="redis_metrics"),
 ]
 
 urlpatterns += router.urls
@@ -0,0 +1,181 @@
+"""
+Archival of old chats to storage, and restore of archived conversations.
+
+Chats older than CHAT_ARCHIVE_AFTER are moved out of the chats table in
+batches of CHAT_ARCHIVE_BATCH_SIZE, oldest first. Each batch writes one
+gzipped NDJSON file per conversation then deletes the chats in a short
+transaction, so the live table is never locked for long.
+
+Archived chats don't count in Conversation.chat_count, they count in
+Conversation.archived_count until the conversation is restored.
+"""
+
+import gzip
+import json
+import uuid
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Optional
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from common_app.utils.general_utils import app_settings
+
+from .models import Chat, ChatArchive, Conversation
+from .timelines import Timelines
+
+
+class ArchiveJSONEncoder(DjangoJSONEncoder):
+    """Keeps the microseconds DjangoJSONEncoder drops, chats are paged by them."""
+
+    def default(self, o):
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+def archive_fields() -> list:
+    return [field.attname for field in Chat._meta.concrete_fields]
+
+
+def archive_chats(
+    older_than: Optional[timedelta] = None, batch_size: Optional[int] = None,
+    max_batches: Optional[int] = None
+) -> int:
+    """Archive chats older than `older_than`, returns the number archived."""
+
+    older_than = older_than or app_settings["CHAT_ARCHIVE_AFTER"]
+    batch_size = batch_size or app_settings["CHAT_ARCHIVE_BATCH_SIZE"]
+    cutoff = timezone.now() - older_than
+
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        archived += count
+        batches += 1
+    return archived
+
+
+def archive_batch(cutoff: datetime, batch_size: int) -> int:
+    """Archive the oldest `batch_size` chats created before `cutoff`."""
+
+    rows = list(
+        Chat.objects
+            .filter(created_at__lt=cutoff, conversation__isnull=False)
+            .order_by("created_at", "id")
+            .values(*archive_fields())[:batch_size]
+    )
+    if not rows:
+        return 0
+
+    rows_by_conversation = {}
+    for row in rows:
+        rows_by_conversation.setdefault(row["conversation_id"], []).append(row)
+
+    # Files are written before the chats are deleted, never the other way.
+    storage = Chat._meta.get_field("file").storage
+    archives = []
+    for conversation_id, conversation_rows in rows_by_conversation.items():
+        lines = "".join(
+            json.dumps(row, cls=ArchiveJSONEncoder) + "\n" for row in conversation_rows
+        )
+        name = storage.save(
+            f"chat_archives/{conversation_id}/{uuid.uuid4().hex}.ndjson.gz",
+            ContentFile(gzip.compress(lines.encode()))
+        )
+        archives.append(ChatArchive(
+            conversation_id=conversation_id, name=name,
+            chat_count=len(conversation_rows),
+            first_created_at=conversation_rows[0]["created_at"],
+            last_created_at=conversation_rows[-1]["created_at"]
+        ))
+
+    try:
+        with transaction.atomic():
+            ChatArchive.objects.bulk_create(archives)
+            Chat.objects.delete_archived([row["id"] for row in rows])
+            for archive in archives:
+                Conversation.objects.filter(pk=archive.conversation_id).update(
+                    archived_count=F("archived_count") + archive.chat_count
+                )
+                Conversation.objects.refresh_summary(archive.conversation_id)
+        transaction.on_commit(lambda: Timelines().remove_chats(rows))
+    except Exception:
+        for archive in archives:
+            archive.storage.delete(archive.name)
+        raise
+
+    return len(rows)
+
+
+def restore_conversation(conversation: Conversation) -> int:
+    """Move the archived chats of a conversation back, returns the number restored."""
+
+    restored = 0
+    # oldest first, so chats find the chats they respond to
+    for archive in conversation.archives.order_by("first_created_at", "id"):
+        restored += restore_archive(archive)
+    return restored
+
+
+def restore_archive(archive: ChatArchive) -> int:
+    fields = {field.attname: field for field in Chat._meta.concrete_fields}
+    with archive.storage.open(archive.name, "rb") as file:
+        with gzip.open(file, "rt") as lines:
+            chats = [
+                Chat(**{
+                    attname: fields[attname].to_python(value)
+                    for attname, value in json.loads(line).items()
+                }) for line in lines
+            ]
+
+    # Users and chats responded to may have been deleted since, follow
+    # what their foreign keys would have done.
+    user_ids = {chat.sender_id for chat in chats} | {chat.receiver_id for chat in chats}
+    live_user_ids = set(
+        get_user_model().objects.filter(id__in=user_ids).values_list("id", flat=True)
+    )
+    chats = [chat for chat in chats if chat.sender_id in live_user_ids]
+    for chat in chats:
+        if chat.receiver_id not in live_user_ids:
+            chat.receiver_id = None
+
+    chat_ids = {chat.id for chat in chats}
+    parent_ids = {chat.respond_to_id for chat in chats} - chat_ids - {None}
+    live_parent_ids = set(
+        Chat.objects.filter(id__in=parent_ids).values_list("id", flat=True)
+    )
+    for chat in chats:
+        if chat.respond_to_id in parent_ids - live_parent_ids:
+            chat.respond_to_id = None
+
+    with transaction.atomic():
+        # bulk_create stamps created_at with the current time, put it back.
+        # modified_at is left at the current time so restored chats sync.
+        created_at = {chat.id: chat.created_at for chat in chats}
+        Chat.objects.bulk_create(chats, ignore_conflicts=True)
+        for chat in chats:
+            chat.created_at = created_at[chat.id]
+        Chat.objects.bulk_update(chats, ["created_at"])
+
+        Conversation.objects.filter(pk=archive.conversation_id).update(
+            archived_count=F("archived_count") - archive.chat_count
+        )
+        Conversation.objects.refresh_summary(archive.conversation_id)
+        archive.delete()
+        # restored chats are older than the ones added on create, and may
+        # belong in the timelines.
+        conversation = archive.conversation
+        transaction.on_commit(partial(
+            Timelines().invalidate, conversation.user_one_id, conversation.user_two_id
+        ))
+
+    archive.storage.delete(archive.name)
+    return len(chats)
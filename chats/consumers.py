@@ -0,0 +1,42 @@
+"""
+Websocket consumers, the logged in user receives new chats on
+their connection as soon as they are created, and changes of their
+friends' online status.
+"""
+
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+
+from .utils import user_group_name
+
+
+class ChatConsumer(AsyncJsonWebsocketConsumer):
+
+    # Close code sent when the connection isn't authenticated.
+    unauthorized_close_code = 4401
+
+    async def connect(self):
+        user = self.scope["user"]
+        if not user.is_authenticated:
+            await self.close(code=self.unauthorized_close_code)
+            return
+
+        self.group_name = user_group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def chat_message(self, event):
+        """Handler for 'chat.message' events sent to the user's group."""
+
+        await self.send_json({"type": "chat.message", "chat": event["chat"]})
+
+    async def presence_changed(self, event):
+        """Handler for 'presence.changed' events, see registration.presence."""
+
+        await self.send_json({
+            "type": "presence.changed", "user_id": event["user_id"],
+            "online": event["online"]
+        })
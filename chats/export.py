@@ -0,0 +1,81 @@
+"""
+Streaming export of a user's chat history, as NDJSON or CSV.
+
+Rows are read with a server side cursor, `CHAT_EXPORT_CHUNK_SIZE` at a
+time, and written out as they come so memory stays flat however many
+chats a user has. Names of senders and receivers are joined in the same
+query.
+"""
+
+import csv
+import io
+import json
+from typing import Iterator
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from common_app.utils.general_utils import app_settings
+
+from .models import Chat
+
+
+columns = [
+    "id", "created_at", "sender_id", "sender_name", "receiver_id",
+    "receiver_name", "respond_to_id", "message", "location", "file"
+]
+
+content_types = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_rows(user) -> Iterator[tuple]:
+    """Chats of a user, oldest first, with the values of `columns`."""
+
+    storage = Chat._meta.get_field("file").storage
+    rows = Chat.objects \
+        .filter(Q(sender=user) | Q(receiver=user)) \
+        .order_by("created_at", "id") \
+        .values_list(
+            "id", "created_at", "sender_id", "sender__first_name",
+            "sender__last_name", "receiver_id", "receiver__first_name",
+            "receiver__last_name", "respond_to_id", "message", "location", "file"
+        ) \
+        .iterator(chunk_size=app_settings["CHAT_EXPORT_CHUNK_SIZE"])
+
+    for (id, created_at, sender_id, sender_first_name, sender_last_name,
+         receiver_id, receiver_first_name, receiver_last_name, respond_to_id,
+         message, location, file) in rows:
+        yield (
+            id, created_at, sender_id,
+            full_name(sender_first_name, sender_last_name), receiver_id,
+            full_name(receiver_first_name, receiver_last_name), respond_to_id,
+            message, location, storage.url(file) if file else None
+        )
+
+
+def full_name(first_name, last_name) -> str:
+    # same as AbstractUser.get_full_name
+    return f"{first_name or ''} {last_name or ''}".strip()
+
+
+def export_chats(user, export_format: str) -> Iterator[bytes]:
+    """The export file of a user's chats, in chunks of up to CHAT_EXPORT_CHUNK_SIZE rows."""
+
+    chunk_size = app_settings["CHAT_EXPORT_CHUNK_SIZE"]
+    buffer = io.StringIO()
+    if export_format == "csv":
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder))
+            buffer.write("\n")
+
+    for count, row in enumerate(export_rows(user), 1):
+        write(row)
+        if count % chunk_size == 0:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
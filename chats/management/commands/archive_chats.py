@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from chats.tasks import task_archive_chats
+
+
+class Command(BaseCommand):
+    help = "Move chats older than CHAT_ARCHIVE_AFTER to archive files, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, dest="older_than_days",
+            help="Archive chats older than this many days."
+        )
+        parser.add_argument(
+            "--batch-size", type=int, help="Chats moved per transaction."
+        )
+        parser.add_argument(
+            "--max-batches", type=int, help="Stop after this many batches."
+        )
+
+    def handle(self, *args, **options):
+        archived = task_archive_chats(
+            older_than_days=options["older_than_days"],
+            batch_size=options["batch_size"], max_batches=options["max_batches"]
+        )
+        self.stdout.write(f"Archived {archived} chats.")
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+
+from chats.timelines import Timelines
+
+
+class Command(BaseCommand):
+    help = "Refill the Redis chat timelines of users from the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "user_ids", nargs="*", type=int,
+            help="Users to rebuild timelines for, all users if none given."
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"] or get_user_model().objects \
+            .order_by("id").values_list("id", flat=True).iterator()
+
+        timelines = Timelines()
+        rebuilt = 0
+        for user_id in user_ids:
+            timelines.rebuild(user_id)
+            rebuilt += 1
+        self.stdout.write(f"Rebuilt {rebuilt} timelines.")
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from chats.archive import restore_conversation
+from chats.models import Conversation
+
+
+class Command(BaseCommand):
+    help = "Move archived chats of conversations back to the chats table."
+
+    def add_arguments(self, parser):
+        parser.add_argument("conversation_ids", nargs="+", type=int)
+
+    def handle(self, *args, **options):
+        for conversation_id in options["conversation_ids"]:
+            conversation = Conversation.objects.get_or_none(pk=conversation_id)
+            if conversation is None:
+                raise CommandError(f"Conversation {conversation_id} does not exist.")
+            restored = restore_conversation(conversation)
+            self.stdout.write(
+                f"Restored {restored} chats of conversation {conversation_id}."
+            )
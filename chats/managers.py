@@ -1,4 +1,12 @@
-from django.db.models import Manager, QuerySet
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+from django.db.models import Manager, QuerySet, F, Q
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from common_app.mixins.manager_mixins import ModelManagerMixin
 
 
 class ChatManager(Manager):
@@ -6,4 +14,198 @@ class ChatManager(Manager):
     def get_queryset(self) -> QuerySet:
         return super().get_queryset().order_by("-created_at")
 
-    
\ No newline at end of file
+    def bulk_create_chats(self, chats: list) -> list:
+        """
+        bulk_create for chats. Unlike bulk_create, chats are assigned their
+        conversations and `chats_created` listeners are notified.
+        """
+
+        from .models import Conversation
+        from .signals import chats_created
+
+        conversations = Conversation.objects.get_for_pairs(
+            (chat.sender_id, chat.receiver_id) for chat in chats
+        )
+        for chat in chats:
+            pair = Conversation.objects.ordered_pair(chat.sender_id, chat.receiver_id)
+            chat.conversation = conversations[pair]
+
+        chats = self.bulk_create(chats)
+        chats_created.send(sender=self.model, chats=chats)
+        return chats
+
+    def thread(self, chat_id: int, user_id: int, depth: int) -> QuerySet:
+        """
+        Chats in the reply thread of a chat: its ancestors and its replies,
+        up to `depth` hops either side, found with one recursive query.
+        Only chats sent or received by the user are walked.
+        """
+
+        # Recursive CTEs run on both PostgreSQL and SQLite (3.8.3+).
+        sql = f"""
+            WITH RECURSIVE ancestors(id, respond_to_id, depth) AS (
+                SELECT id, respond_to_id, 0 FROM {self.model._meta.db_table}
+                WHERE id = %s
+                UNION ALL
+                SELECT c.id, c.respond_to_id, a.depth + 1
+                FROM {self.model._meta.db_table} c
+                JOIN ancestors a ON c.id = a.respond_to_id
+                WHERE a.depth < %s AND (c.sender_id = %s OR c.receiver_id = %s)
+            ),
+            replies(id, depth) AS (
+                SELECT id, 0 FROM {self.model._meta.db_table} WHERE id = %s
+                UNION ALL
+                SELECT c.id, r.depth + 1
+                FROM {self.model._meta.db_table} c
+                JOIN replies r ON c.respond_to_id = r.id
+                WHERE r.depth < %s AND (c.sender_id = %s OR c.receiver_id = %s)
+            )
+            SELECT id FROM ancestors UNION SELECT id FROM replies
+        """
+        params = (
+            chat_id, depth, user_id, user_id, chat_id, depth, user_id, user_id
+        )
+        return self.filter(id__in=RawSQL(sql, params))
+
+    def delete_archived(self, chat_ids: List[int]) -> None:
+        """
+        Delete chats that were copied to the archive. Unlike delete, no
+        tombstones are left. Reply counts are updated once for the batch,
+        not by each chat's delete signal, conversation summaries are left
+        to the caller.
+        """
+
+        from .models import Conversation, ChatUpload, ReadReceipt
+
+        archived = self.filter(id__in=chat_ids)
+        # Uncount archived replies of chats that stay, as release_reply does.
+        replies = Counter(
+            archived.filter(respond_to__isnull=False)
+                .exclude(respond_to_id__in=chat_ids)
+                .values_list("respond_to_id", flat=True)
+        )
+        now = timezone.now()
+        for chat_id, count in replies.items():
+            self.filter(pk=chat_id, reply_count__gt=0).update(
+                reply_count=Greatest(F("reply_count") - count, 0), modified_at=now
+            )
+
+        # Clear references the collector would have set to NULL.
+        self.filter(respond_to_id__in=chat_ids).exclude(id__in=chat_ids) \
+            .update(respond_to=None, modified_at=now)
+        Conversation.objects.filter(last_chat_id__in=chat_ids).update(last_chat=None)
+        ChatUpload.objects.filter(chat_id__in=chat_ids).update(chat=None)
+        ReadReceipt.objects.filter(last_read_chat_id__in=chat_ids).update(last_read_chat=None)
+        # Counted above and refreshed by the caller, the delete signals skip
+        # chats without a chat responded to or a conversation.
+        archived.update(respond_to=None, conversation=None)
+        archived.delete()
+
+    def record_replies(self, chats: List) -> None:
+        """Count newly created chats in the reply counts of the chats they respond to."""
+
+        replies = Counter(
+            chat.respond_to_id for chat in chats if chat.respond_to_id is not None
+        )
+        now = timezone.now()
+        for chat_id, count in replies.items():
+            self.filter(pk=chat_id).update(
+                reply_count=F("reply_count") + count, modified_at=now
+            )
+
+    def release_reply(self, chat_id: int) -> None:
+        """Uncount a deleted reply from the reply count of the chat it responded to."""
+
+        self.filter(pk=chat_id, reply_count__gt=0).update(
+            reply_count=F("reply_count") - 1, modified_at=timezone.now()
+        )
+
+
+class ConversationManager(ModelManagerMixin, Manager):
+
+    @staticmethod
+    def ordered_pair(user_id: int, other_user_id: int) -> tuple:
+        """A conversation is keyed by the unordered pair, lowest ID first."""
+
+        return tuple(sorted((user_id, other_user_id)))
+
+    def get_for_pair(self, user_id: int, other_user_id: int):
+        user_one_id, user_two_id = self.ordered_pair(user_id, other_user_id)
+        conversation, _ = self.get_or_create(
+            user_one_id=user_one_id, user_two_id=user_two_id
+        )
+        return conversation
+
+    def get_for_pairs(self, pairs: Iterable[Tuple[int, int]]) -> Dict[tuple, object]:
+        """Conversations of many pairs, keyed by ordered pair, creating missing ones."""
+
+        pairs = {self.ordered_pair(*pair) for pair in pairs}
+        conversations = {
+            (c.user_one_id, c.user_two_id): c for c in self.filter(self._pairs_q(pairs))
+        }
+
+        missing = pairs - conversations.keys()
+        if missing:
+            self.bulk_create(
+                [self.model(user_one_id=one, user_two_id=two) for one, two in missing],
+                ignore_conflicts=True
+            )
+            # ignore_conflicts leaves primary keys unset, read them back.
+            conversations.update({
+                (c.user_one_id, c.user_two_id): c
+                for c in self.filter(self._pairs_q(missing))
+            })
+        return conversations
+
+    def record_chats(self, chats: List) -> None:
+        """Update conversation summaries with newly created chats."""
+
+        chats_by_conversation = {}
+        for chat in chats:
+            if chat.conversation_id is not None:
+                chats_by_conversation.setdefault(chat.conversation_id, []).append(chat)
+
+        now = timezone.now()
+        conversations = []
+        for conversation_id, new_chats in chats_by_conversation.items():
+            last_chat = max(new_chats, key=lambda chat: (chat.created_at, chat.id))
+            conversations.append(self.model(
+                pk=conversation_id, last_chat=last_chat,
+                last_activity_at=last_chat.created_at,
+                chat_count=F("chat_count") + len(new_chats), modified_at=now
+            ))
+
+        if len(conversations) == 1:
+            conversation = conversations[0]
+            self.filter(pk=conversation.pk).update(
+                last_chat=conversation.last_chat,
+                last_activity_at=conversation.last_activity_at,
+                chat_count=conversation.chat_count, modified_at=now
+            )
+        elif conversations:
+            self.bulk_update(
+                conversations,
+                ["last_chat", "last_activity_at", "chat_count", "modified_at"]
+            )
+
+    def refresh_summary(self, conversation_id: int) -> None:
+        """Recompute the conversation summary from its chats, e.g after a delete."""
+
+        from .models import Chat
+
+        chats = Chat.objects.filter(conversation_id=conversation_id)
+        last_chat = chats.order_by("-created_at", "-id").first()
+        update_kwargs = {
+            "last_chat": last_chat, "chat_count": chats.count(),
+            "modified_at": timezone.now()
+        }
+        if last_chat is not None:
+            update_kwargs["last_activity_at"] = last_chat.created_at
+        self.filter(pk=conversation_id).update(**update_kwargs)
+
+    @staticmethod
+    def _pairs_q(pairs: Iterable[tuple]) -> Q:
+        pairs_q = Q(pk__in=[])
+        for user_one_id, user_two_id in pairs:
+            pairs_q |= Q(user_one_id=user_one_id, user_two_id=user_two_id)
+        return pairs_q
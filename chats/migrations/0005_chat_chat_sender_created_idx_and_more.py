@@ -0,0 +1,21 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0004_alter_chat_file'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['sender', '-created_at', '-id'], name='chat_sender_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['receiver', '-created_at', '-id'], name='chat_receiver_created_idx'),
+        ),
+    ]
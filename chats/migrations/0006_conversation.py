@@ -0,0 +1,63 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:41
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0005_chat_chat_sender_created_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('last_activity_at', models.DateTimeField(default=django.utils.timezone.now, help_text='Time of the most recent chat in this conversation.')),
+                ('chat_count', models.PositiveIntegerField(default=0, help_text='Number of chats in this conversation.')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='last_chat',
+            field=models.ForeignKey(help_text='Most recent chat in this conversation.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.chat'),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_one',
+            field=models.ForeignKey(help_text='Participant with the lower user ID.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='user_two',
+            field=models.ForeignKey(help_text='Participant with the higher user ID.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chat',
+            name='conversation',
+            field=models.ForeignKey(help_text='Conversation between sender and receiver.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='chats', to='chats.conversation'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['conversation', '-created_at', '-id'], name='chat_conversation_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_one', '-last_activity_at', '-id'], name='conv_user_one_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user_two', '-last_activity_at', '-id'], name='conv_user_two_activity_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_one', 'user_two'), name='unique_conversation_pair'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+def backfill_conversations(apps, schema_editor):
+    """Create conversation summaries for chats sent before conversations existed."""
+
+    Chat = apps.get_model("chats", "Chat")
+    Conversation = apps.get_model("chats", "Conversation")
+
+    pairs = Chat.objects \
+        .filter(conversation__isnull=True, receiver__isnull=False) \
+        .values_list("sender_id", "receiver_id") \
+        .distinct()
+
+    for pair in {tuple(sorted(pair)) for pair in pairs}:
+        user_one_id, user_two_id = pair
+        conversation, _ = Conversation.objects.get_or_create(
+            user_one_id=user_one_id, user_two_id=user_two_id
+        )
+        pair_chats = Chat.objects.filter(
+            sender_id__in=pair, receiver_id__in=pair
+        )
+        pair_chats.update(conversation=conversation)
+
+        summary = pair_chats.aggregate(count=Count("id"), last=Max("created_at"))
+        conversation.chat_count = summary["count"]
+        conversation.last_activity_at = summary["last"]
+        conversation.last_chat = pair_chats.order_by("-created_at", "-id").first()
+        conversation.save()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0006_conversation'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_conversations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0007_backfill_conversations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('chat_id', models.BigIntegerField(help_text='ID of the deleted chat.')),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['sender', 'modified_at', 'id'], name='chat_sender_modified_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chat',
+            index=models.Index(fields=['receiver', 'modified_at', 'id'], name='chat_receiver_modified_idx'),
+        ),
+        migrations.AddField(
+            model_name='chattombstone',
+            name='receiver',
+            field=models.ForeignKey(help_text='The receiver of the deleted chat.', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='chattombstone',
+            name='sender',
+            field=models.ForeignKey(help_text='The initiator of the deleted chat.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='chattombstone',
+            index=models.Index(fields=['sender', 'deleted_at', 'id'], name='tombstone_sender_deleted_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='chattombstone',
+            index=models.Index(fields=['receiver', 'deleted_at', 'id'], name='tombstone_receiver_deleted_idx'),
+        ),
+    ]
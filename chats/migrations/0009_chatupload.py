@@ -0,0 +1,46 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:50
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0008_chattombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChatUpload',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('filename', models.CharField(help_text='Name of the file being uploaded.', max_length=255)),
+                ('size', models.PositiveBigIntegerField(help_text='Total size of the file in bytes.')),
+                ('chunk_size', models.PositiveIntegerField(help_text='Size in bytes of every chunk, except the last.')),
+                ('chat', models.ForeignKey(help_text='Chat the file was attached to once committed.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.chat')),
+                ('owner', models.ForeignKey(help_text='User uploading the file.', on_delete=django.db.models.deletion.CASCADE, related_name='chat_uploads', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.CreateModel(
+            name='ChatUploadPart',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveIntegerField(help_text='Position of the chunk.')),
+                ('name', models.CharField(help_text='Name of the part in storage.', max_length=255)),
+                ('size', models.PositiveIntegerField(help_text='Size of the chunk in bytes.')),
+                ('upload', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='parts', to='chats.chatupload')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='chatuploadpart',
+            constraint=models.UniqueConstraint(fields=('upload', 'index'), name='unique_upload_part'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0009_chatupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='previews',
+            field=models.JSONField(blank=True, default=dict, help_text='Storage names of resized copies of an image file, by size.'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:56
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_reply_counts(apps, schema_editor):
+    Chat = apps.get_model("chats", "Chat")
+
+    counts = Chat.objects \
+        .filter(respond_to__isnull=False) \
+        .values("respond_to_id") \
+        .annotate(count=Count("id")) \
+        .order_by()
+    for row in counts:
+        Chat.objects.filter(pk=row["respond_to_id"]).update(reply_count=row["count"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0010_chat_previews'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='reply_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of chats that respond to this chat.'),
+        ),
+        migrations.RunPython(backfill_reply_counts, migrations.RunPython.noop),
+    ]
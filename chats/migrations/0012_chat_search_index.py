@@ -0,0 +1,83 @@
+"""
+Full-text index of Chat.message, see chats/search.py.
+
+The schema differs by database so it's created with raw SQL per vendor,
+Chat doesn't declare the extra column.
+"""
+
+from django.db import migrations
+
+
+PG_FORWARD = [
+    """
+    ALTER TABLE chats_chat ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('english', coalesce(message, ''))) STORED
+    """,
+    "CREATE INDEX chat_search_vector_idx ON chats_chat USING GIN (search_vector)",
+]
+
+PG_BACKWARD = [
+    "DROP INDEX IF EXISTS chat_search_vector_idx",
+    "ALTER TABLE chats_chat DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE chats_chat_fts USING fts5(
+        message, content='chats_chat', content_rowid='id',
+        tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER chats_chat_fts_insert AFTER INSERT ON chats_chat
+    BEGIN
+        INSERT INTO chats_chat_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    """
+    CREATE TRIGGER chats_chat_fts_delete AFTER DELETE ON chats_chat
+    BEGIN
+        INSERT INTO chats_chat_fts(chats_chat_fts, rowid, message)
+        VALUES ('delete', old.id, old.message);
+    END
+    """,
+    """
+    CREATE TRIGGER chats_chat_fts_update AFTER UPDATE OF message ON chats_chat
+    BEGIN
+        INSERT INTO chats_chat_fts(chats_chat_fts, rowid, message)
+        VALUES ('delete', old.id, old.message);
+        INSERT INTO chats_chat_fts(rowid, message) VALUES (new.id, new.message);
+    END
+    """,
+    # index chats sent before this migration
+    "INSERT INTO chats_chat_fts(chats_chat_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS chats_chat_fts_insert",
+    "DROP TRIGGER IF EXISTS chats_chat_fts_delete",
+    "DROP TRIGGER IF EXISTS chats_chat_fts_update",
+    "DROP TABLE IF EXISTS chats_chat_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        vendor = schema_editor.connection.vendor
+        for sql in statements.get(vendor, []):
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0011_chat_reply_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({"postgresql": PG_FORWARD, "sqlite": SQLITE_FORWARD}),
+            run_for_vendor({"postgresql": PG_BACKWARD, "sqlite": SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 4.0.6 on 2026-10-17 21:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0012_chat_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='archived_count',
+            field=models.PositiveIntegerField(default=0, help_text='Number of chats of this conversation moved to the archive.'),
+        ),
+        migrations.CreateModel(
+            name='ChatArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('modified_at', models.DateTimeField(auto_now=True)),
+                ('name', models.CharField(help_text='Name of the archive file in storage.', max_length=255)),
+                ('chat_count', models.PositiveIntegerField(help_text='Number of chats archived.')),
+                ('first_created_at', models.DateTimeField(help_text='Time of the oldest chat.')),
+                ('last_created_at', models.DateTimeField(help_text='Time of the most recent chat.')),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chats.conversation')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.6 on 2026-10-17 21:02
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('chats', '0013_chatarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReadReceipt',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('read_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_read_chat', models.ForeignKey(help_text='Most recent chat from the peer when they were read.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='chats.chat')),
+                ('peer', models.ForeignKey(help_text='User whose chats were read.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='readreceipt',
+            constraint=models.UniqueConstraint(fields=('user', 'peer'), name='unique_read_receipt'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 4.0.6 on 2026-10-17 21:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chats', '0014_readreceipt'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chat',
+            name='idempotency_key',
+            field=models.CharField(help_text='Idempotency-Key the sender created this chat with.', max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='chat',
+            constraint=models.UniqueConstraint(condition=models.Q(('idempotency_key__isnull', False)), fields=('sender', 'idempotency_key'), name='unique_chat_idempotency_key'),
+        ),
+    ]
@@ -1,13 +1,79 @@
 from django.db import models
 
 from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.core.files.storage import Storage
 from common_app.models import BaseModel
 
-from .managers import ChatManager
+from .managers import ChatManager, ConversationManager
 from afex_app.storage_backends import MediaStorage
 
 from django.core.files.storage import DefaultStorage
 
+class Conversation(BaseModel):
+    """Summary of the chats between a pair of users, used to build inboxes.
+
+    The pair is unordered, `user_one` always holds the lower user ID.
+    """
+
+    user_one = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE,
+        related_name="+",
+        help_text="Participant with the lower user ID."
+    )
+
+    user_two = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE,
+        related_name="+",
+        help_text="Participant with the higher user ID."
+    )
+
+    last_chat = models.ForeignKey(
+        "Chat", on_delete=models.SET_NULL, null=True, related_name="+",
+        help_text="Most recent chat in this conversation."
+    )
+
+    last_activity_at = models.DateTimeField(
+        default=timezone.now,
+        help_text="Time of the most recent chat in this conversation."
+    )
+
+    chat_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of chats in this conversation."
+    )
+
+    archived_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of chats of this conversation moved to the archive."
+    )
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user_one", "user_two"], name="unique_conversation_pair"
+            ),
+        ]
+        indexes = [
+            # inbox of a user, see ConversationViewset.
+            models.Index(
+                fields=["user_one", "-last_activity_at", "-id"],
+                name="conv_user_one_activity_idx"
+            ),
+            models.Index(
+                fields=["user_two", "-last_activity_at", "-id"],
+                name="conv_user_two_activity_idx"
+            ),
+        ]
+
+    def peer_of(self, user):
+        """The other participant of this conversation."""
+
+        return self.user_two if user.id == self.user_one_id else self.user_one
+
+
 class Chat(BaseModel):
 
     sender = models.ForeignKey(
@@ -42,6 +108,209 @@ class Chat(BaseModel):
         help_text="A file you wish to upload"
     )
 
+    previews = models.JSONField(
+        default=dict, blank=True,
+        help_text="Storage names of resized copies of an image file, by size."
+    )
+
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.SET_NULL, null=True, related_name="chats",
+        help_text="Conversation between sender and receiver."
+    )
+
+    reply_count = models.PositiveIntegerField(
+        default=0,
+        help_text="Number of chats that respond to this chat."
+    )
+
+    idempotency_key = models.CharField(
+        max_length=64, null=True,
+        help_text="Idempotency-Key the sender created this chat with."
+    )
+
     objects = ChatManager()
 
+    class Meta:
+        constraints = [
+            # retries of a create, see ChatViewset.create.
+            models.UniqueConstraint(
+                fields=["sender", "idempotency_key"],
+                condition=models.Q(idempotency_key__isnull=False),
+                name="unique_chat_idempotency_key"
+            ),
+        ]
+        indexes = [
+            # keyset pagination of a user's chats, see ChatViewset.
+            models.Index(
+                fields=["sender", "-created_at", "-id"],
+                name="chat_sender_created_idx"
+            ),
+            models.Index(
+                fields=["receiver", "-created_at", "-id"],
+                name="chat_receiver_created_idx"
+            ),
+            models.Index(
+                fields=["conversation", "-created_at", "-id"],
+                name="chat_conversation_created_idx"
+            ),
+            # incremental sync, see ChatViewset.sync.
+            models.Index(
+                fields=["sender", "modified_at", "id"],
+                name="chat_sender_modified_idx"
+            ),
+            models.Index(
+                fields=["receiver", "modified_at", "id"],
+                name="chat_receiver_modified_idx"
+            ),
+        ]
+
+
+class ChatTombstone(models.Model):
+    """Record of a deleted chat, lets syncing clients drop their local copy."""
+
+    chat_id = models.BigIntegerField(help_text="ID of the deleted chat.")
+
+    sender = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, related_name="+",
+        help_text="The initiator of the deleted chat."
+    )
+
+    receiver = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, null=True, related_name="+",
+        help_text="The receiver of the deleted chat."
+    )
+
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["sender", "deleted_at", "id"],
+                name="tombstone_sender_deleted_idx"
+            ),
+            models.Index(
+                fields=["receiver", "deleted_at", "id"],
+                name="tombstone_receiver_deleted_idx"
+            ),
+        ]
+
+
+class ChatUpload(BaseModel):
+    """Session of a chunked, resumable upload of a chat attachment.
+
+    The file is sent in fixed size chunks which are stored as separate
+    parts until the upload is committed to a chat.
+    """
+
+    owner = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE,
+        related_name="chat_uploads",
+        help_text="User uploading the file."
+    )
+
+    filename = models.CharField(
+        max_length=255,
+        help_text="Name of the file being uploaded."
+    )
+
+    size = models.PositiveBigIntegerField(
+        help_text="Total size of the file in bytes."
+    )
+
+    chunk_size = models.PositiveIntegerField(
+        help_text="Size in bytes of every chunk, except the last."
+    )
+
+    chat = models.ForeignKey(
+        Chat, on_delete=models.SET_NULL, null=True, related_name="+",
+        help_text="Chat the file was attached to once committed."
+    )
+
+    @property
+    def storage(self) -> Storage:
+        return Chat._meta.get_field("file").storage
+
+    @property
+    def chunk_count(self) -> int:
+        return max(-(-self.size // self.chunk_size), 1)
+
+    def expected_chunk_size(self, index: int) -> int:
+        if index == self.chunk_count - 1:
+            return self.size - index * self.chunk_size
+        return self.chunk_size
+
+    def part_name(self, index: int) -> str:
+        return f"chat_uploads/{self.id}/{index}"
+
+
+class ChatUploadPart(models.Model):
+    """A chunk of a ChatUpload already written to storage."""
+
+    upload = models.ForeignKey(
+        ChatUpload, on_delete=models.CASCADE, related_name="parts"
+    )
+
+    index = models.PositiveIntegerField(help_text="Position of the chunk.")
+
+    name = models.CharField(
+        max_length=255, help_text="Name of the part in storage."
+    )
+
+    size = models.PositiveIntegerField(help_text="Size of the chunk in bytes.")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["upload", "index"], name="unique_upload_part"
+            ),
+        ]
+
+
+class ReadReceipt(models.Model):
+    """When a user last read the chats a peer sent them, see chats.unread."""
+
+    user = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, related_name="+"
+    )
+
+    peer = models.ForeignKey(
+        get_user_model(), on_delete=models.CASCADE, related_name="+",
+        help_text="User whose chats were read."
+    )
+
+    last_read_chat = models.ForeignKey(
+        Chat, on_delete=models.SET_NULL, null=True, related_name="+",
+        help_text="Most recent chat from the peer when they were read."
+    )
+
+    read_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "peer"], name="unique_read_receipt"
+            ),
+        ]
+
+
+class ChatArchive(BaseModel):
+    """Chats of a conversation moved out of the chats table, stored as a
+    gzipped NDJSON file of their column values. See chats.archive."""
+
+    conversation = models.ForeignKey(
+        Conversation, on_delete=models.CASCADE, related_name="archives"
+    )
+
+    name = models.CharField(
+        max_length=255, help_text="Name of the archive file in storage."
+    )
+
+    chat_count = models.PositiveIntegerField(help_text="Number of chats archived.")
+
+    first_created_at = models.DateTimeField(help_text="Time of the oldest chat.")
+
+    last_created_at = models.DateTimeField(help_text="Time of the most recent chat.")
 
+    @property
+    def storage(self) -> Storage:
+        return Chat._meta.get_field("file").storage
@@ -0,0 +1,123 @@
+"""
+Direct to storage uploads of chat attachments.
+
+The client asks for a presigned upload target, sends the file straight
+to storage, then confirms the upload to create the chat. Attachment
+bytes never pass through the web workers when storage is S3.
+
+LocalPresignedUpload is a stand-in for local development and tests, its
+upload target is served by ChatUploadViewset.local_upload.
+"""
+
+import importlib
+import uuid
+from abc import ABC, abstractmethod
+
+from django.core import signing
+from django.core.files.storage import Storage
+from django.urls import reverse
+from django.utils.text import get_valid_filename
+
+from common_app.utils.general_utils import app_settings, get_redis_client
+
+
+policy_module_path = "chats.presigned"
+token_salt = "chats.presigned.upload"
+
+
+def get_presigned_upload_class():
+    backend_module = importlib.import_module(policy_module_path)
+    return getattr(backend_module, app_settings["PRESIGNED_UPLOAD_BACKEND"])
+
+
+class BasePresignedUpload(ABC):
+
+    def __init__(self, user, storage: Storage = None):
+        from .models import Chat
+
+        self.user = user
+        self.storage = storage or Chat._meta.get_field("file").storage
+        self.ttl = int(app_settings["PRESIGNED_UPLOAD_TTL"].total_seconds())
+        self.max_size = app_settings["CHAT_UPLOAD_MAX_SIZE"]
+
+    def presign(self, filename: str) -> dict:
+        """Upload target for a new file along with a token to confirm it."""
+
+        name = "chat_uploads/presigned/%s/%s/%s" % (
+            self.user.id, uuid.uuid4().hex, get_valid_filename(filename)
+        )
+        token = signing.dumps({"name": name, "user": self.user.id}, salt=token_salt)
+        target = self.get_upload_target(name, token)
+        target.update({"name": name, "token": token, "expires_in": self.ttl})
+        return target
+
+    def confirm(self, token: str) -> str:
+        """Returns the storage name of an uploaded file, given its token.
+
+        Raises ValueError if the token is invalid, expired, of another user,
+        already confirmed or nothing was uploaded.
+        """
+
+        name = self.load_token(token, user_id=self.user.id)
+        if self.is_confirmed(name):
+            raise ValueError("Upload already confirmed.")
+        if not self.storage.exists(name):
+            raise ValueError("Nothing was uploaded for this token.")
+        return name
+
+    def is_confirmed(self, name: str) -> bool:
+        from .models import Chat
+
+        return Chat.objects.filter(file=name).exists()
+
+    def claim(self, name: str) -> bool:
+        """Reserves a confirmed upload for one chat, False if already taken.
+
+        Concurrent confirms of a token all pass confirm, only the first to
+        claim it creates a chat. Claims outlive the token.
+        """
+
+        return bool(get_redis_client().set(self.claim_key(name), 1, nx=True, ex=self.ttl))
+
+    def release(self, name: str) -> None:
+        get_redis_client().delete(self.claim_key(name))
+
+    @staticmethod
+    def claim_key(name: str) -> str:
+        return f"presigned:{name}"
+
+    def load_token(self, token: str, user_id: int = None) -> str:
+        try:
+            payload = signing.loads(token, salt=token_salt, max_age=self.ttl)
+        except signing.BadSignature:
+            raise ValueError("Invalid or expired upload token.")
+        if user_id is not None and payload["user"] != user_id:
+            raise ValueError("Invalid or expired upload token.")
+        return payload["name"]
+
+    @abstractmethod
+    def get_upload_target(self, name: str, token: str) -> dict:
+        """Returns the url, method and form fields the client uploads with."""
+        pass
+
+
+class S3PresignedUpload(BasePresignedUpload):
+    """Presigned S3 POST, size limited by the policy."""
+
+    def get_upload_target(self, name: str, token: str) -> dict:
+        key = self.storage._normalize_name(self.storage._clean_name(name))
+        client = self.storage.bucket.meta.client
+        post = client.generate_presigned_post(
+            Bucket=self.storage.bucket_name, Key=key,
+            Conditions=[["content-length-range", 1, self.max_size]],
+            ExpiresIn=self.ttl
+        )
+        return {"url": post["url"], "method": "POST", "fields": post["fields"]}
+
+
+class LocalPresignedUpload(BasePresignedUpload):
+    """PUT of the raw file to this server, authorized by the token."""
+
+    def get_upload_target(self, name: str, token: str) -> dict:
+        url = reverse("chat_uploads-local-upload", kwargs={"token": token})
+        return {"url": url, "method": "PUT", "fields": {}}
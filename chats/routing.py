@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .consumers import ChatConsumer
+
+
+websocket_urlpatterns = [
+    path("v1/ws/chats/", ChatConsumer.as_asgi()),
+]
@@ -0,0 +1,124 @@
+"""
+Full-text search over chat messages.
+
+The index lives in the database and is kept up to date by it, so chats
+saved any way, bulk_create included, are searchable right away:
+
+- PostgreSQL: a generated `search_vector` tsvector column with a GIN index.
+- SQLite: the `chats_chat_fts` FTS5 table, synced by triggers.
+
+Both are created by migration 0012_chat_search_index.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, FloatField, QuerySet
+from django.db.models.expressions import RawSQL, Value
+
+
+# Text search configuration of the search_vector column.
+PG_SEARCH_CONFIG = "english"
+SQLITE_FTS_TABLE = "chats_chat_fts"
+
+SQLITE_TRIGGERS = {
+    "chats_chat_fts_insert": f"""
+        CREATE TRIGGER IF NOT EXISTS chats_chat_fts_insert AFTER INSERT ON chats_chat
+        BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, message) VALUES (new.id, new.message);
+        END
+    """,
+    "chats_chat_fts_delete": f"""
+        CREATE TRIGGER IF NOT EXISTS chats_chat_fts_delete AFTER DELETE ON chats_chat
+        BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, message)
+            VALUES ('delete', old.id, old.message);
+        END
+    """,
+    "chats_chat_fts_update": f"""
+        CREATE TRIGGER IF NOT EXISTS chats_chat_fts_update AFTER UPDATE OF message ON chats_chat
+        BEGIN
+            INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, message)
+            VALUES ('delete', old.id, old.message);
+            INSERT INTO {SQLITE_FTS_TABLE}(rowid, message) VALUES (new.id, new.message);
+        END
+    """,
+}
+
+# Longest query, in words, searched for.
+max_terms = 10
+
+
+def search_terms(query: str) -> list:
+    """Words of a search query, operators and punctuation are dropped."""
+
+    return re.findall(r"\w+", query)[:max_terms]
+
+
+def search_chats(queryset: QuerySet, query: str) -> QuerySet:
+    """Chats of `queryset` that match all words of `query`, best match first.
+
+    Matches are annotated with `rank`, higher is better.
+    """
+
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+
+    table = queryset.model._meta.db_table
+    if connection.vendor == "postgresql":
+        tsquery = f"plainto_tsquery('{PG_SEARCH_CONFIG}', %s)"
+        text = " ".join(terms)
+        queryset = queryset.filter(RawSQL(
+            f"{table}.search_vector @@ {tsquery}", (text,), output_field=BooleanField()
+        )).annotate(rank=RawSQL(
+            f"ts_rank({table}.search_vector, {tsquery})", (text,),
+            output_field=FloatField()
+        ))
+    elif connection.vendor == "sqlite":
+        # Quoted terms are matched as plain words, never as FTS5 syntax.
+        match = " ".join(f'"{term}"' for term in terms)
+        fts_match = f"SELECT rowid, rank FROM {SQLITE_FTS_TABLE} WHERE {SQLITE_FTS_TABLE} MATCH %s"
+        queryset = queryset.filter(
+            id__in=RawSQL(f"SELECT rowid FROM ({fts_match})", (match,))
+        ).annotate(rank=RawSQL(
+            # bm25 rank, lower is better
+            f"(SELECT -m.rank FROM ({fts_match}) m WHERE m.rowid = {table}.id)",
+            (match,), output_field=FloatField()
+        ))
+    else:
+        # No index, good enough for tests on other databases.
+        for term in terms:
+            queryset = queryset.filter(message__icontains=term)
+        queryset = queryset.annotate(rank=Value(0.0, output_field=FloatField()))
+
+    return queryset.order_by("-rank", "-created_at", "-id")
+
+
+def ensure_sqlite_triggers(using: str = "default") -> None:
+    """Recreate the FTS5 triggers dropped when SQLite rebuilds the chats table,
+    which it does for most later migrations of Chat, and reindex."""
+
+    from django.db import connections
+
+    db = connections[using]
+    if db.vendor != "sqlite":
+        return
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name = %s",
+            [SQLITE_FTS_TABLE]
+        )
+        if cursor.fetchone() is None:
+            return
+        cursor.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'chats_chat'"
+        )
+        existing = {row[0] for row in cursor.fetchall()}
+        if SQLITE_TRIGGERS.keys() <= existing:
+            return
+        for sql in SQLITE_TRIGGERS.values():
+            cursor.execute(sql)
+        cursor.execute(
+            f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"
+        )
@@ -1,3 +1,6 @@
+import mimetypes
+from typing import List
+
 from django.core.exceptions import ValidationError
 from django.dispatch import receiver
 
@@ -7,7 +10,12 @@ from drf_spectacular.utils import extend_schema_field, OpenApiTypes
 
 from common_app.mixins.serializer_mixins import DisplaySerializerMixin
 
-from .models import Chat
+from registration.serializers import BriefUserDisplaySerializer
+
+from common_app.utils.general_utils import app_settings
+
+from .models import Chat, Conversation, ChatUpload, ReadReceipt
+from .utils import SyncCursor
 
 
 
@@ -44,7 +52,8 @@ class ChatGenericSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Chat
-        fields = "__all__"
+        exclude = ["idempotency_key"]
+        read_only_fields = ["conversation", "previews", "reply_count"]
 
 
 class ChatCreateSerializer(ChatGenericSerializer):
@@ -54,6 +63,85 @@ class ChatCreateSerializer(ChatGenericSerializer):
             "receiver": {"required": True}
         }
 
+class ChatBulkCreateSerializer(serializers.Serializer):
+    """Sends one chat message to many friends at once."""
+
+    receivers = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1, max_length=100,
+        help_text="User ID's of friends to send this chat to."
+    )
+
+    message = serializers.CharField(
+        max_length=500, required=False, allow_null=True,
+        help_text="Chat message"
+    )
+
+    location = serializers.URLField(
+        required=False, allow_null=True,
+        help_text="A location url"
+    )
+
+    file = serializers.FileField(
+        required=False, allow_null=True,
+        help_text="A file you wish to upload"
+    )
+
+    def validate(self, attrs):
+        # validate that some information is passed
+        if all(attrs.get(f) is None for f in ("message", "location", "file")):
+            raise ValidationError(
+                "A message or location or file is required.",
+                "no_information"
+            )
+
+        # validate that they are friends, in a single query
+        receiver_ids = list(dict.fromkeys(attrs["receivers"]))
+        self.friends = {
+            friend.id: friend
+            for friend in self.get_user().friends.filter(id__in=receiver_ids)
+        }
+        if not self.friends:
+            raise ValidationError(
+                "Only friends can send chat messages to eachother",
+                "non_friends"
+            )
+        attrs["receivers"] = receiver_ids
+
+        return attrs
+
+    def create(self, validated_data: dict) -> List[dict]:
+        """Saves a chat per friend, returns a result per receiver."""
+
+        user = self.get_user()
+        receiver_ids = validated_data.pop("receivers")
+
+        # store the file once, all chats point at the same file.
+        file = validated_data.pop("file", None)
+        if file is not None:
+            file_field = Chat._meta.get_field("file")
+            validated_data["file"] = file_field.storage.save(
+                file_field.generate_filename(None, file.name), file
+            )
+
+        chats = Chat.objects.bulk_create_chats([
+            Chat(sender=user, receiver=self.friends[receiver_id], **validated_data)
+            for receiver_id in receiver_ids if receiver_id in self.friends
+        ])
+        chats_by_receiver = {chat.receiver_id: chat for chat in chats}
+
+        return [
+            {
+                "receiver": receiver_id,
+                "status": "created" if receiver_id in chats_by_receiver else "non_friends",
+                "chat": chats_by_receiver.get(receiver_id)
+            }
+            for receiver_id in receiver_ids
+        ]
+
+    def get_user(self):
+        return self.context["request"].user
+
+
 class ChatDisplaySerializer(DisplaySerializerMixin, ChatGenericSerializer):
 
     sender = serializers.SerializerMethodField(
@@ -64,6 +152,11 @@ class ChatDisplaySerializer(DisplaySerializerMixin, ChatGenericSerializer):
         help_text="The receiver of this chat"
     )
 
+    previews = serializers.SerializerMethodField(
+        help_text="Urls of resized copies of an image file, by size. The "
+                  "original file's url until they are ready."
+    )
+
     @extend_schema_field(OpenApiTypes.STR)
     def get_sender(self, instance):
         return instance.sender.get_full_name()
@@ -72,4 +165,238 @@ class ChatDisplaySerializer(DisplaySerializerMixin, ChatGenericSerializer):
     def get_receiver(self, instance):
         return instance.receiver.get_full_name()
 
-    
\ No newline at end of file
+    @extend_schema_field({"type": "object", "additionalProperties": {"type": "string"}})
+    def get_previews(self, instance):
+        if not instance.file:
+            return {}
+        mime_type, _ = mimetypes.guess_type(instance.file.name)
+        if not (mime_type and mime_type.startswith("image/")):
+            return {}
+
+        storage = instance.file.storage
+        request = self.context.get("request")
+        previews = {}
+        for size_name in app_settings["CHAT_PREVIEW_SIZES"]:
+            name = instance.previews.get(size_name)
+            url = storage.url(name) if name else instance.file.url
+            previews[size_name] = request.build_absolute_uri(url) if request else url
+        return previews
+
+
+class ConversationDisplaySerializer(DisplaySerializerMixin, serializers.ModelSerializer):
+    """Inbox entry, shown from the perspective of the logged in user."""
+
+    peer = serializers.SerializerMethodField(
+        help_text="The other participant of this conversation"
+    )
+
+    last_chat = ChatDisplaySerializer(allow_null=True)
+
+    @extend_schema_field(BriefUserDisplaySerializer)
+    def get_peer(self, instance):
+        user = self.context["request"].user
+        return BriefUserDisplaySerializer(instance.peer_of(user)).data
+
+    class Meta:
+        model = Conversation
+        fields = [
+            "id", "peer", "last_chat", "last_activity_at", "chat_count",
+            "archived_count"
+        ]
+
+
+class SyncUrlParamsSerializer(serializers.Serializer):
+    """Serializes URL params for incremental chat sync"""
+
+    cursor = serializers.ListSerializer(
+        child=serializers.CharField(), max_length=1, required=False,
+        help_text=(
+            "Cursor returned by the previous sync. "
+            "Leave out to sync from the beginning."
+        )
+    )
+
+    def validate_cursor(self, cursor_list: List[str]) -> SyncCursor:
+        try:
+            return SyncCursor.decode(cursor_list[0])
+        except ValueError:
+            raise ValidationError("Invalid cursor", "invalid_cursor")
+
+
+class ChatSyncSerializer(serializers.Serializer):
+    """Chats created, modified or deleted since the last sync."""
+
+    chats = ChatDisplaySerializer(
+        many=True, help_text="Chats created or modified since the cursor."
+    )
+    deleted = serializers.ListField(
+        child=serializers.IntegerField(),
+        help_text="IDs of chats deleted since the cursor."
+    )
+    cursor = serializers.CharField(
+        help_text="Cursor to send with the next sync."
+    )
+    has_more = serializers.BooleanField(
+        help_text="More changes are waiting, sync again right away."
+    )
+
+
+class ThreadUrlParamsSerializer(serializers.Serializer):
+    """Serializes URL params for reply threads"""
+
+    depth = serializers.ListSerializer(
+        child=serializers.IntegerField(min_value=1), max_length=1, required=False,
+        help_text="Hops to walk up to ancestors and down to replies."
+    )
+
+    def validate_depth(self, depth_list: List[int]) -> int:
+        return min(depth_list[0], app_settings["CHAT_THREAD_MAX_DEPTH"])
+
+
+class SearchUrlParamsSerializer(serializers.Serializer):
+    """Serializes URL params for chat search"""
+
+    q = serializers.ListSerializer(
+        child=serializers.CharField(max_length=200), min_length=1, max_length=1,
+        help_text="Words to search for, chats must contain all of them."
+    )
+
+    def validate_q(self, q_list: List[str]) -> str:
+        return q_list[0]
+
+
+class ExportUrlParamsSerializer(serializers.Serializer):
+    """Serializes URL params for chat exports"""
+
+    # `format` is taken by DRF's format suffixes.
+    export_format = serializers.ListSerializer(
+        child=serializers.ChoiceField(choices=["ndjson", "csv"]),
+        max_length=1, required=False,
+        help_text="Format of the export file, ndjson by default."
+    )
+
+    def validate_export_format(self, format_list: List[str]) -> str:
+        return format_list[0]
+
+
+class ChatSearchResultSerializer(ChatDisplaySerializer):
+
+    rank = serializers.FloatField(help_text="Relevance, higher is better.")
+
+
+class ChatThreadSerializer(ChatDisplaySerializer):
+
+    depth = serializers.IntegerField(
+        help_text="Hops from the requested chat, negative for ancestors."
+    )
+
+
+class ReadReceiptSerializer(serializers.ModelSerializer):
+    """Marks the chats a peer sent the logged in user as read."""
+
+    class Meta:
+        model = ReadReceipt
+        fields = ["peer", "last_read_chat", "read_at"]
+        read_only_fields = ["last_read_chat", "read_at"]
+
+
+class UnreadCountsSerializer(serializers.Serializer):
+
+    total = serializers.IntegerField(help_text="Number of unread chats.")
+    peers = serializers.DictField(
+        child=serializers.IntegerField(),
+        help_text="Number of unread chats by user ID of the sender."
+    )
+
+
+class ChatBulkResultSerializer(serializers.Serializer):
+    """Outcome of a bulk send for one receiver."""
+
+    receiver = serializers.IntegerField(help_text="User ID of the receiver")
+    status = serializers.ChoiceField(
+        choices=["created", "non_friends"],
+        help_text="'non_friends' receivers were skipped."
+    )
+    chat = ChatDisplaySerializer(
+        allow_null=True, help_text="The created chat, null if skipped."
+    )
+
+
+class ChatUploadSerializer(serializers.ModelSerializer):
+    """Starts and shows progress of a chunked upload."""
+
+    chunk_count = serializers.IntegerField(
+        read_only=True, help_text="Number of chunks to upload."
+    )
+
+    received_chunks = serializers.SerializerMethodField(
+        help_text="Indexes of chunks already received, resume with the others."
+    )
+
+    def validate_size(self, size: int) -> int:
+        max_size = app_settings["CHAT_UPLOAD_MAX_SIZE"]
+        if size > max_size:
+            raise ValidationError(
+                f"File can't be larger than {max_size} bytes.", "file_too_large"
+            )
+        return size
+
+    def create(self, validated_data: dict) -> ChatUpload:
+        validated_data["owner"] = self.context["request"].user
+        validated_data["chunk_size"] = app_settings["CHAT_UPLOAD_CHUNK_SIZE"]
+        return super().create(validated_data)
+
+    @extend_schema_field(serializers.ListField(child=serializers.IntegerField()))
+    def get_received_chunks(self, instance: ChatUpload) -> List[int]:
+        return list(instance.parts.order_by("index").values_list("index", flat=True))
+
+    class Meta:
+        model = ChatUpload
+        fields = [
+            "id", "filename", "size", "chunk_size", "chunk_count",
+            "received_chunks", "chat", "created_at"
+        ]
+        read_only_fields = ["chunk_size", "chat"]
+
+
+class ChatUploadCommitSerializer(ChatCreateSerializer):
+    """Creates the chat an upload is attached to."""
+
+    def validate(self, attrs):
+        # The file is already in storage, it isn't sent with the chat.
+        attrs["file"] = self.context["file_name"]
+        return super().validate(attrs)
+
+    class Meta(ChatCreateSerializer.Meta):
+        read_only_fields = ["conversation", "file", "previews", "reply_count"]
+
+
+class PresignedUploadSerializer(serializers.Serializer):
+    filename = serializers.CharField(max_length=255, write_only=True)
+    url = serializers.CharField(read_only=True)
+    method = serializers.CharField(read_only=True)
+    fields = serializers.DictField(child=serializers.CharField(), read_only=True)
+    name = serializers.CharField(read_only=True)
+    token = serializers.CharField(read_only=True)
+    expires_in = serializers.IntegerField(read_only=True)
+
+
+class PresignedUploadConfirmSerializer(ChatCreateSerializer):
+    """Creates the chat a file uploaded straight to storage is attached to."""
+
+    token = serializers.CharField(
+        write_only=True, help_text="Token returned when the upload was presigned."
+    )
+
+    def validate_token(self, value):
+        try:
+            return self.context["presigned"].confirm(value)
+        except ValueError as e:
+            raise ValidationError(str(e), "invalid_upload")
+
+    def validate(self, attrs):
+        attrs["file"] = attrs.pop("token")
+        return super().validate(attrs)
+
+    class Meta(ChatCreateSerializer.Meta):
+        read_only_fields = ["conversation", "file", "previews", "reply_count"]
@@ -0,0 +1,98 @@
+"""Keeps data derived from chats in sync with the chats table."""
+
+import mimetypes
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete, post_migrate
+from django.dispatch import receiver, Signal
+
+from .models import Chat, Conversation
+from .search import ensure_sqlite_triggers
+from .tasks import queue_chat_previews
+from .timelines import Timelines
+from .unread import UnreadCounters
+
+
+# Sent with `chats`, a list of newly saved chats. Unlike post_save it is
+# also sent for chats saved with ChatManager.bulk_create_chats, listeners
+# that keep derived data in sync should connect to this signal.
+chats_created = Signal()
+
+
+@receiver(pre_save, sender=Chat)
+def set_chat_conversation(sender, instance: Chat, **kwargs):
+    if instance.conversation_id is None and instance.receiver_id is not None:
+        instance.conversation = Conversation.objects.get_for_pair(
+            instance.sender_id, instance.receiver_id
+        )
+
+
+@receiver(post_save, sender=Chat)
+def send_chats_created(sender, instance: Chat, created, **kwargs):
+    if created:
+        chats_created.send(sender=sender, chats=[instance])
+
+
+@receiver(chats_created)
+def update_conversations_on_create(sender, chats, **kwargs):
+    Conversation.objects.record_chats(chats)
+
+
+@receiver(chats_created)
+def update_reply_counts_on_create(sender, chats, **kwargs):
+    Chat.objects.record_replies(chats)
+
+
+@receiver(chats_created)
+def update_unread_counters_on_create(sender, chats, **kwargs):
+    transaction.on_commit(partial(UnreadCounters().record_chats, chats))
+
+
+@receiver(chats_created)
+def update_timelines_on_create(sender, chats, **kwargs):
+    transaction.on_commit(partial(Timelines().record_chats, chats))
+
+
+@receiver(chats_created)
+def generate_previews_on_create(sender, chats, **kwargs):
+    file_names = {chat.file.name for chat in chats if chat.file}
+    for file_name in file_names:
+        mime_type, _ = mimetypes.guess_type(file_name)
+        if mime_type and mime_type.startswith("image/"):
+            # the task reads the chats, wait until they are committed
+            transaction.on_commit(partial(queue_chat_previews, file_name))
+
+
+@receiver(post_delete, sender=Chat)
+def update_conversation_on_delete(sender, instance: Chat, **kwargs):
+    if instance.conversation_id is not None:
+        Conversation.objects.refresh_summary(instance.conversation_id)
+
+
+@receiver(post_delete, sender=Chat)
+def update_reply_count_on_delete(sender, instance: Chat, **kwargs):
+    if instance.respond_to_id is not None:
+        Chat.objects.release_reply(instance.respond_to_id)
+
+
+@receiver(post_delete, sender=Chat)
+def invalidate_unread_counters_on_delete(sender, instance: Chat, **kwargs):
+    if instance.receiver_id is not None:
+        # the chat may have been unread, recount
+        transaction.on_commit(partial(UnreadCounters().invalidate, instance.receiver_id))
+
+
+@receiver(post_delete, sender=Chat)
+def update_timelines_on_delete(sender, instance: Chat, **kwargs):
+    chat = {
+        "id": instance.id, "sender_id": instance.sender_id,
+        "receiver_id": instance.receiver_id
+    }
+    transaction.on_commit(partial(Timelines().remove_chats, [chat]))
+
+
+@receiver(post_migrate)
+def restore_search_triggers(sender, using, **kwargs):
+    if sender.name == "chats":
+        ensure_sqlite_triggers(using)
@@ -0,0 +1,141 @@
+"""
+Tasks of the chats app. Previews run on a Celery worker, or on a
+background thread of the web process when the CHAT_PREVIEWS_ASYNC app
+setting is off, never on the request thread. Archival is scheduled with
+Celery beat, or the archive_chats management command.
+
+Functions are first order and kwargs are JSON serializable.
+"""
+
+import io
+import logging
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from django.utils import timezone
+
+from celery import shared_task
+from kombu.exceptions import OperationalError
+from PIL import Image, UnidentifiedImageError
+
+from common_app.utils.general_utils import app_settings
+
+
+logger = logging.getLogger(__name__)
+
+# Formats worth making previews of, animated images keep their first frame.
+PREVIEW_SOURCE_FORMATS = {"JPEG", "PNG", "GIF", "WEBP", "BMP"}
+
+# Runs previews without a Celery worker, one at a time per process.
+preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-previews")
+
+
+def preview_name(file_name: str, size_name: str) -> str:
+    """Storage name of a preview, next to the original file."""
+
+    directory, base = posixpath.split(file_name)
+    stem = posixpath.splitext(base)[0]
+    return posixpath.join(directory, "previews", f"{stem}_{size_name}.jpg")
+
+
+@shared_task
+def task_generate_chat_previews(**kwargs):
+    """Store resized JPEG copies of an image file and record them on the
+    chats the file is attached to.
+
+    Parameters
+    ----------
+    file_name: str
+        Storage name of the chat file
+    """
+
+    from .models import Chat
+
+    file_name = kwargs["file_name"]
+    storage = Chat._meta.get_field("file").storage
+
+    try:
+        with storage.open(file_name, "rb") as file:
+            image = Image.open(file)
+            if image.format not in PREVIEW_SOURCE_FORMATS:
+                return
+            image.load()
+    except (UnidentifiedImageError, OSError):
+        # not an image, or gone since the chat was created
+        return
+
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        image = background
+
+    previews = {}
+    for size_name, max_side in app_settings["CHAT_PREVIEW_SIZES"].items():
+        preview = image.copy()
+        preview.thumbnail((max_side, max_side))
+        buffer = io.BytesIO()
+        preview.save(
+            buffer, "JPEG", quality=app_settings["CHAT_PREVIEW_QUALITY"],
+            optimize=True, progressive=True
+        )
+        name = preview_name(file_name, size_name)
+        if storage.exists(name):
+            storage.delete(name)
+        previews[size_name] = storage.save(name, ContentFile(buffer.getvalue()))
+
+    # Chats sent in bulk share one file. modified_at is bumped so the
+    # previews reach clients through sync.
+    Chat.objects.filter(file=file_name).update(
+        previews=previews, modified_at=timezone.now()
+    )
+
+
+def queue_chat_previews(file_name: str):
+    if app_settings["CHAT_PREVIEWS_ASYNC"]:
+        try:
+            task_generate_chat_previews.delay(file_name=file_name)
+            return
+        except OperationalError:
+            # runs after the chat is committed, the request mustn't fail
+            logger.exception("Previews of %s not queued, generating them here", file_name)
+    preview_executor.submit(generate_chat_previews_in_background, file_name)
+
+
+def generate_chat_previews_in_background(file_name: str):
+    try:
+        task_generate_chat_previews(file_name=file_name)
+    except Exception:
+        # previews are optional, the original file is served instead
+        logger.exception("Previews of %s not generated", file_name)
+    finally:
+        # outside a request, nothing else closes this thread's connection
+        close_old_connections()
+
+
+@shared_task
+def task_archive_chats(**kwargs):
+    """Archive old chats, see chats.archive.
+
+    Parameters
+    ----------
+    older_than_days: int, optional
+        Archive chats older than this, defaults to CHAT_ARCHIVE_AFTER
+    batch_size: int, optional
+        Chats moved per transaction, defaults to CHAT_ARCHIVE_BATCH_SIZE
+    max_batches: int, optional
+        Stop after this many batches, the next run picks up the rest
+    """
+
+    from .archive import archive_chats
+
+    older_than_days = kwargs.get("older_than_days")
+    archived = archive_chats(
+        older_than=timedelta(days=older_than_days) if older_than_days else None,
+        batch_size=kwargs.get("batch_size"), max_batches=kwargs.get("max_batches")
+    )
+    logger.info("Archived %s chats", archived)
+    return archived
@@ -1,22 +1,59 @@
+import asyncio
+import csv
+import io
 import json
+import os
+import threading
+import time
+import uuid
+from unittest import mock
+from datetime import timedelta
 from decouple import config
 
 
-from django.test import TestCase, Client
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.testing import WebsocketCommunicator
+
+from django.test import TestCase, Client, override_settings
 from django.conf import settings
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.http import StreamingHttpResponse
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 
 from rest_framework import status
 
+from kombu.exceptions import OperationalError
+from PIL import Image
+
+from redis.exceptions import RedisError
+
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from common_app import throttling
+from common_app.handlers import StreamingASGIHandler
+from common_app.idempotency import IdempotentResponses
 from common_app.serializers import ValidationErrorSerializer, URLParamsValidationErrorSerializer
 from common_app.utils.test_utils import TestUtilsMixin
-from common_app.utils.general_utils import app_settings
+from common_app.utils.general_utils import (
+    InstrumentedPipeline, RedisTimePersist, app_settings, redis_metrics
+)
 
 from exceptions_and_logging.serializers import ErrorSerializer
 
-from ..models import Chat
+from registration.presence import presence
+
+from afex_app.asgi import application
+
+from .. import tasks
+from ..models import Chat, ChatTombstone, ReadReceipt
+from ..presigned import LocalPresignedUpload
+from ..timelines import Timelines
+from ..views.chat import ChatViewset
+from ..unread import UnreadCounters
 
 
 
@@ -26,6 +63,11 @@ class TestViews(TestUtilsMixin, TestCase):
 
     def setUp(self) -> None:
         self.client = Client()
+        self.clear_redis_keys("timeline:*", "friends:*")
+        backend = app_settings["THROTTLE_BACKEND"]
+        self.addCleanup(app_settings.__setitem__, "THROTTLE_BACKEND", backend)
+        app_settings["THROTTLE_BACKEND"] = "LocalSlidingWindow"
+        throttling.get_sliding_window().clear()
 
     
     def test_user_viewsets(self):
@@ -90,3 +132,1030 @@ class TestViews(TestUtilsMixin, TestCase):
 
 
 
+
+    def test_list_pagination(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        for i in range(25):
+            Chat.objects.create(sender=user_1, receiver=user_2, message=f"chat {i}")
+
+        self.authenticate(user_1)
+
+        # test success, walk all pages with the next cursor (200)
+        seen_ids = []
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertFalse(resp.has_header("count"))
+        self.assertEqual(resp["previous"], "None")
+        while True:
+            seen_ids += [chat["id"] for chat in resp.json()]
+            if resp["next"] == "None":
+                break
+            resp = self.client.get(resp["next"], **self.headers)
+            self.assertEqual(resp.status_code, 200)
+        expected_ids = list(
+            Chat.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.assertEqual(seen_ids, expected_ids)
+
+        # test success, previous cursor returns the page before (200)
+        resp = self.client.get(url, **self.headers)
+        first_page = [chat["id"] for chat in resp.json()]
+        resp = self.client.get(resp["next"], **self.headers)
+        resp = self.client.get(resp["previous"], **self.headers)
+        self.assertEqual([chat["id"] for chat in resp.json()], first_page)
+
+        # test failure, tampered cursor (404)
+        resp = self.client.get(f"{url}?cursor=not-a-cursor", **self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_conversations(self):
+        url = "/v1/conversations/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_3 = self.create_user(email="friend@three.com")
+        user_1.friends.add(user_2, user_3)
+
+        Chat.objects.create(sender=user_1, receiver=user_2, message="Hi two")
+        Chat.objects.create(sender=user_2, receiver=user_1, message="Hi one")
+        Chat.objects.create(sender=user_3, receiver=user_1, message="Hi from three")
+        Chat.objects.create(sender=user_2, receiver=user_3, message="Not for one")
+
+        # test success, a single conversation per pair, latest activity first (200)
+        self.authenticate(user_1)
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        inbox = resp.json()
+        self.assertEqual(len(inbox), 2)
+        self.assertEqual(inbox[0]["peer"]["id"], user_3.id)
+        self.assertEqual(inbox[0]["last_chat"]["message"], "Hi from three")
+        self.assertEqual(inbox[1]["peer"]["id"], user_2.id)
+        self.assertEqual(inbox[1]["chat_count"], 2)
+
+        # test success, chats of a conversation (200)
+        resp = self.client.get(f"{url}{inbox[1]['id']}/chats/", **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(
+            [chat["message"] for chat in resp.json()], ["Hi one", "Hi two"]
+        )
+
+        # test success, summary follows deletes (204)
+        last_chat_id = inbox[1]["last_chat"]["id"]
+        resp = self.client.delete(f"/v1/chats/{last_chat_id}/", **self.headers)
+        self.assertEqual(resp.status_code, 204)
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.json()[1]["chat_count"], 1)
+        self.assertEqual(resp.json()[1]["last_chat"]["message"], "Hi two")
+
+        # test failure, conversation of other users (404)
+        other = Chat.objects.get(message="Not for one").conversation
+        resp = self.client.get(f"{url}{other.id}/chats/", **self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_query_counts(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        Chat.objects.create(sender=user_1, receiver=user_2, message="First chat")
+        self.authenticate(user_1)
+
+        def count_queries(method, *args, **kwargs):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = method(*args, **kwargs)
+            self.assertTrue(status.is_success(resp.status_code))
+            return len(ctx.captured_queries)
+
+        # test success, list costs the same for 1 or a full page of chats
+        Timelines().rebuild(user_1.id)
+        single_chat_queries = count_queries(self.client.get, url, **self.headers)
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(19):
+                Chat.objects.create(sender=user_2, receiver=user_1, message=f"chat {i}")
+        full_page_queries = count_queries(self.client.get, url, **self.headers)
+        self.assertEqual(single_chat_queries, full_page_queries)
+
+        # test success, create costs the same whatever the conversation size
+        params = {"receiver": user_2.id, "message": "Hello"}
+        user_1.is_friends_with(user_2)  # caches the friends of user_1
+        create_queries = count_queries(
+            self.client.post, url, params, **self.headers
+        )
+        for i in range(5):
+            self.assertEqual(
+                count_queries(self.client.post, url, params, **self.headers),
+                create_queries
+            )
+
+        # test success, destroy costs the same whatever the number of replies
+        chat_1, chat_2 = Chat.objects.filter(sender=user_1)[:2]
+        Chat.objects.create(
+            sender=user_2, receiver=user_1, message="Reply", respond_to=chat_1
+        )
+        for i in range(5):
+            Chat.objects.create(
+                sender=user_2, receiver=user_1, message="Reply", respond_to=chat_2
+            )
+        destroy_queries = count_queries(
+            self.client.delete, f"{url}{chat_1.id}/", **self.headers
+        )
+        self.assertEqual(
+            count_queries(self.client.delete, f"{url}{chat_2.id}/", **self.headers),
+            destroy_queries
+        )
+
+    def test_sync(self):
+        url = "/v1/chats/sync/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_3 = self.create_user(email="friend@three.com")
+        chat_1 = Chat.objects.create(sender=user_1, receiver=user_2, message="One")
+        chat_2 = Chat.objects.create(sender=user_2, receiver=user_1, message="Two")
+        Chat.objects.create(sender=user_2, receiver=user_3, message="Not for one")
+        self.authenticate(user_1)
+
+        # test success, full sync without a cursor (200)
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([c["id"] for c in resp.json()["chats"]], [chat_1.id, chat_2.id])
+        self.assertEqual(resp.json()["deleted"], [])
+        cursor, etag = resp.json()["cursor"], resp["ETag"]
+
+        # test success, unchanged inbox is not modified (304)
+        sync_url = f"{url}?cursor={cursor}"
+        resp = self.client.get(sync_url, **self.headers)
+        self.assertEqual(resp.json()["chats"], [])
+        resp = self.client.get(sync_url, HTTP_IF_NONE_MATCH=resp["ETag"], **self.headers)
+        self.assertEqual(resp.status_code, 304)
+
+        # test success, only changes after the cursor are returned (200)
+        chat_3 = Chat.objects.create(sender=user_1, receiver=user_2, message="Three")
+        chat_1.message = "One edited"
+        chat_1.save()
+        resp = self.client.delete(f"/v1/chats/{chat_2.id}/", **self.headers)
+        self.assertEqual(resp.status_code, 204)
+        resp = self.client.get(sync_url, HTTP_IF_NONE_MATCH=etag, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([c["id"] for c in resp.json()["chats"]], [chat_3.id, chat_1.id])
+        self.assertEqual(resp.json()["deleted"], [chat_2.id])
+        self.assertFalse(resp.json()["has_more"])
+
+        # test success, chats committed after later ones were synced are
+        # returned once (200)
+        cursor = resp.json()["cursor"]
+        late = Chat.objects.create(sender=user_2, receiver=user_1, message="Late")
+        Chat.objects.filter(pk=late.pk).update(
+            modified_at=chat_3.modified_at - timedelta(seconds=1)
+        )
+        resp = self.client.get(f"{url}?cursor={cursor}", **self.headers)
+        self.assertEqual([c["id"] for c in resp.json()["chats"]], [late.id])
+        resp = self.client.get(f"{url}?cursor={resp.json()['cursor']}", **self.headers)
+        self.assertEqual(resp.json()["chats"], [])
+
+        # test failure, bad cursor (400)
+        resp = self.client.get(f"{url}?cursor=bad", **self.headers)
+        self.assertEqual(resp.status_code, 400)
+        self.assertTrue(URLParamsValidationErrorSerializer(data=resp.json()).is_valid())
+
+    def test_bulk_create(self):
+        url = "/v1/chats/bulk/"
+        user = self.create_user(email="sender@one.com")
+        friends = [self.create_user(email=f"friend@{i}.com") for i in range(10)]
+        stranger = self.create_user(email="stranger@one.com")
+        user.friends.add(*friends)
+        self.authenticate(user)
+
+        # test success, one result per receiver, non friends skipped (201)
+        params = {
+            "receivers": [friends[0].id, stranger.id, friends[1].id],
+            "message": "Hello everyone"
+        }
+        resp = self.client.post(url, params, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        results = resp.json()
+        self.assertEqual(
+            [r["status"] for r in results], ["created", "non_friends", "created"]
+        )
+        self.assertIsNone(results[1]["chat"])
+        self.assertEqual(Chat.objects.filter(sender=user).count(), 2)
+        inbox = self.client.get("/v1/conversations/", **self.headers).json()
+        self.assertEqual(len(inbox), 2)
+        self.assertEqual(inbox[0]["last_chat"]["message"], "Hello everyone")
+
+        # test success, queries don't grow with the number of receivers
+        def count_queries(receivers):
+            params["receivers"] = receivers
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(url, params, **self.headers)
+            self.assertEqual(resp.status_code, 201)
+            return len(ctx.captured_queries)
+
+        few_receivers_queries = count_queries([friends[2].id])
+        many_receivers_queries = count_queries([f.id for f in friends[3:]])
+        self.assertEqual(few_receivers_queries, many_receivers_queries)
+        self.assertEqual(Chat.objects.filter(sender=user).count(), 10)
+
+        # test failure, no friends among receivers (400)
+        params["receivers"] = [stranger.id]
+        resp = self.client.post(url, params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test failure, no information (400)
+        resp = self.client.post(url, {"receivers": [friends[0].id]}, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_chunked_upload(self):
+        chunk_size = app_settings["CHAT_UPLOAD_CHUNK_SIZE"]
+        self.addCleanup(app_settings.__setitem__, "CHAT_UPLOAD_CHUNK_SIZE", chunk_size)
+        app_settings["CHAT_UPLOAD_CHUNK_SIZE"] = 4
+
+        url = "/v1/chat_uploads/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        self.authenticate(user_1)
+        content = b"0123456789"
+
+        def put_chunk(index, chunk):
+            return self.client.put(
+                f"{url}{upload_id}/chunks/{index}/", chunk,
+                content_type="application/octet-stream",
+                HTTP_AUTHORIZATION=self.headers["HTTP_AUTHORIZATION"]
+            )
+
+        # test success, start upload (201)
+        resp = self.client.post(url, {"filename": "notes.txt", "size": len(content)}, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()["chunk_count"], 3)
+        upload_id = resp.json()["id"]
+
+        # test success, chunks can arrive in any order (200)
+        resp = put_chunk(2, content[8:])
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["received_chunks"], [2])
+
+        # test failure, wrong chunk size and index (400)
+        self.assertEqual(put_chunk(0, content[:3]).status_code, 400)
+        self.assertEqual(put_chunk(3, content[:2]).status_code, 400)
+
+        # test failure, commit with missing chunks (400)
+        commit_params = {"receiver": user_2.id, "message": "My notes"}
+        resp = self.client.post(f"{url}{upload_id}/commit/", commit_params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test success, resume with the chunks left (200)
+        resp = self.client.get(f"{url}{upload_id}/", **self.headers)
+        self.assertEqual(resp.json()["received_chunks"], [2])
+        put_chunk(0, content[:4])
+        resp = put_chunk(1, content[4:8])
+        self.assertEqual(resp.json()["received_chunks"], [0, 1, 2])
+
+        # test success, commit attaches the assembled file to a chat (201)
+        resp = self.client.post(f"{url}{upload_id}/commit/", commit_params, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        chat = Chat.objects.get(pk=resp.json()["id"])
+        with chat.file.open("rb") as file:
+            self.assertEqual(file.read(), content)
+        self.assertEqual(chat.receiver, user_2)
+        chat.file.delete()
+
+        # test failure, upload already committed (400)
+        resp = self.client.post(f"{url}{upload_id}/commit/", commit_params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test failure, uploads of other users (404)
+        self.authenticate(user_2)
+        resp = self.client.get(f"{url}{upload_id}/", **self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+
+    def test_presigned_upload(self):
+        url = "/v1/chat_uploads/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        self.authenticate(user_1)
+        content = b"0123456789"
+
+        # test success, presign an upload (201)
+        resp = self.client.post(f"{url}presign/", {"filename": "my notes.txt"}, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        target = resp.json()
+        self.assertEqual(target["method"], "PUT")
+        self.assertTrue(target["name"].endswith("my_notes.txt"))
+
+        # test failure, confirm before the file is uploaded (400)
+        confirm_params = {"token": target["token"], "receiver": user_2.id}
+        resp = self.client.post(f"{url}confirm/", confirm_params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test failure, tampered token (400)
+        resp = self.client.put(
+            f"{url}local/{target['token']}x/", content,
+            content_type="application/octet-stream"
+        )
+        self.assertEqual(resp.status_code, 400)
+
+        # test success, upload needs no login, only the token (204)
+        resp = self.client.put(
+            target["url"], content, content_type="application/octet-stream"
+        )
+        self.assertEqual(resp.status_code, 204)
+
+        # test failure, token of another user (400)
+        self.authenticate(user_2)
+        confirm_params["receiver"] = user_1.id
+        resp = self.client.post(f"{url}confirm/", confirm_params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test success, confirm attaches the uploaded file to a chat (201)
+        self.authenticate(user_1)
+        confirm_params["receiver"] = user_2.id
+        resp = self.client.post(f"{url}confirm/", confirm_params, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        chat = Chat.objects.get(pk=resp.json()["id"])
+        self.assertEqual(chat.file.name, target["name"])
+        self.addCleanup(chat.file.delete)
+        self.addCleanup(self.clear_redis_keys, f"presigned:{target['name']}")
+        with chat.file.open("rb") as file:
+            self.assertEqual(file.read(), content)
+
+        # test failure, a token confirms one chat only (400)
+        resp = self.client.post(f"{url}confirm/", confirm_params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(Chat.objects.filter(file=target["name"]).count(), 1)
+
+        # test failure, concurrent confirms passing validation (400)
+        chat.delete()
+        with mock.patch.object(LocalPresignedUpload, "is_confirmed", return_value=False):
+            resp = self.client.post(f"{url}confirm/", confirm_params, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.json()["error_code"], "invalid_upload")
+        self.assertFalse(Chat.objects.filter(file=target["name"]).exists())
+
+        # test failure, the file of a chat can't be replaced (400)
+        Chat.objects.create(
+            sender=user_1, receiver=user_2, file=target["name"]
+        )
+        resp = self.client.put(
+            target["url"], b"replaced", content_type="application/octet-stream"
+        )
+        self.assertEqual(resp.status_code, 400)
+        with chat.file.open("rb") as file:
+            self.assertEqual(file.read(), content)
+
+    def test_image_previews(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        self.authenticate(user_1)
+        self.headers.pop("content_type")
+
+        buffer = io.BytesIO()
+        Image.new("RGBA", (1024, 512), (255, 0, 0, 128)).save(buffer, "PNG")
+        image = SimpleUploadedFile("photo.png", buffer.getvalue(), "image/png")
+
+        # test success, previews are queued once the chat is committed,
+        # not resized on the request thread (201)
+        with mock.patch.object(tasks.task_generate_chat_previews, "delay") as delay, \
+                mock.patch.object(Image.Image, "thumbnail") as thumbnail:
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post(
+                    url, {"receiver": user_2.id, "file": image}, **self.headers
+                )
+        self.assertEqual(resp.status_code, 201)
+        thumbnail.assert_not_called()
+        chat = Chat.objects.get(pk=resp.json()["id"])
+        self.addCleanup(chat.file.delete)
+        delay.assert_called_once_with(file_name=chat.file.name)
+        # the original is shown until the previews are ready
+        original_url = resp.json()["file"]
+        self.assertEqual(set(resp.json()["previews"].values()), {original_url})
+
+        # test success, the worker stores the previews
+        tasks.task_generate_chat_previews(file_name=chat.file.name)
+        chat.refresh_from_db()
+        storage = chat.file.storage
+        for size_name, max_side in app_settings["CHAT_PREVIEW_SIZES"].items():
+            name = chat.previews[size_name]
+            self.addCleanup(storage.delete, name)
+            with storage.open(name, "rb") as file:
+                preview = Image.open(file)
+                self.assertEqual(preview.format, "JPEG")
+                self.assertEqual(preview.size, (max_side, max_side // 2))
+
+        resp = self.client.get(url, **self.headers)
+        previews = resp.json()[0]["previews"]
+        self.assertEqual(previews.keys(), app_settings["CHAT_PREVIEW_SIZES"].keys())
+        self.assertNotIn(original_url, previews.values())
+
+        # test success, other files get no previews (201)
+        text = SimpleUploadedFile("notes.txt", b"My notes", "text/plain")
+        with mock.patch.object(tasks.task_generate_chat_previews, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post(
+                    url, {"receiver": user_2.id, "file": text}, **self.headers
+                )
+        self.assertEqual(resp.status_code, 201)
+        delay.assert_not_called()
+        self.assertEqual(resp.json()["previews"], {})
+        chat = Chat.objects.get(pk=resp.json()["id"])
+        self.assertEqual(chat.previews, {})
+        chat.file.delete()
+
+        # test success, previews are generated in the web process when the
+        # broker is down, the chat is still created (201)
+        image.seek(0)
+        with mock.patch.object(
+                tasks.task_generate_chat_previews, "delay",
+                side_effect=OperationalError("Connection refused")
+        ), mock.patch.object(tasks.preview_executor, "submit") as submit, \
+                self.assertLogs("chats.tasks", "ERROR"):
+            with self.captureOnCommitCallbacks(execute=True):
+                resp = self.client.post(
+                    url, {"receiver": user_2.id, "file": image}, **self.headers
+                )
+        self.assertEqual(resp.status_code, 201)
+        chat = Chat.objects.get(pk=resp.json()["id"])
+        self.addCleanup(chat.file.delete)
+        submit.assert_called_once_with(
+            tasks.generate_chat_previews_in_background, chat.file.name
+        )
+
+    def test_thread(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_3 = self.create_user(email="friend@three.com")
+        user_1.friends.add(user_2, user_3)
+
+        # root <- reply <- chat <- (reply_1 <- reply_1_1, reply_2)
+        root = Chat.objects.create(sender=user_1, receiver=user_2, message="Root")
+        reply = Chat.objects.create(sender=user_2, receiver=user_1, message="Reply", respond_to=root)
+        chat = Chat.objects.create(sender=user_1, receiver=user_2, message="Chat", respond_to=reply)
+        reply_1 = Chat.objects.create(sender=user_2, receiver=user_1, message="1", respond_to=chat)
+        reply_1_1 = Chat.objects.create(sender=user_1, receiver=user_2, message="1.1", respond_to=reply_1)
+        reply_2 = Chat.objects.create(sender=user_2, receiver=user_1, message="2", respond_to=chat)
+        # not in the thread of user_1
+        Chat.objects.create(sender=user_3, receiver=user_2, message="Other", respond_to=chat)
+        self.authenticate(user_1)
+
+        # test success, reply counts are kept on each chat (200)
+        chat.refresh_from_db()
+        self.assertEqual(chat.reply_count, 3)
+
+        # test success, ancestors and replies in one query (200)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f"{url}{chat.id}/thread/", **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        thread = [(c["id"], c["depth"]) for c in resp.json()]
+        self.assertEqual(thread, [
+            (root.id, -2), (reply.id, -1), (chat.id, 0),
+            (reply_1.id, 1), (reply_2.id, 1), (reply_1_1.id, 2)
+        ])
+        self.assertEqual(resp.json()[2]["reply_count"], 3)
+        # one for the user, one for the chat, one for the thread
+        self.assertEqual(len(ctx.captured_queries), 3)
+
+        # test success, depth limits hops either side (200)
+        resp = self.client.get(f"{url}{chat.id}/thread/?depth=1", **self.headers)
+        thread = [c["id"] for c in resp.json()]
+        self.assertEqual(thread, [reply.id, chat.id, reply_1.id, reply_2.id])
+
+        # test failure, bad depth (400)
+        resp = self.client.get(f"{url}{chat.id}/thread/?depth=0", **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test success, deleting a reply updates the count (204)
+        resp = self.client.delete(f"{url}{reply_2.id}/", **self.headers)
+        self.assertEqual(resp.status_code, 204)
+        chat.refresh_from_db()
+        self.assertEqual(chat.reply_count, 2)
+
+        # test failure, chats of other users (404)
+        self.authenticate(user_3)
+        resp = self.client.get(f"{url}{root.id}/thread/", **self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_search(self):
+        url = "/v1/chats/search/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_3 = self.create_user(email="friend@three.com")
+        user_1.friends.add(user_2, user_3)
+
+        best = Chat.objects.create(sender=user_1, receiver=user_2, message="Lunch? Lunch at noon, lunch is on me")
+        good = Chat.objects.create(sender=user_2, receiver=user_1, message="Are we still having lunch today?")
+        Chat.objects.create(sender=user_2, receiver=user_1, message="Running late")
+        Chat.objects.bulk_create_chats([
+            Chat(sender=user_3, receiver=user_2, message="Lunch without user one")
+        ])
+        self.authenticate(user_1)
+
+        # test success, ranked matches of the user's chats only (200)
+        resp = self.client.get(f"{url}?q=lunch", **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([c["id"] for c in resp.json()], [best.id, good.id])
+        self.assertEqual(resp["count"], "2")
+        self.assertGreater(resp.json()[0]["rank"], resp.json()[1]["rank"])
+
+        # test success, all words must match, punctuation is ignored (200)
+        resp = self.client.get(f"{url}?q=lunch today", **self.headers)
+        self.assertEqual([c["id"] for c in resp.json()], [good.id])
+        resp = self.client.get(f'{url}?q="noon" (lunch*', **self.headers)
+        self.assertEqual([c["id"] for c in resp.json()], [best.id])
+
+        # test success, deleted chats leave the index (200)
+        best.delete()
+        resp = self.client.get(f"{url}?q=noon", **self.headers)
+        self.assertEqual(resp.json(), [])
+
+        # test failure, missing query (400)
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_archive(self):
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+
+        old_chats = [
+            Chat.objects.create(sender=user_1, receiver=user_2, message=f"Old {i}")
+            for i in range(5)
+        ]
+        old_chats[1].respond_to = old_chats[0]
+        old_chats[1].save()
+        live_chat = Chat.objects.create(
+            sender=user_2, receiver=user_1, message="New", respond_to=old_chats[4]
+        )
+        # a reply that is archived while the chat it responds to stays
+        old_chats.append(Chat.objects.create(
+            sender=user_1, receiver=user_2, message="Earlier reply", respond_to=live_chat
+        ))
+        receipt = ReadReceipt.objects.create(
+            user=user_2, peer=user_1, last_read_chat=old_chats[4]
+        )
+        long_ago = timezone.now() - timedelta(days=400)
+        for i, chat in enumerate(old_chats):
+            Chat.objects.filter(pk=chat.pk).update(created_at=long_ago + timedelta(minutes=i))
+
+        # test success, old chats are moved in batches
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("archive_chats", batch_size=2, stdout=out)
+        self.assertIn("Archived 6 chats", out.getvalue())
+        self.assertEqual(list(Chat.objects.all()), [live_chat])
+        self.assertFalse(ChatTombstone.objects.exists())
+        conversation = live_chat.conversation
+        self.assertEqual(conversation.archives.count(), 3)
+        conversation.refresh_from_db()
+        self.assertEqual((conversation.chat_count, conversation.archived_count), (1, 6))
+        live_chat.refresh_from_db()
+        self.assertIsNone(live_chat.respond_to)
+        self.assertEqual(live_chat.reply_count, 0)
+        receipt.refresh_from_db()
+        self.assertIsNone(receipt.last_read_chat)
+        for archive in conversation.archives.all():
+            self.addCleanup(archive.storage.delete, archive.name)
+
+        # test success, nothing left to archive
+        call_command("archive_chats", batch_size=2, stdout=out)
+        self.assertIn("Archived 0 chats", out.getvalue())
+
+        # test success, archived chats leave search (200)
+        self.authenticate(user_1)
+        resp = self.client.get("/v1/chats/search/?q=old", **self.headers)
+        self.assertEqual(resp.json(), [])
+
+        # test success, restore brings back the chats as they were (200)
+        resp = self.client.post(f"/v1/conversations/{conversation.id}/restore/", **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["chat_count"], 7)
+        self.assertEqual(resp.json()["archived_count"], 0)
+        self.assertFalse(conversation.archives.exists())
+        restored = Chat.objects.get(pk=old_chats[1].pk)
+        self.assertEqual(restored.message, "Old 1")
+        self.assertEqual(restored.respond_to_id, old_chats[0].pk)
+        self.assertEqual(restored.created_at, long_ago + timedelta(minutes=1))
+        resp = self.client.get("/v1/chats/search/?q=old", **self.headers)
+        self.assertEqual(len(resp.json()), 5)
+
+        # test failure, conversations of other users (404)
+        self.authenticate(self.create_user(email="stranger@one.com"))
+        resp = self.client.post(f"/v1/conversations/{conversation.id}/restore/", **self.headers)
+        self.assertEqual(resp.status_code, 404)
+
+    def test_unread(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_3 = self.create_user(email="friend@three.com")
+        user_1.friends.add(user_2, user_3)
+        counters = UnreadCounters()
+        for user in (user_1, user_2, user_3):
+            counters.invalidate(user.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(3):
+                Chat.objects.create(sender=user_2, receiver=user_1, message=f"Hi {i}")
+            Chat.objects.bulk_create_chats([
+                Chat(sender=user_3, receiver=user_1, message="Hello"),
+                Chat(sender=user_1, receiver=user_2, message="Hey"),
+            ])
+        self.authenticate(user_1)
+
+        # test success, counters come from redis, no SQL COUNT (200)
+        counters.rebuild(user_1.id)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.get(f"{url}unread/", **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json(), {"total": 4, "peers": {str(user_2.id): 3, str(user_3.id): 1}})
+        self.assertFalse(any("COUNT" in q["sql"] for q in ctx.captured_queries))
+
+        # test success, new chats are counted as they are created (200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Chat.objects.create(sender=user_3, receiver=user_1, message="Still there?")
+        resp = self.client.get(f"{url}unread/", **self.headers)
+        self.assertEqual(resp.json()["peers"][str(user_3.id)], 2)
+
+        # test success, mark read resets the counter and records a receipt (200)
+        resp = self.client.post(f"{url}read/", {"peer": user_2.id}, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertIsNotNone(resp.json()["last_read_chat"])
+        resp = self.client.get(f"{url}unread/", **self.headers)
+        self.assertEqual(resp.json(), {"total": 2, "peers": {str(user_3.id): 2}})
+
+        # test success, counters lost by redis are rebuilt from the database (200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Chat.objects.create(sender=user_2, receiver=user_1, message="New")
+        counters.invalidate(user_1.id)
+        resp = self.client.get(f"{url}unread/", **self.headers)
+        self.assertEqual(
+            resp.json(), {"total": 3, "peers": {str(user_2.id): 1, str(user_3.id): 2}}
+        )
+
+        # test failure, unknown peer (400)
+        resp = self.client.post(f"{url}read/", {"peer": 999}, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_idempotent_create(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        self.authenticate(user_1)
+        params = {"receiver": user_2.id, "message": "Sent once"}
+        key = uuid.uuid4().hex
+        responses = IdempotentResponses("chats")
+
+        # test success, first request creates the chat (201)
+        resp = self.client.post(url, params, HTTP_IDEMPOTENCY_KEY=key, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        chat_id = resp.json()["id"]
+        self.assertNotIn("idempotency_key", resp.json())
+        self.assertFalse(resp.has_header("Idempotent-Replayed"))
+
+        # test success, retries replay the response without queries (201)
+        with CaptureQueriesContext(connection) as ctx:
+            resp = self.client.post(url, params, HTTP_IDEMPOTENCY_KEY=key, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()["id"], chat_id)
+        self.assertEqual(resp["Idempotent-Replayed"], "true")
+        # only the user lookup of authentication
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        # test success, the unique constraint catches retries redis missed (201)
+        responses.redis.instance.delete(responses.redis_key(user_1.id, key))
+        resp = self.client.post(url, params, HTTP_IDEMPOTENCY_KEY=key, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        self.assertEqual(resp.json()["id"], chat_id)
+        self.assertEqual(Chat.objects.filter(message="Sent once").count(), 1)
+
+        # test success, keys are per user (201)
+        user_2.friends.add(user_1)
+        self.authenticate(user_2)
+        params["receiver"] = user_1.id
+        resp = self.client.post(url, params, HTTP_IDEMPOTENCY_KEY=key, **self.headers)
+        self.assertEqual(resp.status_code, 201)
+        self.assertNotEqual(resp.json()["id"], chat_id)
+
+        # test failure, key too long (400)
+        resp = self.client.post(url, params, HTTP_IDEMPOTENCY_KEY="k" * 65, **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+    def test_throttling(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+
+        with mock.patch.object(ChatViewset, "throttle_rates", {"list": "2/min"}):
+            # test success, requests within the limit (200)
+            self.authenticate(user_1)
+            for _ in range(2):
+                resp = self.client.get(url, **self.headers)
+                self.assertEqual(resp.status_code, 200)
+
+            # test failure, over the limit (429)
+            resp = self.client.get(url, **self.headers)
+            self.assertEqual(resp.status_code, 429)
+            self.assertTrue(0 < int(resp["Retry-After"]) <= 60)
+
+            # test success, other endpoints and users have their own limits (200)
+            resp = self.client.get(f"{url}unread/", **self.headers)
+            self.assertEqual(resp.status_code, 200)
+            self.authenticate(user_2)
+            resp = self.client.get(url, **self.headers)
+            self.assertEqual(resp.status_code, 200)
+
+        # test success, redis windows are shared by all processes
+        windows = [throttling.RedisSlidingWindow() for _ in range(2)]
+        key = f"throttle:test:{uuid.uuid4().hex}"
+        self.assertEqual(windows[0].hit(key, 2, 60), (True, 0))
+        self.assertEqual(windows[1].hit(key, 2, 60), (True, 0))
+        allowed, wait = windows[0].hit(key, 2, 60)
+        self.assertFalse(allowed)
+        self.assertTrue(59 < wait <= 60)
+
+    def test_export(self):
+        url = "/v1/chats/export/"
+        chunk_size = app_settings["CHAT_EXPORT_CHUNK_SIZE"]
+        self.addCleanup(app_settings.__setitem__, "CHAT_EXPORT_CHUNK_SIZE", chunk_size)
+        app_settings["CHAT_EXPORT_CHUNK_SIZE"] = 2
+
+        user_1 = self.create_user(email="friend@one.com", first_name="Ada", last_name="One")
+        user_2 = self.create_user(email="friend@two.com", first_name="Bola", last_name="Two")
+        user_3 = self.create_user(email="friend@three.com")
+        for i in range(5):
+            Chat.objects.create(sender=user_1, receiver=user_2, message=f"Chat, {i}")
+        Chat.objects.create(sender=user_3, receiver=user_2, message="Not for user one")
+        self.authenticate(user_1)
+
+        def export(export_format=None):
+            params = f"?export_format={export_format}" if export_format else ""
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.get(f"{url}{params}", **self.headers)
+                content = b"".join(resp.streaming_content).decode()
+            return resp, content, ctx.captured_queries
+
+        # test success, ndjson export, streamed in chunks (200)
+        resp, content, queries = export()
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(resp.streaming)
+        self.assertEqual(resp["Content-Type"], "application/x-ndjson")
+        self.assertIn("attachment;", resp["Content-Disposition"])
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([row["message"] for row in rows], [f"Chat, {i}" for i in range(5)])
+        self.assertEqual(rows[0]["sender_name"], "Ada One")
+        self.assertEqual(rows[0]["receiver_name"], "Bola Two")
+
+        # test success, names are joined, no query per row (200)
+        chats_queries = [q for q in queries if "chats_chat" in q["sql"]]
+        self.assertEqual(len(chats_queries), 1)
+
+        # test success, csv export (200)
+        resp, content, _ = export("csv")
+        self.assertEqual(resp["Content-Type"], "text/csv")
+        rows = list(csv.reader(io.StringIO(content)))
+        self.assertEqual(rows[0][:4], ["id", "created_at", "sender_id", "sender_name"])
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[1][7], "Chat, 0")
+
+        # test failure, unknown format (400)
+        resp = self.client.get(f"{url}?export_format=xml", **self.headers)
+        self.assertEqual(resp.status_code, 400)
+
+        # test success, over ASGI exports are produced off the event loop
+        export_threads = []
+
+        def slow_export():
+            for i in range(3):
+                export_threads.append(threading.get_ident())
+                time.sleep(0.05)
+                yield f"{i}\n".encode()
+
+        async def serve(response):
+            ticks, messages = [], []
+
+            async def tick():
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks.append(1)
+
+            async def send(message):
+                messages.append(message)
+
+            ticker = asyncio.ensure_future(tick())
+            await StreamingASGIHandler().send_response(response, send)
+            ticker.cancel()
+            body = b"".join(message.get("body", b"") for message in messages[1:])
+            return threading.get_ident(), len(ticks), body
+
+        loop_thread, ticks, body = async_to_sync(serve)(StreamingHttpResponse(slow_export()))
+        self.assertEqual(body, b"0\n1\n2\n")
+        self.assertEqual(len(set(export_threads)), 1)
+        self.assertNotIn(loop_thread, export_threads)
+        # the loop kept running while the export slept
+        self.assertGreater(ticks, 5)
+
+    def test_timelines(self):
+        url = "/v1/chats/"
+        user_1 = self.create_user(email="friend@one.com")
+        user_2 = self.create_user(email="friend@two.com")
+        user_1.friends.add(user_2)
+        self.addCleanup(app_settings.__setitem__, "CHAT_TIMELINE_LENGTH", app_settings["CHAT_TIMELINE_LENGTH"])
+        app_settings["CHAT_TIMELINE_LENGTH"] = 15
+
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(12):
+                sender, receiver = (user_1, user_2) if i % 2 else (user_2, user_1)
+                Chat.objects.create(sender=sender, receiver=receiver, message=f"Hi {i}")
+        expected = list(
+            Chat.objects.order_by("-created_at", "-id").values_list("id", flat=True)
+        )
+        self.authenticate(user_1)
+
+        def list_all():
+            ids, next_url, served = [], url, []
+            while next_url:
+                with CaptureQueriesContext(connection) as ctx:
+                    resp = self.client.get(next_url, **self.headers)
+                self.assertEqual(resp.status_code, 200)
+                ids += [chat["id"] for chat in resp.json()]
+                next_url = resp["next"] if resp["next"] != "None" else None
+                served.append(not any("ORDER BY" in q["sql"] for q in ctx.captured_queries))
+            return ids, served
+
+        # test success, first read builds the timeline from the database (200)
+        ids, served = list_all()
+        self.assertEqual(ids, expected)
+        self.assertEqual(served, [False, True])
+
+        # test success, every page is served from a complete timeline (200)
+        ids, served = list_all()
+        self.assertEqual(ids, expected)
+        self.assertEqual(served, [True, True])
+
+        # test success, older history than the timeline holds comes from the database (200)
+        app_settings["CHAT_TIMELINE_LENGTH"] = 11
+        call_command("rebuild_timelines", user_1.id, stdout=io.StringIO())
+        ids, served = list_all()
+        self.assertEqual(ids, expected)
+        self.assertEqual(served, [True, False])
+
+        # test success, new chats are added and deleted chats removed (200)
+        with self.captureOnCommitCallbacks(execute=True):
+            chat = Chat.objects.create(sender=user_2, receiver=user_1, message="New")
+            self.client.delete(f"{url}{expected[0]}/", **self.headers)
+        timeline = Timelines().redis.zrevrange(f"timeline:{user_1.id}", 0, 1)
+        self.assertEqual(timeline, [str(chat.id).encode(), str(expected[1]).encode()])
+        self.assertEqual(list_all()[0], [chat.id, *expected[1:]])
+
+        # test success, timelines lost by redis are rebuilt (200)
+        Timelines().invalidate(user_1.id)
+        self.assertEqual(list_all()[0], [chat.id, *expected[1:]])
+
+        # test success, timelines that missed a chat are rebuilt (200)
+        with mock.patch.object(
+            InstrumentedPipeline, "execute", side_effect=RedisError("down")
+        ), self.assertLogs("chats", "ERROR") as logs:
+            with self.captureOnCommitCallbacks(execute=True):
+                missed = Chat.objects.create(sender=user_1, receiver=user_2, message="Missed")
+        self.assertIn("chats.timelines", [record.name for record in logs.records])
+        self.assertFalse(Timelines().redis.exists(f"timeline:{user_1.id}"))
+        ids, served = list_all()
+        self.assertEqual(ids[:2], [missed.id, chat.id])
+        self.assertEqual(served[0], False)
+
+        # test success, timelines holding chats gone from the database are
+        # dropped and rebuilt (200)
+        Chat.objects.filter(pk=missed.pk).delete()
+        self.assertTrue(Timelines().redis.exists(f"timeline:{user_1.id}"))
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.json()[0]["id"], chat.id)
+        self.assertFalse(Timelines().redis.exists(f"timeline:{user_1.id}"))
+        ids, served = list_all()
+        self.assertEqual(ids[0], chat.id)
+        self.assertEqual(list_all(), (ids, [True, False]))
+
+    def test_redis_client(self):
+        url = "/v1/metrics/redis/"
+        user = self.create_user(email="friend@one.com")
+        staff = self.create_user(email="staff@one.com", is_staff=True)
+
+        # test success, callers share one client, after forks a new one
+        client = RedisTimePersist().instance
+        self.assertIs(RedisTimePersist(ttl=10).instance, client)
+        pid = os.fork()
+        if pid == 0:
+            forked_client = RedisTimePersist().instance
+            os._exit(0 if forked_client is not client and forked_client.ping() else 1)
+        self.assertEqual(os.waitpid(pid, 0)[1], 0)
+
+        # test success, commands and pipelines are counted and timed
+        redis_metrics.reset()
+        RedisTimePersist().set("metrics:test", "value")
+        RedisTimePersist().hset("metrics:hash", "field", 1, ttl=10)
+        metrics = redis_metrics.snapshot()
+        self.assertEqual(metrics["SET"]["calls"], 1)
+        self.assertEqual(sum(metrics["SET"]["histogram"].values()), 1)
+        self.assertEqual(metrics["PIPELINE"]["calls"], 1)
+        self.assertEqual(metrics["HSET"]["pipelined"], 1)
+        self.assertEqual(metrics["EXPIRE"]["pipelined"], 1)
+
+        # test failure, staff only (403)
+        self.authenticate(user)
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 403)
+
+        # test success, metrics of this process (200)
+        self.authenticate(staff)
+        resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()["SET"]["calls"], 1)
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class TestWebsockets(TestUtilsMixin, TestCase):
+
+    async def connect(self, user=None, token=None):
+        if token is None and user is not None:
+            token = str(RefreshToken.for_user(user).access_token)
+        path = "/v1/ws/chats/" if token is None else f"/v1/ws/chats/?token={token}"
+        communicator = WebsocketCommunicator(application, path)
+        connected, _ = await communicator.connect()
+        return communicator, connected
+
+    async def test_chat_pushed_to_receiver(self):
+        create_user = sync_to_async(self.create_user)
+        user_1 = await create_user(email="friend@one.com")
+        user_2 = await create_user(email="friend@two.com")
+        await sync_to_async(user_1.friends.add)(user_2)
+
+        # test failure, anonymous and bad tokens are rejected
+        communicator, connected = await self.connect()
+        self.assertFalse(connected)
+        communicator, connected = await self.connect(token="invalid token")
+        self.assertFalse(connected)
+
+        # test success, receiver gets the chat created by the sender
+        communicator, connected = await self.connect(user_2)
+        self.assertTrue(connected)
+        self.authenticate(user_1)
+        self.headers.pop("content_type")
+        resp = await sync_to_async(self.client.post)(
+            "/v1/chats/", {"receiver": user_2.id, "message": "Hello"},
+            **self.headers
+        )
+        self.assertEqual(resp.status_code, 201)
+        event = await communicator.receive_json_from()
+        self.assertEqual(event["type"], "chat.message")
+        self.assertEqual(event["chat"]["id"], resp.json()["id"])
+        self.assertEqual(event["chat"]["message"], "Hello")
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
+
+    async def test_presence_pushed_to_friends(self):
+        create_user = sync_to_async(self.create_user)
+        user_1 = await create_user(email="friend@one.com")
+        user_2 = await create_user(email="friend@two.com")
+        user_3 = await create_user(email="friend@three.com")
+        await sync_to_async(user_1.friends.add)(user_2)
+        await sync_to_async(self.clear_redis_keys)("friends:*")
+        redis = RedisTimePersist().instance
+        await sync_to_async(redis.delete)(user_1.id, user_2.id, user_3.id)
+
+        def get_user(user):
+            self.authenticate(user)
+            return self.client.get(f"/v1/users/{user.id}/", **self.headers)
+
+        # online friend with an open connection
+        communicator, connected = await self.connect(user_2)
+        self.assertTrue(connected)
+        await sync_to_async(get_user)(user_2)
+
+        # test success, friends are told a user comes online, once
+        await sync_to_async(get_user)(user_1)
+        event = await communicator.receive_json_from()
+        self.assertEqual(event, {"type": "presence.changed", "user_id": user_1.id, "online": True})
+        await sync_to_async(get_user)(user_1)
+        self.assertTrue(await communicator.receive_nothing())
+
+        # test success, other users aren't told
+        await sync_to_async(get_user)(user_3)
+        self.assertTrue(await communicator.receive_nothing())
+
+        # test success, friends are told a user went offline when the key expires
+        await sync_to_async(redis.delete)(user_1.id)
+        await sync_to_async(presence.expired)(str(user_1.id))
+        event = await communicator.receive_json_from()
+        self.assertEqual(event, {"type": "presence.changed", "user_id": user_1.id, "online": False})
+
+        # test success, expiry of other keys is ignored
+        await sync_to_async(presence.expired)(f"timeline:{user_1.id}")
+        await sync_to_async(presence.expired)(str(user_2.id))
+        self.assertTrue(await communicator.receive_nothing())
+        await communicator.disconnect()
@@ -0,0 +1,202 @@
+"""
+Chat timelines, fan-out on write.
+
+Each user has a Redis sorted set `timeline:{user_id}` of the IDs of their
+most recent chats, sent or received, scored by creation time in
+microseconds. Chats are added to the timelines of both sender and receiver
+when created, and removed when deleted. Timelines are trimmed to
+CHAT_TIMELINE_LENGTH chats, ChatViewset.list serves first pages from them
+and older history from the database.
+
+A timeline holds the `built` member once it has been filled from the
+database, timelines without it (never built, or lost by Redis) are rebuilt
+on the next read. `timeline:{user_id}:floor` holds the score of the newest
+chat trimmed away, the timeline has every chat scored above it, "-inf" if
+it has all chats of its user."""
+
+import logging
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+from redis.exceptions import RedisError
+
+from common_app.utils.general_utils import RedisTimePersist, app_settings
+
+
+logger = logging.getLogger(__name__)
+
+built_member = "built"
+
+# Chats of the same microsecond as a cursor position are fetched along,
+# fetch a few more than a page so ties don't shorten it.
+tie_slack = 5
+
+
+def timeline_key(user_id: int) -> str:
+    return f"timeline:{user_id}"
+
+
+def timeline_score(created_at: datetime) -> int:
+    return int(created_at.timestamp() * 1000000)
+
+
+class Timelines:
+
+    # Trims timelines to ARGV[1] chats, raising their floor, the built
+    # member is kept. Called with a chat score and ID it adds the chat first.
+    add_script = """
+        local length, ttl = tonumber(ARGV[1]), tonumber(ARGV[2])
+        for i = 1, #KEYS, 2 do
+            local key, floor_key = KEYS[i], KEYS[i + 1]
+            if ARGV[3] then
+                redis.call("ZADD", key, ARGV[3], ARGV[4])
+            end
+            local first = redis.call("ZSCORE", key, "built") and 1 or 0
+            local last = redis.call("ZCARD", key) - length - 1
+            if last >= first then
+                local newest = redis.call("ZRANGE", key, last, last, "WITHSCORES")[2]
+                redis.call("ZREMRANGEBYRANK", key, first, last)
+                local floor = redis.call("GET", floor_key)
+                if first == 1 and (not floor or floor == "-inf" or tonumber(floor) < tonumber(newest)) then
+                    redis.call("SET", floor_key, newest)
+                end
+            end
+            redis.call("PEXPIRE", key, ttl)
+            redis.call("PEXPIRE", floor_key, ttl)
+        end
+    """
+
+    def __init__(self) -> None:
+        self.redis = RedisTimePersist().instance
+        self.length = app_settings["CHAT_TIMELINE_LENGTH"]
+        self.ttl = int(app_settings["CHAT_TIMELINE_TTL"].total_seconds() * 1000)
+        self.add = self.redis.register_script(self.add_script)
+
+    @staticmethod
+    def keys(user_id: int) -> list:
+        return [timeline_key(user_id), f"{timeline_key(user_id)}:floor"]
+
+    def record_chats(self, chats: Iterable) -> None:
+        """
+        Add new chats to the timelines of their senders and receivers.
+        Timelines that may have missed them are dropped, to be rebuilt.
+        """
+
+        pipe = self.redis.pipeline(transaction=False)
+        user_ids = set()
+        for chat in chats:
+            chat_user_ids = {chat.sender_id, chat.receiver_id} - {None}
+            user_ids |= chat_user_ids
+            self.add(
+                keys=[key for user_id in chat_user_ids for key in self.keys(user_id)],
+                client=pipe,
+                args=[self.length, self.ttl, timeline_score(chat.created_at), chat.id]
+            )
+        try:
+            pipe.execute()
+        except RedisError:
+            logger.exception("Timelines not updated")
+            self.invalidate(*user_ids)
+
+    def remove_chats(self, chats: Iterable[dict]) -> None:
+        """Remove chats, given their id, sender_id and receiver_id."""
+
+        pipe = self.redis.pipeline(transaction=False)
+        user_ids = set()
+        for chat in chats:
+            for user_id in (chat["sender_id"], chat["receiver_id"]):
+                if user_id is not None:
+                    user_ids.add(user_id)
+                    pipe.zrem(timeline_key(user_id), chat["id"])
+        try:
+            pipe.execute()
+        except RedisError:
+            logger.exception("Timelines not updated")
+            self.invalidate(*user_ids)
+
+    def invalidate(self, *user_ids: int) -> None:
+        keys = [key for user_id in user_ids for key in self.keys(user_id)]
+        if not keys:
+            return
+        try:
+            self.redis.delete(*keys)
+        except RedisError:
+            logger.exception("Timelines not invalidated")
+
+    def rebuild(self, user_id: int) -> None:
+        """Fill the timeline of a user from the database."""
+
+        from .models import Chat
+
+        rows = list(
+            Chat.objects
+                .filter(Q(sender_id=user_id) | Q(receiver_id=user_id))
+                .order_by("-created_at", "-id")
+                .values_list("id", "created_at")[:self.length + 1]
+        )
+        floor = "-inf"
+        if len(rows) > self.length:
+            floor = timeline_score(rows.pop()[1])
+        mapping = {chat_id: timeline_score(created_at) for chat_id, created_at in rows}
+        mapping[built_member] = "-inf"
+
+        # Chats added meanwhile are kept, nothing is deleted.
+        key, floor_key = self.keys(user_id)
+        pipe = self.redis.pipeline()
+        pipe.zadd(key, mapping)
+        pipe.set(floor_key, floor)
+        self.add(keys=[key, floor_key], args=[self.length, self.ttl], client=pipe)
+        pipe.execute()
+
+    def page(self, user_id: int, queryset, position: Optional[list], limit: int) -> Optional[List]:
+        """
+        Up to `limit` chats of `queryset` after cursor `position`, ordered
+        by ("-created_at", "-id"). Returns None if the timeline can't tell,
+        the page should be read from the database then.
+        """
+
+        if position is None:
+            max_score = "+inf"
+        else:
+            created_at = parse_datetime(str(position[0]))
+            if created_at is None:
+                return None
+            max_score = timeline_score(created_at)
+
+        key, floor_key = self.keys(user_id)
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zscore(key, built_member)
+            pipe.get(floor_key)
+            pipe.zrevrangebyscore(key, max_score, "(-inf", start=0, num=limit + tie_slack)
+            built, floor, members = pipe.execute()
+            if built is None:
+                self.rebuild(user_id)
+                return None
+        except RedisError:
+            logger.exception("Timeline of user %s not read", user_id)
+            return None
+
+        ids = [int(member) for member in members]
+        chats = list(queryset.filter(id__in=ids).order_by())
+        if len(chats) != len(ids):
+            # out of date, e.g chats were archived, built again on next read
+            self.invalidate(user_id)
+            return None
+
+        chats.sort(key=lambda chat: (chat.created_at, chat.id), reverse=True)
+        if position is not None:
+            chats = [
+                chat for chat in chats
+                if (chat.created_at, chat.id) < (created_at, int(position[1]))
+            ]
+        if len(chats) >= limit:
+            return chats[:limit]
+
+        if floor == b"-inf" and len(ids) < limit + tie_slack:
+            # no older chats
+            return chats
+        return None
@@ -0,0 +1,92 @@
+"""
+Unread chat counters, kept in Redis so badges cost no SQL.
+
+Each user has a hash `unread:{user_id}` of peer user ID to the number of
+chats received from that peer since the user last read them. Counters are
+incremented as chats are created and reset when the user marks a peer's
+chats read, which also records a ReadReceipt.
+
+ReadReceipts make the counters rebuildable: a hash without the `built`
+field was lost or never built, and is recounted from the database the next
+time it's read.
+"""
+
+import logging
+from typing import Dict, Iterable
+
+from django.db.models import Count, F, OuterRef, Q, Subquery
+
+from redis.exceptions import RedisError
+
+from common_app.utils.general_utils import RedisTimePersist
+
+
+logger = logging.getLogger(__name__)
+
+built_field = "built"
+
+
+def unread_key(user_id: int) -> str:
+    return f"unread:{user_id}"
+
+
+class UnreadCounters:
+
+    def __init__(self) -> None:
+        self.redis = RedisTimePersist().instance
+
+    def record_chats(self, chats: Iterable) -> None:
+        """Count new chats as unread by their receivers, one round trip."""
+
+        pipe = self.redis.pipeline(transaction=False)
+        for chat in chats:
+            if chat.receiver_id is not None:
+                pipe.hincrby(unread_key(chat.receiver_id), chat.sender_id, 1)
+        try:
+            pipe.execute()
+        except RedisError:
+            # counters are rebuilt from the database once invalidated
+            logger.exception("Unread counters not updated")
+
+    def mark_read(self, user_id: int, peer_id: int) -> None:
+        self.redis.hdel(unread_key(user_id), peer_id)
+
+    def invalidate(self, user_id: int) -> None:
+        try:
+            self.redis.delete(unread_key(user_id))
+        except RedisError:
+            logger.exception("Unread counters of user %s not invalidated", user_id)
+
+    def get_all(self, user_id: int) -> Dict[int, int]:
+        """Unread counts of a user by peer ID, peers with none are left out."""
+
+        counters = self.redis.hgetall(unread_key(user_id))
+        if built_field.encode() not in counters:
+            return self.rebuild(user_id)
+        return {
+            int(peer_id): int(count) for peer_id, count in counters.items()
+            if peer_id != built_field.encode() and int(count) > 0
+        }
+
+    def rebuild(self, user_id: int) -> Dict[int, int]:
+        """Recount the unread chats of a user from the database."""
+
+        from .models import Chat, ReadReceipt
+
+        read_at = ReadReceipt.objects \
+            .filter(user_id=user_id, peer_id=OuterRef("sender_id")) \
+            .values("read_at")
+        rows = Chat.objects \
+            .filter(receiver_id=user_id) \
+            .annotate(read_at=Subquery(read_at)) \
+            .filter(Q(read_at__isnull=True) | Q(created_at__gt=F("read_at"))) \
+            .values("sender_id") \
+            .annotate(count=Count("id")) \
+            .order_by()
+        counts = {row["sender_id"]: row["count"] for row in rows}
+
+        pipe = self.redis.pipeline()
+        pipe.delete(unread_key(user_id))
+        pipe.hset(unread_key(user_id), mapping={built_field: 1, **counts})
+        pipe.execute()
+        return counts
@@ -0,0 +1,90 @@
+import json
+import logging
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Optional
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.utils.dateparse import parse_datetime
+
+
+logger = logging.getLogger(__name__)
+
+
+def user_group_name(user_id: int) -> str:
+    """Channel layer group every websocket connection of a user joins."""
+
+    return f"user_{user_id}"
+
+
+def push_chat(chat_data: dict, receiver_id: int) -> None:
+    """Push a serialized chat to the receiver's open websocket connections.
+
+    The channel layer fans this out to every process holding one of the
+    receiver's connections. Failing to push shouldn't fail the request,
+    the receiver still gets the chat the next time they list their chats.
+    """
+
+    if receiver_id is None:
+        return
+
+    event = {"type": "chat.message", "chat": chat_data}
+    try:
+        async_to_sync(get_channel_layer().group_send)(
+            user_group_name(receiver_id), event
+        )
+    except Exception as err:
+        logger.exception(f"Chat not pushed because: {err}")
+
+
+class SyncCursor:
+    """High-water marks of a chat sync.
+
+    Holds the (modified_at, id) of the last chat and the (deleted_at, id)
+    of the last tombstone a client has seen, along with the [time, id] of
+    those seen within CHAT_SYNC_OVERLAP of the marks, see
+    ChatViewset.read_changes. Clients treat the encoded value as opaque.
+    """
+
+    def __init__(
+        self, chats: Optional[list] = None, tombstones: Optional[list] = None,
+        seen_chats: Optional[list] = None, seen_tombstones: Optional[list] = None
+    ):
+        self.chats = chats
+        self.tombstones = tombstones
+        self.seen_chats = seen_chats or []
+        self.seen_tombstones = seen_tombstones or []
+
+    def encode(self) -> str:
+        tokens = {
+            "c": self.chats, "t": self.tombstones,
+            "cs": self.seen_chats, "ts": self.seen_tombstones
+        }
+        querystring = json.dumps(tokens, separators=(",", ":"), default=str)
+        return urlsafe_b64encode(querystring.encode("ascii")).decode("ascii")
+
+    @classmethod
+    def decode(cls, encoded: str) -> "SyncCursor":
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            chats, tombstones = tokens["c"], tokens["t"]
+            seen_chats, seen_tombstones = tokens.get("cs", []), tokens.get("ts", [])
+            if chats is not None:
+                chats = cls.decode_position(chats)
+            if tombstones is not None:
+                tombstones = cls.decode_position(tombstones)
+            seen_chats = [cls.decode_position(seen) for seen in seen_chats]
+            seen_tombstones = [cls.decode_position(seen) for seen in seen_tombstones]
+        except Exception:
+            raise ValueError("Invalid sync cursor")
+        return cls(chats, tombstones, seen_chats, seen_tombstones)
+
+    @staticmethod
+    def decode_position(position: list) -> list:
+        """[time, id] with the time parsed, raises ValueError if it isn't one."""
+
+        time, id = position
+        time = parse_datetime(time)
+        if time is None or not isinstance(id, int):
+            raise ValueError("Invalid sync cursor")
+        return [time, id]
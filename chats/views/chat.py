@@ -0,0 +1,470 @@
+import hashlib
+from typing import Optional
+
+from django.db import transaction, IntegrityError
+from django.db.models import Q, Max
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import quote_etag, parse_etags
+
+from rest_framework.viewsets import GenericViewSet
+from rest_framework.mixins import (
+    CreateModelMixin, DestroyModelMixin, ListModelMixin
+)
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.decorators import action
+
+from drf_spectacular.utils import (
+    extend_schema, OpenApiResponse, OpenApiTypes, OpenApiParameter
+)
+
+from common_app import idempotency
+from common_app.serializers import ValidationErrorSerializer, URLParamsValidationErrorSerializer
+from common_app.pagination import (
+    GeneralPagingation, GeneralCursorPagination, paginator_header_params,
+    cursor_paginator_header_params
+)
+
+from common_app.utils.general_utils import app_settings
+
+from exceptions_and_logging.serializers import ErrorSerializer
+
+from ..models import Chat, ChatTombstone, ReadReceipt
+from ..serializers import (
+    ChatCreateSerializer, ChatDisplaySerializer, SyncUrlParamsSerializer,
+    ChatSyncSerializer, ChatBulkCreateSerializer, ChatBulkResultSerializer,
+    ThreadUrlParamsSerializer, ChatThreadSerializer, SearchUrlParamsSerializer,
+    ChatSearchResultSerializer, ReadReceiptSerializer, UnreadCountsSerializer,
+    ExportUrlParamsSerializer
+)
+from ..export import export_chats, content_types
+from ..search import search_chats
+from ..timelines import Timelines
+from ..unread import UnreadCounters
+from ..utils import push_chat, SyncCursor
+
+
+class ChatViewset(
+    ListModelMixin, DestroyModelMixin, CreateModelMixin, GenericViewSet
+):
+
+    queryset = Chat.objects.all()
+    permission_classes = [IsAuthenticated]
+    serializer_class = ChatDisplaySerializer
+    pagination_class = GeneralCursorPagination
+    cursor_ordering = ("-created_at", "-id")
+    # maximum number of chats and of tombstones returned by one sync
+    sync_page_size = 100
+    # clients poll these, see common_app.throttling.
+    throttle_rates = {
+        "list": "120/min", "sync": "120/min", "search": "60/min",
+        "export": "10/hour"
+    }
+
+    @extend_schema(
+        parameters=[
+            OpenApiParameter(
+                idempotency.header, type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER, required=False,
+                description=(
+                    "Unique key of this chat, retries with the same key "
+                    "return the first response instead of a new chat."
+                )
+            ),
+            OpenApiParameter(
+                idempotency.replayed_header, type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER, required=False, response=[201],
+                description="'true' if this is the response of an earlier request."
+            ),
+        ],
+        responses={
+            201: OpenApiResponse(
+                ChatDisplaySerializer, "Successfully created a chat."
+            ),
+            400: OpenApiResponse(
+                ValidationErrorSerializer, "Bad request"
+            )
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        """Create a chat between the logged in user and another user"""
+
+        user = request.user
+        key = idempotency.get_idempotency_key(request)
+        responses = idempotency.IdempotentResponses("chats")
+        if key is not None:
+            stored = responses.get(user.id, key)
+            if stored is not None:
+                status_code, data = stored
+                return Response(
+                    data, status_code, headers={idempotency.replayed_header: "true"}
+                )
+
+        # QueryDict.copy() deep copies, uploaded files included.
+        data = dict(request.data.items())
+        data["sender"] = user.id
+        ser = ChatCreateSerializer(data=data)
+        if not ser.is_valid():
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+        try:
+            with transaction.atomic():
+                chat = ser.save(idempotency_key=key)
+        except IntegrityError:
+            # A retry that missed the stored response, e.g Redis was down.
+            chat = Chat.objects.filter(sender=user, idempotency_key=key).first()
+            if key is None or chat is None:
+                raise
+            data = ChatDisplaySerializer(chat).data
+            return Response(
+                data, status.HTTP_201_CREATED,
+                headers={idempotency.replayed_header: "true"}
+            )
+
+        data = ChatDisplaySerializer(chat).data
+        if key is not None:
+            responses.set(user.id, key, status.HTTP_201_CREATED, data)
+        push_chat(data, chat.receiver_id)
+        return Response(data, status.HTTP_201_CREATED)
+
+    @extend_schema(
+        responses={
+            201: OpenApiResponse(
+                ChatBulkResultSerializer(many=True),
+                "Successfully created chats, one result per receiver."
+            ),
+            400: OpenApiResponse(
+                ValidationErrorSerializer, "Bad request"
+            )
+        }
+    )
+    @action(["post"], detail=False, serializer_class=ChatBulkCreateSerializer)
+    def bulk(self, request, *args, **kwargs):
+        """
+        Send the same chat from the logged in user to many friends.
+        Receivers that aren't friends are skipped.
+        """
+
+        ser = self.get_serializer(data=request.data)
+        if ser.is_valid():
+            with transaction.atomic():
+                results = ser.save()
+            data = ChatBulkResultSerializer(results, many=True).data
+            for result in data:
+                if result["chat"] is not None:
+                    push_chat(result["chat"], result["receiver"])
+            return Response(data, status.HTTP_201_CREATED)
+        else:
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+    @extend_schema(
+        responses={
+            204: OpenApiResponse(OpenApiTypes.NONE, "Successful, no content"),
+            404: OpenApiResponse(ErrorSerializer, "User not found")
+        }
+    )
+    def destroy(self, request, *args, **kwargs):
+        """Delete a chat"""
+
+        return super().destroy(request, *args, **kwargs)
+
+    @extend_schema(
+        parameters=[*cursor_paginator_header_params],
+        responses={
+            200: OpenApiResponse(
+                ChatDisplaySerializer(many=True),
+                "Successfully retrieved all chats for this user."
+            ),
+        }
+    )
+    def list(self, request, *args, **kwargs):
+        """List chats that belong to the logged in user."""
+
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(
+        parameters=[
+            SyncUrlParamsSerializer,
+            OpenApiParameter(
+                "If-None-Match", type=OpenApiTypes.STR,
+                location=OpenApiParameter.HEADER, required=False,
+                description="ETag of the previous sync with the same cursor."
+            ),
+            OpenApiParameter(
+                "ETag", type=OpenApiTypes.STR, location=OpenApiParameter.HEADER,
+                required=False, response=[200, 304],
+                description="Entity tag of this sync response."
+            ),
+        ],
+        responses={
+            200: OpenApiResponse(
+                ChatSyncSerializer, "Successfully retrieved changes since the cursor."
+            ),
+            304: OpenApiResponse(OpenApiTypes.NONE, "Nothing changed since the cursor."),
+            400: OpenApiResponse(
+                URLParamsValidationErrorSerializer, "Bad URL params format."
+            ),
+        }
+    )
+    @action(["get"], detail=False, serializer_class=SyncUrlParamsSerializer)
+    def sync(self, request, *args, **kwargs):
+        """
+        Incremental sync of the logged in user's chats. Returns chats created
+        or modified and IDs of chats deleted after the cursor, along with the
+        cursor for the next sync.
+        """
+
+        ser = self.get_serializer(data=dict(request.query_params))
+        if not ser.is_valid():
+            return URLParamsValidationErrorSerializer(data=ser.errors).json_response()
+
+        cursor: SyncCursor = ser.validated_data.get("cursor") or SyncCursor()
+        user = request.user
+        of_user = Q(sender=user) | Q(receiver=user)
+        chats_qset = Chat.objects.filter(of_user)
+        tombstones_qset = ChatTombstone.objects.filter(of_user)
+
+        # Cheap fingerprint of the user's chats, answer conditional
+        # requests before running the sync queries.
+        last_modified = chats_qset.aggregate(last=Max("modified_at"))["last"]
+        last_deleted = tombstones_qset.aggregate(last=Max("deleted_at"))["last"]
+        fingerprint = f"{request.query_params.get('cursor')}:{last_modified}:{last_deleted}"
+        etag = quote_etag(hashlib.md5(fingerprint.encode()).hexdigest())
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        chats, more_chats, cursor.chats, cursor.seen_chats = self.read_changes(
+            chats_qset.select_related("sender", "receiver"), "modified_at",
+            cursor.chats, cursor.seen_chats
+        )
+        tombstones, more_tombstones, cursor.tombstones, cursor.seen_tombstones = \
+            self.read_changes(
+                tombstones_qset, "deleted_at", cursor.tombstones, cursor.seen_tombstones
+            )
+        has_more = more_chats or more_tombstones
+
+        data = ChatSyncSerializer({
+            "chats": chats, "deleted": [t.chat_id for t in tombstones],
+            "cursor": cursor.encode(), "has_more": has_more
+        }).data
+        return Response(data, headers={"ETag": etag})
+
+    def read_changes(self, queryset, field: str, position: Optional[list], seen: list):
+        """
+        Up to sync_page_size rows of `queryset` changed after `position`, a
+        [`field`, id] high-water mark, oldest first.
+
+        `field` is set when a row is saved, not when it's committed, so rows
+        of slow transactions turn up behind the mark. Rows are read again
+        from CHAT_SYNC_OVERLAP before it, skipping the `seen` [`field`, id]
+        of that window. Returns the rows, whether more are left, and the
+        position and seen rows of the next sync.
+        """
+
+        overlap = app_settings["CHAT_SYNC_OVERLAP"]
+        limit = self.sync_page_size
+        queryset = queryset.order_by(field, "id")
+        if position is not None:
+            queryset = queryset.filter(**{f"{field}__gte": position[0] - overlap})
+
+        seen = {(time, id) for time, id in seen}
+        # at most the seen rows are skipped
+        rows = [
+            row for row in queryset[:limit + 1 + len(seen)]
+            if (getattr(row, field), row.id) not in seen
+        ]
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+
+        changes = [(getattr(row, field), row.id) for row in rows]
+        if changes:
+            position = list(max(changes[-1], tuple(position or changes[-1])))
+        if position is None:
+            return rows, has_more, None, []
+        seen = sorted(
+            change for change in seen.union(changes)
+            if change[0] >= position[0] - overlap
+        )
+        return rows, has_more, position, [list(change) for change in seen]
+
+    @extend_schema(
+        parameters=[ThreadUrlParamsSerializer],
+        responses={
+            200: OpenApiResponse(
+                ChatThreadSerializer(many=True),
+                "Successfully retrieved the thread, ancestors first."
+            ),
+            400: OpenApiResponse(
+                URLParamsValidationErrorSerializer, "Bad URL params format."
+            ),
+            404: OpenApiResponse(ErrorSerializer, "Chat not found")
+        }
+    )
+    @action(["get"], detail=True, serializer_class=ThreadUrlParamsSerializer)
+    def thread(self, request, *args, **kwargs):
+        """
+        Reply thread of a chat: the chats it responds to, up to the first,
+        then the replies under it. Rebuild the tree with respond_to.
+        """
+
+        ser = self.get_serializer(data=dict(request.query_params))
+        if not ser.is_valid():
+            return URLParamsValidationErrorSerializer(data=ser.errors).json_response()
+        depth = ser.validated_data.get("depth", app_settings["CHAT_THREAD_MAX_DEPTH"])
+
+        chat = self.get_object()
+        chats = {
+            c.id: c for c in Chat.objects
+                .thread(chat.id, request.user.id, depth)
+                .select_related("sender", "receiver")
+        }
+
+        # Depths of ancestors, walking up from the chat.
+        chats[chat.id].depth = 0
+        current = chats[chat.id]
+        while current.respond_to_id in chats:
+            chats[current.respond_to_id].depth = current.depth - 1
+            current = chats[current.respond_to_id]
+        # Depths of replies, every other chat is below the chat.
+        for c in sorted(chats.values(), key=lambda c: (c.created_at, c.id)):
+            if not hasattr(c, "depth"):
+                c.depth = chats[c.respond_to_id].depth + 1
+
+        thread = sorted(chats.values(), key=lambda c: (c.depth, c.created_at, c.id))
+        return Response(ChatThreadSerializer(thread, many=True).data)
+
+    @extend_schema(
+        parameters=[SearchUrlParamsSerializer, *paginator_header_params],
+        responses={
+            200: OpenApiResponse(
+                ChatSearchResultSerializer(many=True),
+                "Successfully searched the logged in user's chats, best match first."
+            ),
+            400: OpenApiResponse(
+                URLParamsValidationErrorSerializer, "Bad URL params format."
+            ),
+        }
+    )
+    @action(
+        ["get"], detail=False, serializer_class=SearchUrlParamsSerializer,
+        pagination_class=GeneralPagingation
+    )
+    def search(self, request, *args, **kwargs):
+        """Full-text search of messages of the logged in user's chats."""
+
+        ser = self.get_serializer(data=dict(request.query_params))
+        if not ser.is_valid():
+            return URLParamsValidationErrorSerializer(data=ser.errors).json_response()
+
+        queryset = search_chats(self.get_queryset(), ser.validated_data["q"])
+        page = self.paginate_queryset(queryset)
+        data = ChatSearchResultSerializer(page, many=True).data
+        return self.get_paginated_response(data)
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(
+                UnreadCountsSerializer, "Successfully retrieved unread counts."
+            ),
+        }
+    )
+    @action(["get"], detail=False, serializer_class=UnreadCountsSerializer)
+    def unread(self, request, *args, **kwargs):
+        """Number of chats the logged in user hasn't read, by sender."""
+
+        counts = UnreadCounters().get_all(request.user.id)
+        data = UnreadCountsSerializer(
+            {"total": sum(counts.values()), "peers": counts}
+        ).data
+        return Response(data)
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(ReadReceiptSerializer, "Successfully marked as read."),
+            400: OpenApiResponse(ValidationErrorSerializer, "Bad request")
+        }
+    )
+    @action(["post"], detail=False, serializer_class=ReadReceiptSerializer)
+    def read(self, request, *args, **kwargs):
+        """Mark all chats a user sent the logged in user as read."""
+
+        ser = self.get_serializer(data=request.data)
+        if not ser.is_valid():
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+        user, peer = request.user, ser.validated_data["peer"]
+        last_read_chat = Chat.objects \
+            .filter(sender=peer, receiver=user) \
+            .order_by("-created_at", "-id") \
+            .first()
+        receipt, _ = ReadReceipt.objects.update_or_create(
+            user=user, peer=peer,
+            defaults={"last_read_chat": last_read_chat, "read_at": timezone.now()}
+        )
+        UnreadCounters().mark_read(user.id, peer.id)
+        return Response(self.get_serializer(receipt).data)
+
+    @extend_schema(
+        parameters=[ExportUrlParamsSerializer],
+        responses={
+            (200, "application/x-ndjson"): OpenApiResponse(
+                OpenApiTypes.BINARY, "Chats, one JSON object per line."
+            ),
+            (200, "text/csv"): OpenApiResponse(
+                OpenApiTypes.BINARY, "Chats, with a header row."
+            ),
+            400: OpenApiResponse(
+                URLParamsValidationErrorSerializer, "Bad URL params format."
+            ),
+        }
+    )
+    @action(["get"], detail=False, serializer_class=ExportUrlParamsSerializer)
+    def export(self, request, *args, **kwargs):
+        """
+        Download all chats of the logged in user, oldest first. The file is
+        streamed as it's read, however many chats there are.
+        """
+
+        ser = self.get_serializer(data=dict(request.query_params))
+        if not ser.is_valid():
+            return URLParamsValidationErrorSerializer(data=ser.errors).json_response()
+
+        user = request.user
+        export_format = ser.validated_data.get("export_format", "ndjson")
+        response = StreamingHttpResponse(
+            export_chats(user, export_format),
+            content_type=content_types[export_format]
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="chats-{user.id}.{export_format}"'
+        )
+        return response
+
+    def perform_destroy(self, instance: Chat):
+        with transaction.atomic():
+            ChatTombstone.objects.create(
+                chat_id=instance.id, sender_id=instance.sender_id,
+                receiver_id=instance.receiver_id
+            )
+            instance.delete()
+
+    def get_queryset(self):
+        user = self.request.user
+        from_user = Q(sender=user)
+        to_user = Q(receiver=user)
+        return super().get_queryset() \
+            .filter(from_user | to_user) \
+            .select_related("sender", "receiver")
+
+    def seek_page(self, queryset, ordering, position, limit):
+        """Serve recent list pages from the user's timeline, see chats.timelines."""
+
+        if self.action != "list" or tuple(ordering) != self.cursor_ordering:
+            return None
+        return Timelines().page(self.request.user.id, queryset, position, limit)
+
+
+
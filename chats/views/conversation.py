@@ -0,0 +1,104 @@
+"""
+Conversation (inbox) views
+"""
+
+from django.db.models import Q
+
+from rest_framework.viewsets import GenericViewSet
+from rest_framework.mixins import ListModelMixin
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from drf_spectacular.utils import extend_schema, OpenApiResponse
+
+from common_app.pagination import GeneralCursorPagination, cursor_paginator_header_params
+
+from exceptions_and_logging.serializers import ErrorSerializer
+
+from ..archive import restore_conversation
+from ..models import Chat, Conversation
+from ..serializers import ChatDisplaySerializer, ConversationDisplaySerializer
+
+
+class ConversationViewset(ListModelMixin, GenericViewSet):
+
+    queryset = Conversation.objects.all()
+    permission_classes = [IsAuthenticated]
+    serializer_class = ConversationDisplaySerializer
+    pagination_class = GeneralCursorPagination
+    cursor_ordering = ("-last_activity_at", "-id")
+
+    @extend_schema(
+        parameters=[*cursor_paginator_header_params],
+        responses={
+            200: OpenApiResponse(
+                ConversationDisplaySerializer(many=True),
+                "Successfully retrieved the inbox of this user."
+            ),
+        }
+    )
+    def list(self, request, *args, **kwargs):
+        """
+        Inbox of the logged in user, one entry per conversation
+        ordered by most recent activity.
+        """
+
+        return super().list(request, *args, **kwargs)
+
+    @extend_schema(
+        parameters=[*cursor_paginator_header_params],
+        responses={
+            200: OpenApiResponse(
+                ChatDisplaySerializer(many=True),
+                "Successfully retrieved the chats of this conversation."
+            ),
+            404: OpenApiResponse(ErrorSerializer, "Conversation not found")
+        }
+    )
+    @action(
+        ["get"], detail=True, serializer_class=ChatDisplaySerializer,
+        cursor_ordering=("-created_at", "-id")
+    )
+    def chats(self, request, *args, **kwargs):
+        """List chats of a conversation."""
+
+        conversation = self.get_object()
+        chats_qset = Chat.objects \
+            .filter(conversation=conversation) \
+            .select_related("sender", "receiver")
+        page = self.paginate_queryset(chats_qset)
+        data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
+
+    @extend_schema(
+        request=None,
+        responses={
+            200: OpenApiResponse(
+                ConversationDisplaySerializer, "Successfully restored archived chats."
+            ),
+            404: OpenApiResponse(ErrorSerializer, "Conversation not found")
+        }
+    )
+    @action(["post"], detail=True)
+    def restore(self, request, *args, **kwargs):
+        """
+        Bring back archived chats of a conversation, older chats are
+        archived after a while and don't show until restored.
+        """
+
+        conversation = self.get_object()
+        restore_conversation(conversation)
+        conversation = self.get_object()
+        return Response(self.get_serializer(conversation).data)
+
+    def get_queryset(self):
+        user = self.request.user
+        as_user_one = Q(user_one=user)
+        as_user_two = Q(user_two=user)
+        return super().get_queryset() \
+            .filter(as_user_one | as_user_two) \
+            .filter(Q(chat_count__gt=0) | Q(archived_count__gt=0)) \
+            .select_related(
+                "user_one", "user_two", "last_chat__sender", "last_chat__receiver"
+            )
@@ -0,0 +1,303 @@
+"""
+Chunked, resumable and presigned upload views for chat attachments
+"""
+
+import io
+
+from django.core.files import File
+from django.db import transaction
+
+from rest_framework.viewsets import GenericViewSet
+from rest_framework.mixins import CreateModelMixin, RetrieveModelMixin
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.response import Response
+from rest_framework import status
+
+from drf_spectacular.utils import (
+    extend_schema, OpenApiResponse, OpenApiTypes
+)
+
+from common_app.serializers import ValidationErrorSerializer
+from common_app.utils.general_utils import ChainedReader
+
+from exceptions_and_logging.exceptions import BadRequest
+from exceptions_and_logging.serializers import ErrorSerializer
+
+from ..models import Chat, ChatUpload, ChatUploadPart
+from ..presigned import get_presigned_upload_class
+from ..serializers import (
+    ChatUploadSerializer, ChatUploadCommitSerializer, ChatDisplaySerializer,
+    PresignedUploadSerializer, PresignedUploadConfirmSerializer
+)
+from ..utils import push_chat
+
+
+class ChatUploadViewset(CreateModelMixin, RetrieveModelMixin, GenericViewSet):
+    """
+    Upload flow: create an upload with the file's name and size, PUT each
+    chunk to its index, then commit the upload to a chat. If a connection
+    drops, retrieve the upload to find the chunks left to send.
+
+    Or skip the web server: presign an upload, send the file straight to
+    storage with the returned url and fields, then confirm it to a chat.
+    """
+
+    queryset = ChatUpload.objects.all()
+    permission_classes = [IsAuthenticated]
+    serializer_class = ChatUploadSerializer
+
+    @extend_schema(
+        responses={
+            201: OpenApiResponse(ChatUploadSerializer, "Successfully started an upload."),
+            400: OpenApiResponse(ValidationErrorSerializer, "Bad request")
+        }
+    )
+    def create(self, request, *args, **kwargs):
+        """Start a chunked upload"""
+
+        ser = self.get_serializer(data=request.data)
+        if ser.is_valid():
+            ser.save()
+            return Response(ser.data, status.HTTP_201_CREATED)
+        else:
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(ChatUploadSerializer, "Success"),
+            404: OpenApiResponse(ErrorSerializer, "Upload not found")
+        }
+    )
+    def retrieve(self, request, *args, **kwargs):
+        """Progress of an upload, shows chunks already received."""
+
+        return super().retrieve(request, *args, **kwargs)
+
+    @extend_schema(
+        request={"application/octet-stream": OpenApiTypes.BINARY},
+        responses={
+            200: OpenApiResponse(ChatUploadSerializer, "Successfully stored the chunk."),
+            400: OpenApiResponse(ErrorSerializer, "Bad chunk"),
+            404: OpenApiResponse(ErrorSerializer, "Upload not found")
+        }
+    )
+    @action(["put"], detail=True, url_path=r"chunks/(?P<index>[0-9]+)")
+    def chunks(self, request, index, *args, **kwargs):
+        """
+        Upload a chunk as the raw request body. Every chunk must be exactly
+        chunk_size bytes, except the last. Sending a chunk again replaces it.
+        """
+
+        upload: ChatUpload = self.get_object()
+        index = int(index)
+        if upload.chat_id is not None:
+            raise BadRequest(
+                error_msg="Upload already committed.", error_code="upload_committed"
+            )
+        if index >= upload.chunk_count:
+            raise BadRequest(
+                error_msg=f"Chunk index must be less than {upload.chunk_count}.",
+                error_code="chunk_out_of_range"
+            )
+
+        expected_size = upload.expected_chunk_size(index)
+        if int(request.META.get("CONTENT_LENGTH") or 0) != expected_size:
+            raise BadRequest(
+                error_msg=f"Chunk {index} must be exactly {expected_size} bytes.",
+                error_code="bad_chunk_size"
+            )
+
+        # Stream the body straight to storage, never read it whole.
+        storage, name = upload.storage, upload.part_name(index)
+        if storage.exists(name):
+            storage.delete(name)
+        stream = io.BufferedReader(ChainedReader([request.stream]))
+        name = storage.save(name, File(stream, name=name))
+        if storage.size(name) != expected_size:
+            storage.delete(name)
+            raise BadRequest(
+                error_msg=f"Chunk {index} must be exactly {expected_size} bytes.",
+                error_code="bad_chunk_size"
+            )
+
+        ChatUploadPart.objects.update_or_create(
+            upload=upload, index=index,
+            defaults={"name": name, "size": expected_size}
+        )
+        return Response(self.get_serializer(upload).data)
+
+    @extend_schema(
+        request=ChatUploadCommitSerializer,
+        responses={
+            201: OpenApiResponse(
+                ChatDisplaySerializer, "Successfully created a chat with the file."
+            ),
+            400: OpenApiResponse(ValidationErrorSerializer, "Bad request"),
+            404: OpenApiResponse(ErrorSerializer, "Upload not found")
+        }
+    )
+    @action(["post"], detail=True, serializer_class=ChatUploadCommitSerializer)
+    def commit(self, request, *args, **kwargs):
+        """
+        Assemble the uploaded chunks into the file and attach it to a new
+        chat between the logged in user and another user.
+        """
+
+        upload: ChatUpload = self.get_object()
+        if upload.chat_id is not None:
+            raise BadRequest(
+                error_msg="Upload already committed.", error_code="upload_committed"
+            )
+        parts = list(upload.parts.order_by("index"))
+        if len(parts) != upload.chunk_count:
+            raise BadRequest(
+                error_msg="Some chunks have not been uploaded.",
+                error_code="upload_incomplete",
+                hint="Retrieve the upload to find chunks left to send."
+            )
+
+        data = dict(request.data.items())
+        data["sender"] = request.user.id
+        ser = ChatUploadCommitSerializer(
+            data=data, context={"file_name": upload.filename}
+        )
+        if not ser.is_valid():
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+        # Parts are read one after the other as storage consumes the file.
+        storage = upload.storage
+        stream = io.BufferedReader(
+            ChainedReader(storage.open(part.name) for part in parts)
+        )
+        file = File(stream, name=upload.filename)
+        file.size = upload.size
+        file_field = Chat._meta.get_field("file")
+        file_name = storage.save(
+            file_field.generate_filename(None, upload.filename), file
+        )
+
+        with transaction.atomic():
+            chat = ser.save(file=file_name)
+            upload.chat = chat
+            upload.save()
+            upload.parts.all().delete()
+        for part in parts:
+            storage.delete(part.name)
+
+        data = ChatDisplaySerializer(chat).data
+        push_chat(data, chat.receiver_id)
+        return Response(data, status.HTTP_201_CREATED)
+
+    @extend_schema(
+        responses={
+            201: OpenApiResponse(
+                PresignedUploadSerializer, "Successfully presigned an upload."
+            ),
+            400: OpenApiResponse(ValidationErrorSerializer, "Bad request")
+        }
+    )
+    @action(["post"], detail=False, serializer_class=PresignedUploadSerializer)
+    def presign(self, request, *args, **kwargs):
+        """
+        Get a url to upload a file straight to storage. Send the file with
+        the returned method, including the returned form fields if any,
+        before the upload expires.
+        """
+
+        ser = self.get_serializer(data=request.data)
+        if not ser.is_valid():
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+        presigned = get_presigned_upload_class()(request.user)
+        target = presigned.presign(ser.validated_data["filename"])
+        return Response(self.get_serializer(target).data, status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request=PresignedUploadConfirmSerializer,
+        responses={
+            201: OpenApiResponse(
+                ChatDisplaySerializer, "Successfully created a chat with the file."
+            ),
+            400: OpenApiResponse(ValidationErrorSerializer, "Bad request")
+        }
+    )
+    @action(["post"], detail=False, serializer_class=PresignedUploadConfirmSerializer)
+    def confirm(self, request, *args, **kwargs):
+        """
+        Attach a file uploaded straight to storage to a new chat between
+        the logged in user and another user.
+        """
+
+        data = dict(request.data.items())
+        data["sender"] = request.user.id
+        presigned = get_presigned_upload_class()(request.user)
+        ser = self.get_serializer(data=data, context={"presigned": presigned})
+        if not ser.is_valid():
+            return ValidationErrorSerializer(data=ser.errors).json_response()
+
+        file_name = ser.validated_data["file"]
+        if not presigned.claim(file_name):
+            raise BadRequest(
+                error_msg="Upload already confirmed.", error_code="invalid_upload"
+            )
+        try:
+            chat = ser.save()
+        except Exception:
+            presigned.release(file_name)
+            raise
+        data = ChatDisplaySerializer(chat).data
+        push_chat(data, chat.receiver_id)
+        return Response(data, status.HTTP_201_CREATED)
+
+    @extend_schema(
+        request={"application/octet-stream": OpenApiTypes.BINARY},
+        responses={
+            204: OpenApiResponse(description="Successfully stored the file."),
+            400: OpenApiResponse(ErrorSerializer, "Bad upload")
+        }
+    )
+    @action(
+        ["put"], detail=False, url_path=r"local/(?P<token>[^/]+)",
+        url_name="local-upload", authentication_classes=[],
+        permission_classes=[AllowAny]
+    )
+    def local_upload(self, request, token, *args, **kwargs):
+        """
+        Upload target of presigned uploads when files are stored locally,
+        stands in for the storage service. The token authorizes the upload.
+        """
+
+        presigned = get_presigned_upload_class()(None)
+        try:
+            name = presigned.load_token(token)
+        except ValueError as e:
+            raise BadRequest(error_msg=str(e), error_code="invalid_upload")
+        # the file of a chat can't be replaced
+        if presigned.is_confirmed(name):
+            raise BadRequest(
+                error_msg="Upload already confirmed.", error_code="invalid_upload"
+            )
+
+        size = int(request.META.get("CONTENT_LENGTH") or 0)
+        if not 0 < size <= presigned.max_size:
+            raise BadRequest(
+                error_msg=f"File must be between 1 and {presigned.max_size} bytes.",
+                error_code="bad_file_size"
+            )
+
+        storage = presigned.storage
+        if storage.exists(name):
+            storage.delete(name)
+        stream = io.BufferedReader(ChainedReader([request.stream]))
+        name = storage.save(name, File(stream, name=name))
+        if storage.size(name) != size:
+            storage.delete(name)
+            raise BadRequest(
+                error_msg="File size doesn't match Content-Length.",
+                error_code="bad_file_size"
+            )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def get_queryset(self):
+        return super().get_queryset().filter(owner=self.request.user)
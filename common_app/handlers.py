@@ -0,0 +1,79 @@
+"""
+ASGI handler streaming responses off the event loop.
+
+Django 4.0 iterates streaming responses inside the event loop when served
+over ASGI, so a response whose iterator blocks, e.g one reading chats from
+the database, stalls every other request and websocket of the worker. The
+ORM refuses to run there anyway. StreamingASGIHandler gives each streaming
+response a thread of its own: every part is produced there while the loop
+awaits it, and the iterator is closed in that same thread.
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+from django.core.handlers.asgi import ASGIHandler
+from django.db import connections
+
+
+class StreamingASGIHandler(ASGIHandler):
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+
+        await send({
+            "type": "http.response.start", "status": response.status_code,
+            "headers": self.get_response_headers(response)
+        })
+
+        loop = asyncio.get_running_loop()
+        # One thread, database connections and cursors stay with their thread.
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="streaming")
+        parts = iter(response)
+        done = object()
+        try:
+            while True:
+                part = await loop.run_in_executor(executor, next, parts, done)
+                if part is done:
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body"})
+        finally:
+            # Sends request_finished from the thread, the view's own thread
+            # is cleaned up when its next request starts.
+            await loop.run_in_executor(executor, self.close_response, response)
+            executor.shutdown(wait=False)
+
+    @staticmethod
+    def close_response(response) -> None:
+        try:
+            response.close()
+        finally:
+            connections.close_all()
+
+    @staticmethod
+    def get_response_headers(response) -> list:
+        """Headers and cookies of `response`, encoded as ASGIHandler does."""
+
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode("ascii")
+            if isinstance(value, str):
+                value = value.encode("latin1")
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append(
+                (b"Set-Cookie", cookie.output(header="").encode("ascii").strip())
+            )
+        return headers
+
+
+def get_asgi_application() -> StreamingASGIHandler:
+    """django.core.asgi.get_asgi_application, with StreamingASGIHandler."""
+
+    django.setup(set_prefix=False)
+    return StreamingASGIHandler()
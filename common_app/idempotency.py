@@ -0,0 +1,72 @@
+"""
+Idempotency keys, so clients can safely retry requests that create objects.
+
+A client sends an `Idempotency-Key` header, unique per intended request.
+The first successful response is kept in Redis for IDEMPOTENCY_KEY_TTL and
+replayed for retries with the same key, without running the view again.
+
+Redis is only a fast path. Views should also save the key with the object
+under a unique constraint, and replay from the database on conflicts.
+"""
+
+import json
+import logging
+from typing import Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from exceptions_and_logging.exceptions import BadRequest
+
+from .utils.general_utils import RedisTimePersist, app_settings
+
+
+logger = logging.getLogger(__name__)
+
+header = "Idempotency-Key"
+replayed_header = "Idempotent-Replayed"
+max_key_length = 64
+
+
+def get_idempotency_key(request) -> Optional[str]:
+    """Idempotency key of a request, None if the client didn't send one."""
+
+    key = request.headers.get(header)
+    if key is None:
+        return None
+    if not 0 < len(key) <= max_key_length:
+        raise BadRequest(
+            error_msg=f"{header} must be 1 to {max_key_length} characters.",
+            error_code="invalid_idempotency_key"
+        )
+    return key
+
+
+class IdempotentResponses:
+    """Responses stored by scope, user and idempotency key."""
+
+    def __init__(self, scope: str) -> None:
+        self.scope = scope
+        self.redis = RedisTimePersist(ttl=app_settings["IDEMPOTENCY_KEY_TTL"])
+
+    def redis_key(self, user_id: int, key: str) -> str:
+        return f"idempotency:{self.scope}:{user_id}:{key}"
+
+    def get(self, user_id: int, key: str) -> Optional[Tuple[int, dict]]:
+        """Status code and data of the stored response, if any."""
+
+        try:
+            stored = self.redis.get(self.redis_key(user_id, key))
+        except RedisError:
+            logger.exception("Idempotent response not read")
+            return None
+        if stored is None:
+            return None
+        stored = json.loads(stored)
+        return stored["status"], stored["data"]
+
+    def set(self, user_id: int, key: str, status_code: int, data) -> None:
+        stored = json.dumps({"status": status_code, "data": data}, default=str)
+        try:
+            self.redis.set(self.redis_key(user_id, key), stored)
+        except RedisError:
+            logger.exception("Idempotent response not stored")
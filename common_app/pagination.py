@@ -1,8 +1,16 @@
 """App-wide pagination settings"""
 
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from typing import Optional, Tuple
 
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination, CursorPagination
 from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 from  drf_spectacular.utils import OpenApiParameter, OpenApiTypes
 
@@ -13,16 +21,189 @@ class GeneralPagingation(PageNumberPagination):
     page_query_param = "page"
     page_size_query_description = "page_size"
 
+    def paginate_queryset(self, queryset, request, view=None):
+        # Views may point the links elsewhere, e.g a POST answering with a
+        # page of what a listing shows, through `get_pagination_url(request)`.
+        get_pagination_url = getattr(view, "get_pagination_url", None)
+        self.base_url = (
+            get_pagination_url(request) if get_pagination_url is not None
+            else request.build_absolute_uri()
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.page.has_next():
+            return None
+        page_number = self.page.next_page_number()
+        return replace_query_param(self.base_url, self.page_query_param, page_number)
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.page.has_previous():
+            return None
+        page_number = self.page.previous_page_number()
+        if page_number == 1:
+            return remove_query_param(self.base_url, self.page_query_param)
+        return replace_query_param(self.base_url, self.page_query_param, page_number)
+
     def get_paginated_response(self, data):
         response = Response(data)
         response['count'] = self.page.paginator.count
         response['next'] = self.get_next_link()
         response['previous'] = self.get_previous_link()
         return response
-    
+
+    def get_paginated_response_schema(self, schema):
+        return schema
+
+
+class GeneralCursorPagination(CursorPagination):
+    """Keyset (seek) pagination.
+
+    Pages are fetched with a `WHERE (a, b) < (x, y)` style predicate on the
+    view's `cursor_ordering` instead of an OFFSET, and no COUNT is run, so
+    every page costs the same no matter how deep the client goes.
+
+    The ordering should end with a unique field (usually `id`) so that the
+    position in the cursor identifies exactly one row, e.g
+    ("-created_at", "-id") or ("first_name", "id").
+    """
+
+    max_page_size = 20
+    page_size = 10
+    ordering = ("-id",)
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+
+        if self.cursor is None:
+            reverse, position = False, None
+        else:
+            reverse, position = self.cursor
+
+        ordering = self.ordering
+        if reverse:
+            ordering = self._reverse(ordering)
+
+        # Views may serve pages from elsewhere (e.g a cache) through
+        # `seek_page(queryset, ordering, position, limit)`, None falls back
+        # to the database.
+        results = None
+        seek_page = getattr(view, "seek_page", None)
+        if seek_page is not None:
+            results = seek_page(queryset, ordering, position, self.page_size + 1)
+
+        if results is None:
+            queryset = queryset.order_by(*ordering)
+            if position is not None:
+                queryset = queryset.filter(self.seek_filter(ordering, position))
+
+            # Fetch one extra row to find out if there's another page.
+            try:
+                results = list(queryset[:self.page_size + 1])
+            except (ValidationError, ValueError, TypeError):
+                # cursor position doesn't match the ordering field types
+                raise NotFound(self.invalid_cursor_message)
+        has_more = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+
+        if reverse:
+            self.has_next = position is not None
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_ordering(self, request, queryset, view) -> Tuple[str]:
+        ordering = getattr(view, "cursor_ordering", None) or self.ordering
+        if isinstance(ordering, str):
+            ordering = (ordering,)
+        return tuple(ordering)
+
+    @staticmethod
+    def seek_filter(ordering: Tuple[str], position: list) -> Q:
+        """Build the keyset predicate for rows after `position`.
+
+        For ordering (a, b) and position (x, y) this is
+        `a > x OR (a = x AND b > y)`, with `>` flipped to `<` for
+        descending fields.
+        """
+
+        final_q = Q()
+        equal_q = Q()
+        for order, value in zip(ordering, position):
+            attr = order.lstrip("-")
+            lookup = "lt" if order.startswith("-") else "gt"
+            final_q |= equal_q & Q(**{f"{attr}__{lookup}": value})
+            equal_q &= Q(**{attr: value})
+        return final_q
+
+    def get_next_link(self) -> Optional[str]:
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor((False, self._position(self.page[-1])))
+
+    def get_previous_link(self) -> Optional[str]:
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Walked past the end, the first page is the best we can do.
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor((True, self._position(self.page[0])))
+
+    def encode_cursor(self, cursor) -> str:
+        reverse, position = cursor
+        tokens = {"p": position}
+        if reverse:
+            tokens["r"] = 1
+        querystring = json.dumps(tokens, separators=(",", ":"), default=str)
+        encoded = urlsafe_b64encode(querystring.encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request) -> Optional[Tuple[bool, list]]:
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+
+        try:
+            tokens = json.loads(urlsafe_b64decode(encoded.encode("ascii")))
+            position = tokens["p"]
+            reverse = bool(tokens.get("r", 0))
+            assert isinstance(position, list)
+            assert len(position) == len(self.ordering)
+        except Exception:
+            raise NotFound(self.invalid_cursor_message)
+
+        return reverse, position
+
+    def get_paginated_response(self, data):
+        response = Response(data)
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        return response
+
     def get_paginated_response_schema(self, schema):
         return schema
 
+    def _position(self, instance) -> list:
+        return [
+            getattr(instance, order.lstrip("-")) for order in self.ordering
+        ]
+
+    @staticmethod
+    def _reverse(ordering: Tuple[str]) -> Tuple[str]:
+        return tuple(
+            order[1:] if order.startswith("-") else f"-{order}"
+            for order in ordering
+        )
+
 
 # Open API parameters for pagination, in response headers.
 count = OpenApiParameter(
@@ -43,4 +224,20 @@ previous = OpenApiParameter(
     description="Url to previous set of objects to display."
 )
 
-paginator_header_params = [count, next, previous]
\ No newline at end of file
+paginator_header_params = [count, next, previous]
+
+# Cursor paginated endpoints don't count, next and previous
+# carry an opaque cursor instead of a page number.
+cursor_next = OpenApiParameter(
+    "next", type=OpenApiTypes.URI, location=OpenApiParameter.HEADER,
+    required=False, response=[200],
+    description="Url, with an opaque cursor, to next set of objects to display."
+)
+
+cursor_previous = OpenApiParameter(
+    "previous", type=OpenApiTypes.URI, location=OpenApiParameter.HEADER,
+    required=False, response=[200],
+    description="Url, with an opaque cursor, to previous set of objects to display."
+)
+
+cursor_paginator_header_params = [cursor_next, cursor_previous]
@@ -0,0 +1,172 @@
+"""
+Sliding window rate limits, per user and per endpoint.
+
+Each (user, view, action) has its own window: the timestamps of the
+requests made in the last `duration` seconds. A request is allowed while
+fewer than `num_requests` are in the window. Unlike fixed windows, bursts
+at the edge of two windows can't double the rate.
+
+Windows live in Redis so limits hold across workers and nodes, checked
+and updated in one Lua script so concurrent requests can't overshoot.
+LocalSlidingWindow keeps them in process instead, for tests and for when
+Redis is unreachable.
+
+Rates come from REST_FRAMEWORK["DEFAULT_THROTTLE_RATES"] by scope, a view
+can override them per action with a `throttle_rates` dict, e.g
+
+    throttle_rates = {"search": "60/min"}
+"""
+
+import importlib
+import logging
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import deque
+from typing import Dict, Optional, Tuple
+
+from redis.exceptions import RedisError
+
+from rest_framework.throttling import SimpleRateThrottle
+
+from .utils.general_utils import RedisTimePersist, app_settings
+
+
+logger = logging.getLogger(__name__)
+
+backend_module_path = "common_app.throttling"
+
+
+class BaseSlidingWindow(ABC):
+
+    @abstractmethod
+    def hit(self, key: str, limit: int, duration: int) -> Tuple[bool, float]:
+        """Record a request if allowed. Returns whether it's allowed and,
+        if not, seconds until it would be."""
+        pass
+
+
+class LocalSlidingWindow(BaseSlidingWindow):
+    """Windows of this process only."""
+
+    def __init__(self) -> None:
+        self.windows: Dict[str, deque] = {}
+        self.lock = threading.Lock()
+
+    def hit(self, key: str, limit: int, duration: int) -> Tuple[bool, float]:
+        now = time.monotonic()
+        with self.lock:
+            window = self.windows.setdefault(key, deque())
+            while window and window[0] <= now - duration:
+                window.popleft()
+            if len(window) < limit:
+                window.append(now)
+                return True, 0
+            return False, window[0] + duration - now
+
+    def clear(self) -> None:
+        with self.lock:
+            self.windows.clear()
+
+
+class RedisSlidingWindow(BaseSlidingWindow):
+    """Windows shared by all processes, as Redis sorted sets of request times."""
+
+    # Redis' clock is used so nodes with skewed clocks agree.
+    script = """
+        local key, duration, limit = KEYS[1], tonumber(ARGV[1]), tonumber(ARGV[2])
+        local time = redis.call("TIME")
+        local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+        redis.call("ZREMRANGEBYSCORE", key, "-inf", now - duration)
+        if redis.call("ZCARD", key) < limit then
+            redis.call("ZADD", key, now, ARGV[3])
+            redis.call("PEXPIRE", key, math.ceil(duration / 1000))
+            return 0
+        end
+        local oldest = redis.call("ZRANGE", key, 0, 0, "WITHSCORES")
+        return tonumber(oldest[2]) + duration - now
+    """
+
+    def __init__(self) -> None:
+        self.sliding_window = RedisTimePersist().instance.register_script(self.script)
+        self.fallback = LocalSlidingWindow()
+
+    def hit(self, key: str, limit: int, duration: int) -> Tuple[bool, float]:
+        try:
+            # durations and waits are in microseconds, the client is looked
+            # up per call as this backend outlives forks.
+            wait = self.sliding_window(
+                keys=[key], args=[duration * 1000000, limit, uuid.uuid4().hex],
+                client=RedisTimePersist().instance
+            )
+        except RedisError:
+            logger.exception("Rate limited in process, Redis is unreachable")
+            return self.fallback.hit(key, limit, duration)
+        return wait == 0, wait / 1000000
+
+
+_backend: Optional[BaseSlidingWindow] = None
+_backend_lock = threading.Lock()
+
+
+def get_sliding_window() -> BaseSlidingWindow:
+    """The process wide backend named by the THROTTLE_BACKEND app setting."""
+
+    global _backend
+    name = app_settings["THROTTLE_BACKEND"]
+    if _backend is None or _backend.__class__.__name__ != name:
+        with _backend_lock:
+            if _backend is None or _backend.__class__.__name__ != name:
+                backend_module = importlib.import_module(backend_module_path)
+                _backend = getattr(backend_module, name)()
+    return _backend
+
+
+class SlidingWindowThrottle(SimpleRateThrottle, ABC):
+    """Base for sliding window throttles, limits each endpoint separately."""
+
+    def allow_request(self, request, view) -> bool:
+        action = getattr(view, "action", None) or request.method.lower()
+        rate = getattr(view, "throttle_rates", {}).get(action, self.rate)
+        if rate is None:
+            return True
+        num_requests, duration = self.parse_rate(rate)
+
+        ident = self.get_ident_for(request)
+        if ident is None:
+            return True
+        key = f"throttle:{self.scope}:{view.__class__.__name__}.{action}:{ident}"
+
+        allowed, self._wait = get_sliding_window().hit(key, num_requests, duration)
+        return allowed
+
+    @abstractmethod
+    def get_ident_for(self, request) -> Optional[str]:
+        """Who the request is limited as, None if this throttle doesn't apply."""
+        pass
+
+    def wait(self) -> Optional[float]:
+        return self._wait
+
+
+class UserSlidingWindowThrottle(SlidingWindowThrottle):
+    """Limits authenticated users by user ID."""
+
+    scope = "user"
+
+    def get_ident_for(self, request) -> Optional[str]:
+        if request.user and request.user.is_authenticated:
+            return str(request.user.pk)
+        return None
+
+
+class AnonSlidingWindowThrottle(SlidingWindowThrottle):
+    """Limits anonymous clients by IP address."""
+
+    scope = "anon"
+
+    def get_ident_for(self, request) -> Optional[str]:
+        if request.user and request.user.is_authenticated:
+            return None
+        return self.get_ident(request)
@@ -1,8 +1,12 @@
+import bisect
+import io
 import os
+import threading
+import time
 
 import redis
 from decouple import config
-from typing import Optional, Union, Any
+from typing import Optional, Union, Any, Iterable
 
 from django.conf import settings
 
@@ -24,18 +28,143 @@ class CastAs:
     int = lambda v: v if v is None else int(v)
 
 
+class RedisMetrics:
+    """
+    Calls, errors and latency histograms of Redis commands run by this
+    process, by command name. Pipelines are timed as one PIPELINE call,
+    the commands they carry are counted as `pipelined`.
+    """
+
+    # upper bounds of the latency buckets, in seconds
+    buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def reset(self) -> None:
+        self.lock = threading.Lock()
+        self.commands = {}
+
+    def observe(self, command: str, seconds: float, error: bool = False, pipelined: Iterable[str] = ()) -> None:
+        with self.lock:
+            entry = self._entry(command)
+            entry["calls"] += 1
+            entry["errors"] += int(error)
+            entry["seconds"] += seconds
+            entry["histogram"][bisect.bisect_left(self.buckets, seconds)] += 1
+            for name in pipelined:
+                self._entry(name)["pipelined"] += 1
+
+    def snapshot(self) -> dict:
+        labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+        with self.lock:
+            return {
+                command: {
+                    **entry, "histogram": dict(zip(labels, entry["histogram"]))
+                } for command, entry in self.commands.items()
+            }
+
+    def _entry(self, command: str) -> dict:
+        if command not in self.commands:
+            self.commands[command] = {
+                "calls": 0, "pipelined": 0, "errors": 0, "seconds": 0.0,
+                "histogram": [0] * (len(self.buckets) + 1)
+            }
+        return self.commands[command]
+
+
+redis_metrics = RedisMetrics()
+
+
+def _command_name(args: tuple) -> str:
+    name = args[0]
+    return name.decode() if isinstance(name, bytes) else str(name).upper()
+
+
+class InstrumentedPipeline(redis.client.Pipeline):
+
+    def execute(self, raise_on_error=True):
+        commands = [_command_name(args) for args, options in self.command_stack]
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().execute(raise_on_error)
+        except redis.RedisError:
+            error = True
+            raise
+        finally:
+            if commands:
+                redis_metrics.observe(
+                    "PIPELINE", time.perf_counter() - start, error, commands
+                )
+
+
+class InstrumentedRedis(redis.StrictRedis):
+    """Redis client recording redis_metrics."""
+
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        error = False
+        try:
+            return super().execute_command(*args, **options)
+        except redis.RedisError:
+            error = True
+            raise
+        finally:
+            redis_metrics.observe(_command_name(args), time.perf_counter() - start, error)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        return InstrumentedPipeline(
+            self.connection_pool, self.response_callbacks, transaction, shard_hint
+        )
+
+
+_redis_client = None
+_redis_client_lock = threading.Lock()
+
+
+def get_redis_client() -> InstrumentedRedis:
+    """
+    The process wide Redis client, its connection pool is created on
+    first use and again in processes forked after that, e.g gunicorn workers.
+    """
+
+    global _redis_client
+    if _redis_client is None:
+        with _redis_client_lock:
+            if _redis_client is None:
+                if env_is_dev():    # local
+                    pool = redis.ConnectionPool(
+                        host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
+                    )
+                else:   # production
+                    pool = redis.ConnectionPool.from_url(config("REDIS_URL"))
+                _redis_client = InstrumentedRedis(connection_pool=pool)
+    return _redis_client
+
+
+def _reset_redis_client() -> None:
+    # Connections of the parent must not be shared, the locks may have
+    # been held while forking.
+    global _redis_client, _redis_client_lock
+    _redis_client = None
+    _redis_client_lock = threading.Lock()
+    redis_metrics.reset()
+
+
+os.register_at_fork(after_in_child=_reset_redis_client)
+
+
 class RedisTimePersist:
-    """Class to handle Redis actions"""
+    """Class to handle Redis actions, on the process wide client."""
 
     def __init__(self, ttl=None) -> None:
         self.ttl = ttl or app_settings["DEFAULT_PIN_TTL"]
+        self.instance = get_redis_client()
 
-        if env_is_dev():    # local
-            self.instance = redis.StrictRedis(
-                host=settings.REDIS_HOST, port=settings.REDIS_PORT, db=0
-            )
-        else:   # production
-            self.instance = redis.from_url(config("REDIS_URL"))
+    def pipeline(self, transaction: bool = True) -> InstrumentedPipeline:
+        return self.instance.pipeline(transaction=transaction)
 
     def set(self, key: str, value: str) -> None:
         self.instance.set(key, value, ex=self.ttl)
@@ -45,9 +174,11 @@ class RedisTimePersist:
         return cast(value)
     
     def hset(self, name, key, value, other_kv: dict = None, ttl: Optional[int] = None) -> None:
-        self.instance.hset(name, key, value, other_kv)
+        pipe = self.pipeline(transaction=False)
+        pipe.hset(name, key, value, other_kv)
         if ttl is not None:
-            self.instance.expire(name, ttl)
+            pipe.expire(name, ttl)
+        pipe.execute()
 
     def hget(self, name, key, cast=CastAs.bool) -> Optional[Any]:
         value: Optional[bytes]= self.instance.hget(name, key)
@@ -58,3 +189,29 @@ class RedisTimePersist:
         return t
 
 
+class ChainedReader(io.RawIOBase):
+    """
+    Read only, non seekable stream over file like objects read one after
+    the other, e.g parts of a chunked upload. Streams are consumed lazily
+    and closed once exhausted, so only one is open at a time.
+
+    Wrap in io.BufferedReader before handing it to a storage backend.
+    """
+
+    def __init__(self, streams: Iterable) -> None:
+        self._streams = iter(streams)
+        self._current = next(self._streams, None)
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while self._current is not None:
+            data = self._current.read(len(buffer))
+            if data:
+                size = len(data)
+                buffer[:size] = data
+                return size
+            self._current.close()
+            self._current = next(self._streams, None)
+        return 0
@@ -10,6 +10,8 @@ from django.contrib.auth.models import Permission
 
 from rest_framework_simplejwt.tokens import RefreshToken, AccessToken
 
+from .general_utils import RedisTimePersist
+
 
 class TestUtilsMixin:
 
@@ -93,3 +95,14 @@ class TestUtilsMixin:
 
         headers.update({"HTTP_AUTHORIZATION": 'Bearer ' + access_token})
         self.headers = headers
+
+    def clear_redis_keys(self, *patterns: str):
+        """
+        Delete Redis keys matching the glob patterns. Redis outlives test
+        transactions, which reuse user and chat IDs.
+        """
+
+        redis = RedisTimePersist().instance
+        for pattern in patterns:
+            for key in redis.scan_iter(pattern):
+                redis.delete(key)
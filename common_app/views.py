@@ -1,3 +1,31 @@
-from django.shortcuts import render
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
-# Create your views here.
+from drf_spectacular.utils import extend_schema, OpenApiResponse, OpenApiTypes
+
+from exceptions_and_logging.serializers import ErrorSerializer
+
+from .utils.general_utils import redis_metrics
+
+
+class RedisMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    @extend_schema(
+        responses={
+            200: OpenApiResponse(
+                OpenApiTypes.OBJECT,
+                "Calls, pipelined calls, errors, total seconds and latency "
+                "histogram (seconds upper bound: calls) by Redis command."
+            ),
+            403: OpenApiResponse(ErrorSerializer, "Staff only")
+        }
+    )
+    def get(self, request, *args, **kwargs):
+        """
+        Redis command metrics of the worker process serving this request,
+        counted since it started.
+        """
+
+        return Response(redis_metrics.snapshot())
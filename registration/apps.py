@@ -8,3 +8,6 @@ class RegistrationConfig(AppConfig):
 
     def ready(self):
         CustomAuthBackendSchema
+        from . import signals  # noqa: F401
+        from .presence import presence
+        presence.policy_class  # resolve the online status policy at startup
@@ -1,18 +1,13 @@
-import importlib
+from urllib.parse import parse_qs
 
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, AuthenticationFailed
 from drf_spectacular.extensions import OpenApiAuthenticationExtension
 
-from common_app.utils.general_utils import app_settings
+from channels.db import database_sync_to_async
+from channels.middleware import BaseMiddleware
 
-
-online_status_policy = app_settings["ONLINE_STATUS_POLICY"]
-policy_module_path = "registration.policies"
-
-
-def get_online_policy_class():
-    policy_module = importlib.import_module(policy_module_path)
-    return getattr(policy_module, online_status_policy)
+from .presence import presence
 
 
 class CustomAuthBackend(JWTAuthentication):
@@ -25,12 +20,56 @@ class CustomAuthBackend(JWTAuthentication):
     def authenticate(self, request):
         if (auth_value:= super().authenticate(request)) is not None:
             user, validated_token = auth_value
-            online_policy = get_online_policy_class()(user, validated_token)
-            online_policy.set_key()
+            presence.set_online(user, validated_token)
             return user, validated_token
         else:
             return 
 
+class JWTAuthMiddleware(BaseMiddleware):
+    """
+    Authenticates websocket connections with the same JWT access tokens
+    CustomAuthBackend accepts. Browsers can't set headers on websockets,
+    so the token may also be passed as a `token` query string parameter.
+
+    scope["user"] is an AnonymousUser if authentication fails, consumers
+    are expected to reject those.
+    """
+
+    async def __call__(self, scope, receive, send):
+        raw_token = self.get_raw_token(scope)
+        scope["user"] = await self.get_user(raw_token)
+        return await super().__call__(scope, receive, send)
+
+    @staticmethod
+    def get_raw_token(scope) -> bytes:
+        headers = dict(scope.get("headers", []))
+        header = headers.get(b"authorization")
+        if header is not None:
+            try:
+                return JWTAuthentication().get_raw_token(header)
+            except AuthenticationFailed:
+                return None
+
+        query = parse_qs(scope.get("query_string", b"").decode())
+        token = query.get("token")
+        return token[0].encode() if token else None
+
+    @database_sync_to_async
+    def get_user(self, raw_token: bytes):
+        # imported here, this module is loaded before the app registry.
+        from django.contrib.auth.models import AnonymousUser
+
+        if raw_token is None:
+            return AnonymousUser()
+
+        backend = CustomAuthBackend()
+        try:
+            validated_token = backend.get_validated_token(raw_token)
+            return backend.get_user(validated_token)
+        except (InvalidToken, AuthenticationFailed):
+            return AnonymousUser()
+
+
 class CustomAuthBackendSchema(OpenApiAuthenticationExtension):
     target_class = "registration.authentication.CustomAuthBackend"
     name = "Authentication schema"
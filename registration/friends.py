@@ -0,0 +1,119 @@
+"""
+Cache of who is friends with whom.
+
+Each user's friend IDs are kept in the Redis set `friends:{user_id}`,
+filled from the database on first use and dropped whenever User.friends
+changes (see registration.signals), so friendship checks don't query the
+M2M table. The `built` member tells an empty friend list from a missing set.
+
+Invalidating also bumps `friends:{user_id}:version`. A rebuild only stores
+what it read if the version is the one it saw before reading, so friends
+read before a change can't be cached after it.
+"""
+
+import logging
+from typing import Iterable, Set
+
+from django.contrib.auth import get_user_model
+
+from redis.exceptions import RedisError
+
+from common_app.utils.general_utils import RedisTimePersist, app_settings
+
+
+logger = logging.getLogger(__name__)
+
+built_member = "built"
+
+
+def friends_key(user_id: int) -> str:
+    return f"friends:{user_id}"
+
+
+def version_key(user_id: int) -> str:
+    return f"{friends_key(user_id)}:version"
+
+
+class FriendsCache:
+
+    # Replaces the set KEYS[1] with the members ARGV[3:] and TTL ARGV[2],
+    # unless the version at KEYS[2] isn't ARGV[1] anymore.
+    store_script = """
+        if (redis.call("GET", KEYS[2]) or "") ~= ARGV[1] then
+            return 0
+        end
+        redis.call("DEL", KEYS[1])
+        for i = 3, #ARGV, 1000 do
+            redis.call("SADD", KEYS[1], unpack(ARGV, i, math.min(i + 999, #ARGV)))
+        end
+        redis.call("EXPIRE", KEYS[1], ARGV[2])
+        return 1
+    """
+
+    def __init__(self) -> None:
+        self.redis = RedisTimePersist().instance
+        self.ttl = int(app_settings["FRIENDS_CACHE_TTL"].total_seconds())
+        self.store = self.redis.register_script(self.store_script)
+
+    def is_friend(self, user_id: int, other_user_id: int) -> bool:
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.sismember(friends_key(user_id), built_member)
+            pipe.sismember(friends_key(user_id), other_user_id)
+            built, is_friend = pipe.execute()
+            if built:
+                return is_friend
+            return other_user_id in self.rebuild(user_id)
+        except RedisError:
+            logger.exception("Friends of user %s not read", user_id)
+            return get_user_model().friends.through.objects.filter(
+                from_user_id=user_id, to_user_id=other_user_id
+            ).exists()
+
+    def get_friend_ids(self, user_id: int) -> Set[int]:
+        try:
+            members = self.redis.smembers(friends_key(user_id))
+            if built_member.encode() in members:
+                members.discard(built_member.encode())
+                return {int(member) for member in members}
+            return self.rebuild(user_id)
+        except RedisError:
+            logger.exception("Friends of user %s not read", user_id)
+            return set(
+                get_user_model().friends.through.objects
+                    .filter(from_user_id=user_id)
+                    .values_list("to_user_id", flat=True)
+            )
+
+    def rebuild(self, user_id: int) -> Set[int]:
+        """
+        Fill the set of a user's friends from the database, and return
+        them. Nothing is stored if they were invalidated meanwhile.
+        """
+
+        version = self.redis.get(version_key(user_id)) or b""
+        friend_ids = set(
+            get_user_model().friends.through.objects
+                .filter(from_user_id=user_id)
+                .values_list("to_user_id", flat=True)
+        )
+        self.store(
+            keys=[friends_key(user_id), version_key(user_id)],
+            args=[version, self.ttl, built_member, *friend_ids]
+        )
+        return friend_ids
+
+    def invalidate(self, user_ids: Iterable[int]) -> None:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.incr(version_key(user_id))
+            # outlives any rebuild that read the previous version
+            pipe.expire(version_key(user_id), self.ttl)
+            pipe.delete(friends_key(user_id))
+        try:
+            pipe.execute()
+        except RedisError:
+            logger.exception("Friends not invalidated")
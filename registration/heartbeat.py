@@ -0,0 +1,78 @@
+"""
+Presence heartbeat, answered ahead of Django.
+
+Active clients report they are still there by POSTing to
+/v1/presence/heartbeat/ with their access token, as often as every few
+seconds. Going through Django and DRF for that costs far more than the
+presence write itself, so HeartbeatMiddleware answers it as a raw ASGI
+request: it verifies the JWT, marks the user online (see
+presence.set_online, writes are coalesced) and returns 204.
+
+Unlike CustomAuthBackend the user isn't loaded from the database, a valid
+token is enough to be shown online until it expires.
+"""
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework_simplejwt.authentication import AUTH_HEADER_TYPE_BYTES
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .presence import presence
+
+
+heartbeat_path = "/v1/presence/heartbeat/"
+
+
+def beat(token) -> None:
+    try:
+        presence.set_online(TokenUser(token), token)
+    finally:
+        # Pushing a change may read friends from the database, Django
+        # only cleans connections up at the end of its own requests.
+        close_old_connections()
+
+
+class HeartbeatMiddleware:
+    """ASGI middleware answering presence heartbeats, other requests go to `app`."""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] != heartbeat_path:
+            return await self.app(scope, receive, send)
+
+        if scope["method"] != "POST":
+            return await self.respond(send, 405, [(b"allow", b"POST")])
+
+        token = self.get_token(scope)
+        if token is None:
+            return await self.respond(send, 401, [(b"www-authenticate", b"Bearer")])
+
+        await sync_to_async(beat, thread_sensitive=False)(token)
+        return await self.respond(send, 204)
+
+    @staticmethod
+    def get_token(scope):
+        headers = dict(scope["headers"])
+        parts = headers.get(b"authorization", b"").split()
+        if len(parts) != 2 or parts[0] not in AUTH_HEADER_TYPE_BYTES:
+            return None
+        try:
+            token = AccessToken(parts[1])
+        except TokenError:
+            return None
+        if api_settings.USER_ID_CLAIM not in token:
+            return None
+        return token
+
+    @staticmethod
+    async def respond(send, status: int, headers: list = None) -> None:
+        await send({
+            "type": "http.response.start", "status": status,
+            "headers": headers or []
+        })
+        await send({"type": "http.response.body", "body": b""})
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from rest_framework_simplejwt.tokens import AccessToken
+
+from common_app.throttling import SlidingWindowThrottle
+from common_app.utils.general_utils import app_settings
+
+from registration.heartbeat import heartbeat_path
+from registration.models import User
+from registration.presence import presence
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare requests per second of the presence heartbeat with "
+        "ui_online_status, both served in-process by the ASGI application. "
+        "Every request of both writes presence: the UIOpenIsOnline policy is "
+        "used, refreshes aren't coalesced and rate limits are lifted, though "
+        "still checked. Run it against the Redis used in production."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, required=True, help="Id of the user to send as.")
+        parser.add_argument("--requests", type=int, default=2000)
+        parser.add_argument("--concurrency", type=int, default=10)
+
+    def handle(self, *args, **options):
+        from afex_app.asgi import application
+
+        try:
+            user = User.objects.get(id=options["user"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['user']} does not exist.")
+
+        headers = [
+            (b"authorization", f"Bearer {AccessToken.for_user(user)}".encode()),
+            (b"content-type", b"application/json"),
+        ]
+        saved_settings = {
+            name: app_settings[name]
+            for name in ("ONLINE_STATUS_POLICY", "PRESENCE_REFRESH_INTERVAL")
+        }
+        throttle_rates = SlidingWindowThrottle.THROTTLE_RATES
+        saved_rates = dict(throttle_rates)
+        app_settings["ONLINE_STATUS_POLICY"] = "UIOpenIsOnline"
+        app_settings["PRESENCE_REFRESH_INTERVAL"] = timedelta(0)
+        presence.reset_policy()
+        throttle_rates.update({scope: "1000000/s" for scope in throttle_rates})
+        try:
+            results = {
+                name: asyncio.run(self.run(
+                    application, path, headers, body,
+                    options["requests"], options["concurrency"]
+                ))
+                for name, path, body in (
+                    ("ui_online_status", f"/v1/users/{user.id}/ui_online_status/", b'{"ui_open": true}'),
+                    ("heartbeat", heartbeat_path, b""),
+                )
+            }
+        finally:
+            app_settings.update(saved_settings)
+            presence.reset_policy()
+            throttle_rates.clear()
+            throttle_rates.update(saved_rates)
+
+        for name, rate in results.items():
+            self.stdout.write(f"{name}: {rate:.0f} req/s")
+        self.stdout.write(
+            f"heartbeat is {results['heartbeat'] / results['ui_online_status']:.1f}x faster"
+        )
+
+    async def run(self, application, path, headers, body, requests, concurrency) -> float:
+        """Send `requests` POSTs to `path`, `concurrency` at a time, return req/s."""
+
+        queue = asyncio.Queue()
+        for _ in range(requests):
+            queue.put_nowait(None)
+
+        async def worker():
+            while not queue.empty():
+                queue.get_nowait()
+                status = await self.post(application, path, headers, body)
+                if not 200 <= status < 300:
+                    raise CommandError(f"{path} answered {status}.")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return requests / (time.perf_counter() - start)
+
+    @staticmethod
+    async def post(application, path, headers, body) -> int:
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(),
+            "root_path": "", "query_string": b"", "headers": [
+                (b"host", b"testserver"), (b"content-length", str(len(body)).encode()),
+                *headers
+            ],
+            "client": ("127.0.0.1", 0), "server": ("testserver", 80),
+        }
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        response = {}
+
+        async def receive():
+            if messages:
+                return messages.pop()
+            # Django waits for a disconnect once the response is sent.
+            await asyncio.Event().wait()
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+
+        await application(scope, receive, send)
+        return response["status"]
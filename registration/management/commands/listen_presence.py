@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from redis.exceptions import ResponseError
+
+from common_app.utils.general_utils import RedisTimePersist
+
+from registration.presence import presence
+
+
+class Command(BaseCommand):
+    help = (
+        "Push users going offline to their friends as presence keys expire, "
+        "from Redis keyspace notifications. Run one per Redis database. The "
+        "Redis server must have them enabled, notify-keyspace-events "
+        "including Ex, or pass --configure. Without them nobody is pushed "
+        "offline."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--configure", action="store_true",
+            help="Enable expired key notifications on the Redis server first."
+        )
+
+    def handle(self, *args, **options):
+        redis = RedisTimePersist().instance
+        if options["configure"]:
+            try:
+                flags = redis.config_get("notify-keyspace-events")["notify-keyspace-events"]
+                redis.config_set("notify-keyspace-events", "".join(set(flags) | {"E", "x"}))
+            except ResponseError as e:
+                # managed Redis services often disable CONFIG
+                raise CommandError(
+                    f"Expired key notifications could not be enabled ({e}). Set "
+                    "notify-keyspace-events to include Ex in the Redis server's "
+                    "configuration and run without --configure."
+                )
+
+        db = redis.connection_pool.connection_kwargs.get("db", 0)
+        pubsub = redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(f"__keyevent@{db}__:expired")
+        self.stdout.write(f"Listening for expired presence keys of database {db}.")
+        for message in pubsub.listen():
+            presence.expired(message["data"].decode())
@@ -0,0 +1,17 @@
+# Generated by Django 4.0.6 on 2026-10-17 20:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('registration', '0003_remove_user_confirmed_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['first_name', 'id'], name='user_first_name_idx'),
+        ),
+    ]
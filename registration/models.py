@@ -7,7 +7,8 @@ from django.contrib.auth.models import AbstractUser
 from django.dispatch import receiver
 
 from .managers import UserManager
-from .authentication import get_online_policy_class
+from .presence import presence
+from .friends import FriendsCache
 
 # from chats.models import Chat
 
@@ -39,12 +40,17 @@ class User(AbstractUser):
     # manager
     objects = UserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # keyset pagination of users, see UserViewsets.
+            models.Index(fields=["first_name", "id"], name="user_first_name_idx"),
+        ]
+
     def is_online(self):
-        online_policy = get_online_policy_class()(self)
-        return bool(online_policy)
+        return presence.is_online(self.id)
 
     def is_friends_with(self, other_user):
-        return bool(self.friends.filter(pk=other_user.id))
+        return FriendsCache().is_friend(self.id, other_user.id)
     
     def __str__(self):
         return self.email
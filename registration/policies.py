@@ -3,6 +3,7 @@ This module captures all policies adopted by registration app.
 """
 from abc import ABC, abstractmethod
 from datetime import timedelta
+from typing import Dict, Iterable
 
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework_simplejwt.tokens import Token
@@ -10,13 +11,13 @@ from rest_framework_simplejwt.utils import datetime_from_epoch
 
 from django.utils import timezone
 
-from common_app.utils.general_utils import RedisTimePersist
+from common_app.utils.general_utils import CastAs, RedisTimePersist
 
 
 class BaseOnlinePolicyABC(ABC):
 
     @abstractmethod
-    def set_key(self):
+    def set_key(self, pipe=None):
         pass
 
 
@@ -36,45 +37,78 @@ class BaseOnlinePolicy(BaseOnlinePolicyABC):
         delta = exp_datetime - timezone.now()
         return delta.seconds
 
+    def write_key(self, mapping: dict, pipe=None) -> None:
+        """
+        Set fields of the user's key and its TTL in one round trip, or
+        queue them on `pipe` for the caller to execute.
+        """
+
+        execute = pipe is None
+        if execute:
+            pipe = self.redis.instance.pipeline(transaction=False)
+        pipe.hset(self.user.id, mapping=mapping)
+        pipe.expire(self.user.id, self.ttl)
+        if execute:
+            pipe.execute()
+
+    @classmethod
+    def is_online_many(cls, user_ids: Iterable[int], redis=None) -> Dict[int, bool]:
+        """Online status of many users, in one round trip to Redis."""
+
+        user_ids = list(user_ids)
+        pipe = (redis or RedisTimePersist().instance).pipeline(transaction=False)
+        for user_id in user_ids:
+            cls.queue_status(pipe, user_id)
+        replies = pipe.execute()
+        n = cls.status_commands
+        return {
+            user_id: cls.read_status(replies[i * n:(i + 1) * n])
+            for i, user_id in enumerate(user_ids)
+        }
+
 
 class LoggedInIsOnline(BaseOnlinePolicy):
     """User is online when logged in."""
 
-    def set_key(self):
-        self.redis.hset(
-            name=self.user.id, key="logged_in", value=1,
-            ttl=self.ttl
-        )
+    # Number of commands queue_status adds to a pipeline.
+    status_commands = 1
+
+    def set_key(self, pipe=None):
+        self.write_key({"logged_in": 1}, pipe)
 
     def _is_online(self) -> bool:
-        ttl = self.redis.time_to_live(self.user.id)
+        return self.is_online_many([self.user.id], self.redis.instance)[self.user.id]
+
+    @staticmethod
+    def queue_status(pipe, user_id: int) -> None:
+        pipe.ttl(user_id)
+
+    @staticmethod
+    def read_status(replies: list) -> bool:
+        ttl, = replies
         return ttl > 0
 
 
 class UIOpenIsOnline(BaseOnlinePolicy):
     """User is online when application UI is open/in focus."""
     
-    def set_key(self):
-        self.redis.hset(
-            name=self.user.id, key="logged_in", value=1,
-            other_kv={"ui_open": 1}, ttl=self.ttl
-        )
+    status_commands = 2
 
-    def _is_online(self) -> bool:
-        name = self.user.id
-        ttl = self.redis.time_to_live(name)
-        if ttl > 0 and self.redis.hget(name, "ui_open"):
-            return True
-        else:
-            return False
-
-    def set_online_status(self, *, online=True) -> None:
-        self.redis.hset(
-            name=self.user.id, key="logged_in", value=1,
-            other_kv={"ui_open": 1 if online else 0}, ttl=self.ttl
-        )
+    def set_key(self, pipe=None):
+        self.write_key({"logged_in": 1, "ui_open": 1}, pipe)
 
-        
+    def _is_online(self) -> bool:
+        return self.is_online_many([self.user.id], self.redis.instance)[self.user.id]
 
+    @staticmethod
+    def queue_status(pipe, user_id: int) -> None:
+        pipe.ttl(user_id)
+        pipe.hget(user_id, "ui_open")
 
+    @staticmethod
+    def read_status(replies: list) -> bool:
+        ttl, ui_open = replies
+        return ttl > 0 and bool(CastAs.bool(ui_open))
 
+    def set_online_status(self, pipe=None, *, online=True) -> None:
+        self.write_key({"logged_in": 1, "ui_open": 1 if online else 0}, pipe)
@@ -0,0 +1,166 @@
+"""
+Online status of users.
+
+The policy named by the ONLINE_STATUS_POLICY app setting is resolved once,
+at startup, and all lookups go through one Redis client.
+Prefer `presence.is_online_many` when showing the status of many users, it
+answers them all in one round trip.
+
+Every authenticated request marks its user online, but a process rewrites
+the key of a user and token at most once per PRESENCE_REFRESH_INTERVAL.
+Clients that are only idle can POST to the heartbeat, see
+registration.heartbeat, which skips Django entirely.
+
+Changes of status are pushed to the online friends of the user, as
+`presence.changed` events on their websocket connections. Going offline
+happens when a key expires, `manage.py listen_presence` reports those.
+"""
+
+import asyncio
+import importlib
+import logging
+import threading
+import time
+from functools import cached_property
+from typing import Callable, Dict, Iterable
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+from common_app.utils.general_utils import RedisTimePersist, app_settings
+
+from .friends import FriendsCache
+
+
+logger = logging.getLogger(__name__)
+
+
+policy_module_path = "registration.policies"
+
+# Refresh times kept before stale ones are dropped.
+max_tracked_refreshes = 10000
+
+
+def get_online_policy_class():
+    policy_module = importlib.import_module(policy_module_path)
+    return getattr(policy_module, app_settings["ONLINE_STATUS_POLICY"])
+
+
+class Presence:
+
+    def __init__(self) -> None:
+        # (user ID, token ID): time.monotonic() of the last refresh
+        self.refreshed_at = {}
+        # Requests of a process run on many threads, ASGI's sync threads
+        # included.
+        self.refreshed_at_lock = threading.Lock()
+
+    # Resolved on first use, RegistrationConfig.ready makes that startup,
+    # policies can't be imported before the app registry is ready.
+    @cached_property
+    def policy_class(self):
+        return get_online_policy_class()
+
+    def reset_policy(self) -> None:
+        """Resolve the policy again on next use, after ONLINE_STATUS_POLICY changed."""
+
+        self.__dict__.pop("policy_class", None)
+
+    @property
+    def redis(self):
+        return RedisTimePersist().instance
+
+    def is_online(self, user_id: int) -> bool:
+        return self.is_online_many([user_id])[user_id]
+
+    def is_online_many(self, user_ids: Iterable[int]) -> Dict[int, bool]:
+        return self.policy_class.is_online_many(user_ids, self.redis)
+
+    def set_online(self, user, validated_token) -> None:
+        """
+        Record that `user` authenticated with `validated_token`, unless
+        this process did less than PRESENCE_REFRESH_INTERVAL ago. The key
+        expires with the token, a new token is always written.
+        """
+
+        key = (user.id, validated_token.get("jti"))
+        interval = app_settings["PRESENCE_REFRESH_INTERVAL"].total_seconds()
+        now = time.monotonic()
+        with self.refreshed_at_lock:
+            refreshed_at = self.refreshed_at.get(key)
+            if refreshed_at is not None and now - refreshed_at < interval:
+                return
+            if len(self.refreshed_at) >= max_tracked_refreshes:
+                self.refreshed_at = {
+                    key: refreshed_at for key, refreshed_at in self.refreshed_at.items()
+                    if now - refreshed_at < interval
+                }
+            # claimed before writing, concurrent requests of the token skip
+            self.refreshed_at[key] = now
+
+        try:
+            self.update(user.id, self.policy_class(user, validated_token).set_key)
+        except Exception:
+            with self.refreshed_at_lock:
+                if self.refreshed_at.get(key) == now:
+                    del self.refreshed_at[key]
+            raise
+
+    def update(self, user_id: int, write: Callable[..., None]) -> None:
+        """
+        Run `write(pipe)`, which queues changes to the presence key of a
+        user, and push the change of their status if any. The status before
+        and after is read in the same round trip as the write.
+        """
+
+        policy_class = self.policy_class
+        pipe = self.redis.pipeline(transaction=False)
+        policy_class.queue_status(pipe, user_id)
+        write(pipe)
+        policy_class.queue_status(pipe, user_id)
+        replies = pipe.execute()
+        n = policy_class.status_commands
+        was_online = policy_class.read_status(replies[:n])
+        is_online = policy_class.read_status(replies[-n:])
+        if is_online != was_online:
+            self.publish(user_id, is_online)
+
+    def expired(self, key: str) -> None:
+        """Handle the expiry of a Redis key, presence keys are named by user ID."""
+
+        if key.isdigit() and not self.is_online(int(key)):
+            self.publish(int(key), False)
+
+    def publish(self, user_id: int, online: bool) -> None:
+        """
+        Push the status of a user to their online friends. Failing to push
+        shouldn't fail the request, friends still see it when listing.
+        """
+
+        # imported here, this module is loaded before the app registry.
+        from chats.utils import user_group_name
+
+        friend_ids = FriendsCache().get_friend_ids(user_id)
+        online_friend_ids = [
+            friend_id for friend_id, is_online in self.is_online_many(friend_ids).items()
+            if is_online
+        ]
+        if not online_friend_ids:
+            return
+
+        event = {"type": "presence.changed", "user_id": user_id, "online": online}
+        channel_layer = get_channel_layer()
+
+        async def send():
+            await asyncio.gather(*[
+                channel_layer.group_send(user_group_name(friend_id), event)
+                for friend_id in online_friend_ids
+            ])
+
+        try:
+            async_to_sync(send)()
+        except Exception:
+            logger.exception("Presence of user %s not pushed", user_id)
+
+
+presence = Presence()
@@ -4,6 +4,7 @@ from django.utils.translation import gettext_lazy as _
 from django.contrib.auth import get_user_model
 from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.signals import m2m_changed
 
 
 from drf_spectacular.utils import extend_schema_field, OpenApiTypes
@@ -21,6 +22,7 @@ from common_app.mixins.serializer_mixins import (
 from common_app.validators import TextMatches
 
 
+from .presence import presence
 from .messages.error_messages import (
     PASSWORD_MISSMATCH, DUPLICATE_EMAIL,
 )
@@ -31,6 +33,18 @@ read_only = {"read_only": True}
 user_qset = get_user_model().objects.all()
 
 
+class OnlineListSerializer(serializers.ListSerializer):
+    """
+    Looks up the online status of all users at once, list serializers of
+    OnlineSerializer subclasses should be this.
+    """
+
+    def to_representation(self, data):
+        users = list(data.all() if isinstance(data, models.Manager) else data)
+        self.child.online = presence.is_online_many(user.id for user in users)
+        return super().to_representation(users)
+
+
 class OnlineSerializer(serializers.Serializer):
     online = serializers.SerializerMethodField(
         help_text="Indicates if a user is online or not."
@@ -38,7 +52,10 @@ class OnlineSerializer(serializers.Serializer):
 
     @extend_schema_field(OpenApiTypes.BOOL)
     def get_online(self, instance):
-        return instance.is_online()
+        online = getattr(self, "online", {})
+        if instance.id in online:
+            return online[instance.id]
+        return presence.is_online(instance.id)
 
 
 class UserGenericSerializer(serializers.ModelSerializer):
@@ -63,6 +80,7 @@ class OnlineUserDisplaySerializer(DisplaySerializerMixin, OnlineSerializer, User
 
     class Meta(UserGenericSerializer.Meta):
         fields = ["id", "first_name", "last_name", "online"]
+        list_serializer_class = OnlineListSerializer
 
 
 class UserDisplaySerializer(DisplaySerializerMixin, UserGenericSerializer):
@@ -135,15 +153,42 @@ class AddFriendsSerializer(serializers.Serializer):
     )
 
     def create(self, validated_data: dict) -> models.QuerySet:
-        # remove_duplicates
+        """
+        Adds the new friends with one insert, covering both directions of
+        the symmetrical relation, and returns all friends of the user.
+        """
+
         user = self.get_user()
-        friend_ids = set(validated_data["friends"])
-        friends_qset = get_user_model().objects \
-            .filter(id__in=friend_ids) \
-            .exclude(id=user.id)
-        for friend in friends_qset:
-            user.friends.add(friend)
-        return user.friends.all()
+        User = get_user_model()
+        Friendship = User.friends.through
+
+        # users that exist and aren't friends yet, friendships always have
+        # both rows so one direction is enough.
+        new_friend_ids = set(
+            User.objects
+                .filter(id__in=set(validated_data["friends"]))
+                .exclude(id=user.id)
+                .exclude(friends=user)
+                .values_list("id", flat=True)
+        )
+        if new_friend_ids:
+            # bulk_create skips m2m_changed, send it like friends.add does.
+            signal_kwargs = {
+                "sender": Friendship, "instance": user, "reverse": False,
+                "model": User, "pk_set": new_friend_ids, "using": Friendship.objects.db
+            }
+            m2m_changed.send(action="pre_add", **signal_kwargs)
+            Friendship.objects.bulk_create(
+                [
+                    row for friend_id in new_friend_ids for row in (
+                        Friendship(from_user_id=user.id, to_user_id=friend_id),
+                        Friendship(from_user_id=friend_id, to_user_id=user.id)
+                    )
+                ],
+                ignore_conflicts=True
+            )
+            m2m_changed.send(action="post_add", **signal_kwargs)
+        return user.friends.order_by("first_name", "id")
 
     def get_user(self):
         return self.context["request"].user
@@ -0,0 +1,38 @@
+"""Keeps the friends cache in sync with User.friends."""
+
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from .friends import FriendsCache
+
+
+User = get_user_model()
+
+
+def invalidate_friends(user_ids: set) -> None:
+    # Now, and once committed, so a read in between can't cache the
+    # friends from before the change.
+    FriendsCache().invalidate(user_ids)
+    transaction.on_commit(partial(FriendsCache().invalidate, user_ids))
+
+
+@receiver(m2m_changed, sender=User.friends.through)
+def invalidate_friends_on_change(sender, instance, action, pk_set, **kwargs):
+    if action == "pre_clear":
+        # friendships are symmetrical, the friends being cleared change too
+        user_ids = set(instance.friends.values_list("id", flat=True))
+    elif action in ("post_add", "post_remove"):
+        user_ids = set(pk_set)
+    else:
+        return
+    invalidate_friends(user_ids | {instance.pk})
+
+
+@receiver(pre_delete, sender=User)
+def invalidate_friends_on_delete(sender, instance, **kwargs):
+    user_ids = set(instance.friends.values_list("id", flat=True))
+    invalidate_friends(user_ids | {instance.pk})
@@ -1,14 +1,28 @@
+import io
+import threading
 import time
+from datetime import timedelta
+from unittest import mock
 from decouple import config
 
 
+from asgiref.sync import async_to_sync
+from channels.testing import HttpCommunicator
+
 from django.test import TestCase, Client
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework import status
 
-from rest_framework_simplejwt.tokens import RefreshToken
+from redis import Redis
+from redis.exceptions import ResponseError
+
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
 
 from common_app.serializers import ValidationErrorSerializer, URLParamsValidationErrorSerializer
 from common_app.utils.test_utils import TestUtilsMixin
@@ -19,6 +33,10 @@ from exceptions_and_logging.serializers import ErrorSerializer
 from ..serializers import IntegrityErrorSerializer
 from ..serializers import SignInSerializer
 from ..policies import UIOpenIsOnline
+from ..friends import FriendsCache
+from ..presence import presence
+
+from afex_app.asgi import application
 
 
 # @override_settings(EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend')
@@ -28,8 +46,19 @@ class TestViews(TestUtilsMixin, TestCase):
         self.client = Client()
         self.headers = {}
         self.email, self.password = "chidi@gmail.com", "password"
+        self.clear_redis_keys("friends:*")
         return super().setUp()
 
+    def use_online_policy(self, name: str):
+        """Switch ONLINE_STATUS_POLICY for this test, presence caches the policy."""
+
+        self.addCleanup(presence.reset_policy)
+        self.addCleanup(
+            app_settings.__setitem__, "ONLINE_STATUS_POLICY", app_settings["ONLINE_STATUS_POLICY"]
+        )
+        app_settings["ONLINE_STATUS_POLICY"] = name
+        presence.reset_policy()
+
     def _create_user(self, **create_user_params):
         sign_up_params = {
             "first_name": "Chidi", "last_name": "Nnadi"
@@ -147,12 +176,77 @@ class TestViews(TestUtilsMixin, TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(len(resp.json()), len(user.friends.all()))
 
+        # test success, friendship checks are served from the cache, both ways
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(user.is_friends_with(friend_1))
+            self.assertTrue(friend_2.is_friends_with(user))
+            self.assertFalse(user.is_friends_with(friend_3))
+        self.assertEqual(len(ctx.captured_queries), 2)
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertTrue(friend_2.is_friends_with(user))
+            self.assertFalse(user.is_friends_with(friend_3))
+        self.assertEqual(len(ctx.captured_queries), 0)
+
+        # test success, changes to friends are seen at once
+        resp = self.client.post(url, {"friends": [friend_3.id]}, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(user.is_friends_with(friend_3))
+        self.assertTrue(friend_3.is_friends_with(user))
+        friend_1.friends.remove(user)
+        self.assertFalse(user.is_friends_with(friend_1))
+        user.friends.clear()
+        self.assertFalse(friend_2.is_friends_with(user))
+        friend_3.friends.add(user)
+        friend_3_id = friend_3.id
+        friend_3.delete()
+        self.assertFalse(FriendsCache().is_friend(user.id, friend_3_id))
+
+        # test success, friends read before a change aren't cached after it
+        cache = FriendsCache()
+        store = cache.store
+
+        def store_after_change(**kwargs):
+            user.friends.add(friend_2)
+            return store(**kwargs)
+
+        cache.store = store_after_change
+        self.assertEqual(cache.rebuild(user.id), set())
+        self.assertTrue(user.is_friends_with(friend_2))
+        user.friends.remove(friend_2)
+
         # test failure, bad requests (400)
         post_params["friends"] = [friend_1.email, friend_2.email]
         resp = self.client.post(url, post_params, **self.headers)
         self.assertEqual(resp.status_code, 400)
         self.assertTrue(ValidationErrorSerializer(data=resp.json()).is_valid())
 
+        # test success, many friends cost as many queries as one, paginated (200)
+        def add_friends(friend_ids):
+            with CaptureQueriesContext(connection) as ctx:
+                resp = self.client.post(url, {"friends": friend_ids}, **self.headers)
+            self.assertEqual(resp.status_code, 200)
+            return resp, len(ctx.captured_queries)
+
+        others = [
+            self.create_user(email=f"other@{i}.com", first_name=f"Other {i:02}").id
+            for i in range(25)
+        ]
+        _, one_friend_queries = add_friends(others[:1])
+        resp, many_friends_queries = add_friends([user.id, *others, 999])
+        self.assertEqual(one_friend_queries, many_friends_queries)
+        self.assertEqual(int(resp["count"]), 25)
+        self.assertEqual(len(resp.json()), 10)
+        self.assertEqual(resp.json()[0]["id"], others[0])
+        # following pages come from the friends listing
+        resp = self.client.get(resp["next"], **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json()[0]["id"], others[10])
+        self.assertIn(f"/v1/users/{user.id}/friends/", resp["previous"])
+        for friend_id in others:
+            friend = get_user_model().objects.get(id=friend_id)
+            self.assertTrue(friend.friends.filter(id=user.id).exists())
+            self.assertTrue(friend.is_friends_with(user))
+
     def test_show_friends(self):
         user = self.create_user(email="john@doe.com", is_active=True)
         # create friends
@@ -170,6 +264,18 @@ class TestViews(TestUtilsMixin, TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(len(resp.json()), 3)
 
+        # test success, paginated, online status looked up a page at a time (200)
+        for i in range(10):
+            user.friends.add(self.create_user(email=f"other@{i}.com"))
+        with mock.patch.object(get_user_model(), "is_online", side_effect=AssertionError):
+            resp = self.client.get(url, **self.headers)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(int(resp["count"]), 13)
+        self.assertEqual(len(resp.json()), 10)
+        self.assertTrue(all(isinstance(friend["online"], bool) for friend in resp.json()))
+        resp = self.client.get(resp["next"], **self.headers)
+        self.assertEqual(len(resp.json()), 3)
+
     def test_search(self):
         user = self.create_user(email="john@doe.com", is_active=True)
         # create friends
@@ -205,7 +311,7 @@ class TestViews(TestUtilsMixin, TestCase):
 
     def test_LoggedInIsOnline(self):
         # create user
-        app_settings["ONLINE_STATUS_POLICY"] = "LoggedInIsOnline"
+        self.use_online_policy("LoggedInIsOnline")
         user = self.create_user(email="john@doe.com")
         self.authenticate(user)
         # test success, user online (200)
@@ -223,6 +329,10 @@ class TestViews(TestUtilsMixin, TestCase):
         time.sleep(3)
         # assert user is not online
         self.assertFalse(friend_1.is_online())
+        self.assertEqual(
+            presence.is_online_many([user.id, friend_1.id]),
+            {user.id: True, friend_1.id: False}
+        )
         # add other friend 
         friend_2 = self.create_user(email="friend@two.com")
         self.authenticate(friend_2)
@@ -239,10 +349,84 @@ class TestViews(TestUtilsMixin, TestCase):
         self.assertTrue(resp.json()[1]["online"])
         self.assertEqual(resp.status_code, 200)
 
+    def test_presence_refresh(self):
+        user = self.create_user(email="john@doe.com")
+        url = f"/v1/users/{user.id}/"
+        interval = app_settings["PRESENCE_REFRESH_INTERVAL"]
+        self.addCleanup(app_settings.__setitem__, "PRESENCE_REFRESH_INTERVAL", interval)
+
+        with mock.patch.object(presence.policy_class, "set_key", autospec=True) as set_key:
+            # test success, repeated requests with a token mark the user online once (200)
+            self.authenticate(user)
+            for _ in range(3):
+                resp = self.client.get(url, **self.headers)
+                self.assertEqual(resp.status_code, 200)
+            self.assertEqual(set_key.call_count, 1)
+
+            # test success, a new token is written at once (200)
+            self.authenticate(user)
+            self.client.get(url, **self.headers)
+            self.assertEqual(set_key.call_count, 2)
+
+            # test success, written again once the interval has passed (200)
+            app_settings["PRESENCE_REFRESH_INTERVAL"] = timedelta(0)
+            self.client.get(url, **self.headers)
+            self.assertEqual(set_key.call_count, 3)
+
+        # test success, concurrent requests with a token write it once
+        app_settings["PRESENCE_REFRESH_INTERVAL"] = interval
+        token = AccessToken.for_user(user)
+        barrier = threading.Barrier(8)
+
+        def authenticate():
+            barrier.wait()
+            presence.set_online(user, token)
+
+        with mock.patch.object(presence, "update") as update:
+            threads = [threading.Thread(target=authenticate) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(update.call_count, 1)
+
+    def test_presence_heartbeat(self):
+        user = self.create_user(email="john@doe.com")
+        self.clear_redis_keys(str(user.id))
+        # heartbeats run in a worker thread, outside the test's transaction
+        FriendsCache().rebuild(user.id)
+        url = "/v1/presence/heartbeat/"
+
+        def request(method, path, authorization=None):
+            headers = [(b"authorization", authorization.encode())] if authorization else []
+            communicator = HttpCommunicator(application, method, path, headers=headers)
+            return async_to_sync(communicator.get_response)()
+
+        # test failure, no or invalid token (401)
+        self.assertEqual(request("POST", url)["status"], 401)
+        self.assertEqual(request("POST", url, "Bearer invalid")["status"], 401)
+        self.assertFalse(user.is_online())
+
+        # test failure, only POST is allowed (405)
+        self.authenticate(user)
+        authorization = self.headers["HTTP_AUTHORIZATION"]
+        self.assertEqual(request("GET", url, authorization)["status"], 405)
+
+        # test success, user is shown online (204)
+        resp = request("POST", url, authorization)
+        self.assertEqual(resp["status"], 204)
+        self.assertEqual(resp["body"], b"")
+        self.assertTrue(user.is_online())
+
+        # test failure, other paths still reach Django (404)
+        resp = request("POST", "/v1/presence/", authorization)
+        self.assertEqual(resp["status"], 404)
+
     def test_UIOpenIsOnline(self):
         # create user
-        app_settings["ONLINE_STATUS_POLICY"] = "UIOpenIsOnline"
+        self.use_online_policy("UIOpenIsOnline")
         user = self.create_user(email="john@doe.com")
+        self.clear_redis_keys(str(user.id))
         self.authenticate(user)
         # asssrt user is online
         resp = self.client.get(f"/v1/users/{user.id}/", **self.headers)
@@ -256,6 +440,27 @@ class TestViews(TestUtilsMixin, TestCase):
         self.assertEqual(resp.status_code, 204)
         # asssrt user is offline
         self.assertFalse(bool(UIOpenIsOnline(user)))
+        self.assertFalse(user.is_online())
+
+        # test success, user is online again once UI is open (204)
+        resp = self.client.post(url, {"ui_open": True}, **self.headers)
+        self.assertEqual(resp.status_code, 204)
+        self.assertTrue(user.is_online())
+
+        # test failure, other policies don't track the UI (405)
+        self.use_online_policy("LoggedInIsOnline")
+        resp = self.client.post(url, data, **self.headers)
+        self.assertEqual(resp.status_code, 405)
+
+    def test_listen_presence(self):
+        # test failure, the Redis server refuses CONFIG SET
+        with mock.patch.object(
+                Redis, "config_set",
+                side_effect=ResponseError("unknown command 'CONFIG'")
+        ), mock.patch.object(Redis, "pubsub") as pubsub:
+            with self.assertRaisesMessage(CommandError, "notify-keyspace-events"):
+                call_command("listen_presence", "--configure", stdout=io.StringIO())
+        pubsub.assert_not_called()
 
 
 
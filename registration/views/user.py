@@ -2,8 +2,11 @@
 All user views
 """
 
+from functools import partial
+
 # Django
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 
 # drf
 from rest_framework.viewsets import GenericViewSet
@@ -24,9 +27,10 @@ from drf_spectacular.utils import (
 )
 
 # project based django apps
-from common_app.pagination import GeneralPagingation, paginator_header_params
+from common_app.pagination import (
+    GeneralPagingation, GeneralCursorPagination, paginator_header_params, cursor_paginator_header_params
+)
 from common_app.serializers import URLParamsValidationErrorSerializer, ValidationErrorSerializer
-from common_app.utils.general_utils import app_settings
 
 from exceptions_and_logging.serializers import ErrorSerializer
 
@@ -37,6 +41,7 @@ from ..serializers import (
 )
 
 from ..policies import UIOpenIsOnline
+from ..presence import presence
 
 
 class UserViewsets(
@@ -47,7 +52,10 @@ class UserViewsets(
     permission_classes = [IsAuthenticated]
     serializer_class = UserDisplaySerializer
     queryset = get_user_model().objects.all()
-    pagination_class = GeneralPagingation
+    pagination_class = GeneralCursorPagination
+    cursor_ordering = ("first_name", "id")
+    # see common_app.throttling.
+    throttle_rates = {"search": "60/min"}
 
     @extend_schema(
         responses={
@@ -61,7 +69,7 @@ class UserViewsets(
         return super().retrieve(request, *args, **kwargs)
 
     @extend_schema(
-        parameters=[*paginator_header_params],
+        parameters=[*cursor_paginator_header_params],
         responses={
             200: OpenApiResponse(BriefUserDisplaySerializer(many=True), "Success"),
             404: OpenApiResponse(ErrorSerializer, "User not found")
@@ -102,15 +110,19 @@ class UserViewsets(
             404: OpenApiResponse(ErrorSerializer, "User not found")
         }
     )
-    @action(["post"], detail=True, serializer_class=AddFriendsSerializer)
+    @action(
+        ["post"], detail=True, serializer_class=AddFriendsSerializer,
+        pagination_class=GeneralPagingation
+    )
     def add_friends(self, request, *args, **kwargs):
         """Add other users as freinds"""
 
         ser = self.get_serializer(data=request.data)
         if ser.is_valid():
             friends_qset = ser.save()
-            data = BriefUserDisplaySerializer(friends_qset, many=True).data
-            return Response(data)
+            page = self.paginate_queryset(friends_qset)
+            data = BriefUserDisplaySerializer(page, many=True).data
+            return self.get_paginated_response(data)
         else:
             return ValidationErrorSerializer(data=ser.errors).json_response()
 
@@ -124,14 +136,18 @@ class UserViewsets(
             404: OpenApiResponse(ErrorSerializer, "User not found")
         }
     )
-    @action(["get"], detail=True, serializer_class=OnlineUserDisplaySerializer)
+    @action(
+        ["get"], detail=True, serializer_class=OnlineUserDisplaySerializer,
+        pagination_class=GeneralPagingation
+    )
     def friends(self, request, *args, **kwargs):
         """View list of user's friends"""
 
         user = request.user
-        friends_qset = user.friends.all()
-        data = self.get_serializer(friends_qset, many=True).data
-        return Response(data)
+        friends_qset = user.friends.order_by("first_name", "id")
+        page = self.paginate_queryset(friends_qset)
+        data = self.get_serializer(page, many=True).data
+        return self.get_paginated_response(data)
 
     @extend_schema(
         parameters=[
@@ -181,20 +197,31 @@ class UserViewsets(
         Sets online status if UI is in focus or not. Frontend is
         expected to call this method when app UI is in focus or open.
         Method only allowed if ONLINE_STATUS_POLICY is UIOpenIsOnline. 
+        To only report that the UI is still open, POST to the much cheaper
+        /v1/presence/heartbeat/ instead, see registration.heartbeat.
         """
 
-        if app_settings["ONLINE_STATUS_POLICY"] != "UIOpenIsOnline":
+        if not issubclass(presence.policy_class, UIOpenIsOnline):
             return Response(status=status.HTTP_405_METHOD_NOT_ALLOWED)
 
         ser = self.get_serializer(data=request.data)
         if ser.is_valid():
             ui_open: bool = ser.validated_data["ui_open"]
             user, token = request.user, request.auth
-            UIOpenIsOnline(user, token).set_online_status(online=ui_open)
+            presence.update(
+                user.id, partial(UIOpenIsOnline(user, token).set_online_status, online=ui_open)
+            )
             return Response(status=status.HTTP_204_NO_CONTENT)
         else:
             return ValidationErrorSerializer(data=ser.errors).json_response()
 
+    def get_pagination_url(self, request) -> str:
+        if self.action == "add_friends":
+            # add_friends answers with a page of the friends listing
+            url = reverse("users-friends", kwargs={"pk": self.kwargs["pk"]})
+            return request.build_absolute_uri(url)
+        return request.build_absolute_uri()
+
     def get_serializer(self, *args, **kwargs):
         if (self.action == "list"):
             return BriefUserDisplaySerializer(*args, **kwargs)